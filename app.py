@@ -1,29 +1,43 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
+import startup_profiler  # first, so the boot timeline starts here
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, Response
 import os
-# import database # In-Memory DB (for local testing)
-import database_dynamo as database # AWS DynamoDB Adapter (PROD)
+if os.environ.get('MEDTRACK_DB', '').lower() == 'memory':
+    import database # In-Memory DB (local testing, benchmarks/load_test.py)
+else:
+    import database_dynamo as database # AWS DynamoDB Adapter (PROD)
 from functools import wraps
 import ml_engine
 from sns_service import sns_client # Import AWS SNS Service
+import chat_broker
+import request_accounting
+import metrics
+import sampling_profiler
+import tracing
+import pagination
+import collection_versions
+import exporters
 
 import boto3
+startup_profiler.mark('imports')
 
 # AWS Configuration (UPDATED for consistency)
 REGION = 'us-east-1' # N. Virginia
 
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-sns = boto3.client('sns', region_name=REGION)
+with startup_profiler.phase('aws_clients'):
+    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    sns = boto3.client('sns', region_name=REGION)
 
-# DynamoDB Tables (FIXED: Consistent naming)
-patient_users_table = dynamodb.Table("PatientUser")
-admin_users_table = dynamodb.Table('AdminUser')  # FIXED: Was 'AdminUsers'
-doctor_table = dynamodb.Table('DoctorUser')
-medtrack_data_table = dynamodb.Table('Medtrack_data')
+    # DynamoDB Tables (FIXED: Consistent naming)
+    patient_users_table = dynamodb.Table("PatientUser")
+    admin_users_table = dynamodb.Table('AdminUser')  # FIXED: Was 'AdminUsers'
+    doctor_table = dynamodb.Table('DoctorUser')
+    medtrack_data_table = dynamodb.Table('Medtrack_data')
 
 # SNS Topic ARN (UPDATED to match region)
 SNS_TOPIC_ARN = 'arn:aws:sns:us-east-1:050690756868:Medtrack_cloud_enabled_healthcare_management'
 
-app = Flask(__name__)
+with startup_profiler.phase('flask_setup'):
+    app = Flask(__name__)
 app.secret_key = 'supersecuritykey_medtrack_dev' # Use env var in production
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'medtrack', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 16MB limit
@@ -31,6 +45,25 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 16MB limit
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Backend calls per request: counts, latency, N+1 warnings (see request_accounting.py)
+request_accounting.install(dynamodb, sns, getattr(database, 'dynamodb', None), sns_client.client)
+request_accounting.init_app(app)
+
+# Prometheus /metrics (see metrics.py)
+metrics.init_app(app)
+
+# Admin-controlled sampling profiler (see sampling_profiler.py)
+sampling_profiler.init_app(app, lambda: session.get('user_role') == 'admin')
+
+# Slow-request log with per-span timings (see tracing.py)
+tracing.init_app(app)
+metrics.gauge('medtrack_notification_queue_depth', 'Notifications waiting in the outbox',
+              lambda: {(('channel', sns_client.outbox.channel),): sns_client.outbox.pending_count()}, mode='max')
+
+# scikit-learn/TensorFlow load on the first diagnostic request unless MEDTRACK_ML_PRELOAD says otherwise
+with startup_profiler.phase('model_warmup'):
+    ml_engine.preload_from_config()
+
 # --- Authentication Decorators ---
 def login_required(f):
     @wraps(f)
@@ -120,23 +153,13 @@ def admin_login():
 @role_required('admin')
 def admin_dashboard():
     patients = database.get_all_patients()
-    doctors = database.get_all_doctors()
     blood_stock = database.get_blood_stock()
     capacity = database.get_hospital_capacity()
     dept_load = database.get_department_load()
     pending_donations = database.get_pending_donations()
     
-    # Advanced Stats for Dashboard UI
-    stats = {
-        'doctors': len(doctors),
-        'patients': len(patients),
-        'appointments': len(database.appointments),
-        'records': sum(len(v) for v in database.records.values()),
-        'invoices': len(database.invoices),
-        'departments': len(set(d['department'] for d in doctors)) if doctors else 0,
-        'income': sum(inv['amount'] for inv in database.invoices.values() if inv['status'] == 'Paid'),
-        'pending_income': sum(inv['amount'] for inv in database.invoices.values() if inv['status'] == 'Unpaid')
-    }
+    # Advanced Stats for Dashboard UI (incrementally maintained counters, O(1) read)
+    stats = database.get_admin_stats()
 
     return render_template('admin/dashboard.html', 
                          patients=patients, 
@@ -159,16 +182,19 @@ def admin_doctors():
 @login_required
 @role_required('admin')
 def admin_patients():
-    patients = database.get_all_patients()
-    return render_template('admin/patients_list.html', patients=patients)
+    limit, start_key = pagination.request_page()
+    patients, next_key = database.get_patients_page(limit, start_key)
+    return render_template('admin/patients_list.html', patients=patients,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/admin/manage/appointments')
 @login_required
 @role_required('admin')
 def admin_appointments():
-    # Convert dict to list
-    all_appts = list(database.appointments.values())
-    return render_template('admin/appointments_list.html', appointments=all_appts)
+    limit, start_key = pagination.request_page()
+    appts, next_key = database.get_appointments_page(limit, start_key)
+    return render_template('admin/appointments_list.html', appointments=appts,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/admin/manage/records')
 @login_required
@@ -186,9 +212,26 @@ def admin_records():
 @login_required
 @role_required('admin')
 def admin_invoices():
-    # Convert dict to list
-    all_inv = list(database.invoices.values())
-    return render_template('admin/invoices_list.html', invoices=all_inv)
+    limit, start_key = pagination.request_page()
+    invoices, next_key = database.get_invoices_page(limit, start_key)
+    return render_template('admin/invoices_list.html', invoices=invoices,
+                           **pagination.template_args(next_key, limit))
+
+# Bulk exports for audits and billing reconciliation (see exporters.py)
+EXPORTS = {
+    'appointments': (database.get_appointments_page,
+                     ['id', 'patient_id', 'doctor_id', 'doctor_name', 'time', 'location', 'status',
+                      'invoice_id', 'reason']),
+    'invoices': (database.get_invoices_page,
+                 ['id', 'appt_id', 'patient_id', 'amount', 'status', 'date', 'details']),
+    'vault': (database.get_records_page, ['id', 'patient_id', 'filename', 'category', 'date'])
+}
+
+@app.route('/admin/export/<dataset>')
+@login_required
+@role_required('admin')
+def admin_export(dataset):
+    return exporters.response(EXPORTS, dataset)
 
 @app.route('/admin/capacity/update', methods=['POST'])
 @login_required
@@ -293,21 +336,11 @@ def blood_bank_view():
 @login_required
 @role_required('admin')
 def update_blood_stock(group, action):
-    stock = database.get_blood_stock()
-    if group in stock:
-        if action == 'add':
-            stock[group]['units'] += 1
-        elif action == 'remove' and stock[group]['units'] > 0:
-            stock[group]['units'] -= 1
-        
-        # Update status
-        units = stock[group]['units']
-        if units < 5:
-            stock[group]['status'] = 'Critical'
-        elif units < 10:
-            stock[group]['status'] = 'Low'
-        else:
-            stock[group]['status'] = 'Available'
+    # Atomic read-modify-write (also refreshes the Critical/Low/Available status)
+    if action == 'add':
+        database.adjust_blood_stock(group, 1)
+    elif action == 'remove':
+        database.adjust_blood_stock(group, -1)
             
     return redirect(url_for('blood_bank_view'))
 
@@ -401,8 +434,10 @@ def patient_vault():
             flash(f'File uploaded successfully.', 'success')
             return redirect(url_for('patient_vault'))
             
-    records = database.get_patient_records(session['user_id'])
-    return render_template('patient/vault.html', records=records)
+    limit, start_key = pagination.request_page()
+    records, next_key = database.get_patient_records_page(session['user_id'], limit, start_key)
+    return render_template('patient/vault.html', records=records,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/uploads/<filename>')
 @login_required
@@ -493,6 +528,7 @@ def log_mood():
 
 @app.route('/api/mood/history')
 @login_required
+@collection_versions.conditional_get(database.versions, lambda: [('mood', session['user_id'])])
 def get_mood_history():
     history = database.get_mood_history(session['user_id'])
     # Return last 7 entries for chart
@@ -552,8 +588,10 @@ def doctor_dashboard():
 @login_required
 @role_required('doctor')
 def doctor_appointments_list():
-    appointments = database.get_appointments_by_doctor(session['user_id'])
-    return render_template('doctor/appointments_list.html', appointments=appointments)
+    limit, start_key = pagination.request_page()
+    appointments, next_key = database.get_appointments_by_doctor_page(session['user_id'], limit, start_key)
+    return render_template('doctor/appointments_list.html', appointments=appointments,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/doctor/my_patients')
 @login_required
@@ -582,28 +620,10 @@ def doctor_patients_list():
 @role_required('doctor')
 def advance_status(appt_id):
     # Logic to cycle status: BOOKED -> CHECKED-IN -> CONSULTING -> COMPLETED
-    # Ideally find current status and move to next
-    # For now, let's just implement a simple rigid flow or pass next status/action
-    # But to keep it simple, let's iterate or pass a query param?
-    # Let's check current status
-    # This part requires reading the appointment.
-    # Since database functions don't supporting getting single appointment easily without looping or ID lookup (I implemented ID lookup but returned dict?)
-    # Wait, create_appointment returns dict. I didn't verify if I have get_appointment.
-    # Ah, I missed get_appointment_by_id in database.py. I'll rely on appointments global in database being accessible or add a quick helper here or use the globals directly if imported, but cleaner to update database.py.
-    # Actually, appointments is a dict in database.py, and I didn't expose a 'get_by_id'.
-    # I will modify database.py to add `get_appointment(id)` or just access `database.appointments[id]` if I know it exists.
-    
-    if appt_id in database.appointments:
-        current_status = database.appointments[appt_id]['status']
-        next_status = current_status
-        if current_status == 'BOOKED':
-            next_status = 'CHECKED-IN'
-        elif current_status == 'CHECKED-IN':
-            next_status = 'CONSULTING'
-        elif current_status == 'CONSULTING':
-            next_status = 'COMPLETED'
-        
-        database.update_appointment_status(appt_id, next_status)
+    # Read + write happen atomically inside the database layer so two clicks on
+    # separate waitress threads cannot both advance from the same status.
+    next_status = database.advance_appointment_status(appt_id)
+    if next_status:
         flash(f'Appointment status updated to {next_status}', 'success')
     
     return redirect(url_for('doctor_dashboard'))
@@ -651,10 +671,33 @@ def send_chat_message():
 
 @app.route('/api/chat/get')
 @login_required
+@collection_versions.conditional_get(database.versions, lambda: [('chats', request.args.get('dept') or None)])
 def get_chat_messages():
+    # ?since=<cursor> returns only messages created/replied to after the cursor;
+    # without it the full department history is returned. Both include the new cursor.
     dept = request.args.get('dept')
-    messages = database.get_chat_messages(dept)
-    return {'status': 'success', 'messages': messages}
+    since = request.args.get('since', 0, type=int)
+    messages, cursor = database.get_chat_updates(dept, since)
+    return {'status': 'success', 'messages': messages, 'cursor': cursor}
+
+@app.route('/api/chat/stream')
+@login_required
+def stream_chat_messages():
+    # Server-Sent Events: pushes new messages and replies as they happen.
+    # On reconnect the browser sends Last-Event-ID, so missed changes are replayed.
+    dept = request.args.get('dept')
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+    since = int(since) if since.isdigit() else 0
+
+    def replay():
+        if not since:
+            return [], since
+        return database.get_chat_updates(dept, since)
+    stream = chat_broker.open_stream(dept, replay)
+    if stream is None:
+        # Every stream slot is taken: a non-200 answer makes the page poll /api/chat/get
+        return {'status': 'error', 'message': 'Too many open streams'}, 503
+    return Response(stream, mimetype='text/event-stream', headers=chat_broker.SSE_HEADERS)
 
 # --- Doctor Chat Routes ---
 
@@ -682,6 +725,14 @@ def doctor_reply():
         return {'status': 'success'}
     return {'status': 'error', 'message': 'Chat ID not found'}, 404
 
+# Compile every template at boot instead of on its first request (MEDTRACK_WARM_TEMPLATES=1)
+with startup_profiler.phase('templates'):
+    if os.environ.get('MEDTRACK_WARM_TEMPLATES', '').lower() in ('1', 'true', 'yes'):
+        for template_name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(template_name)
+
+startup_profiler.finish('app')
+
 if __name__ == '__main__':
     # Use database.get_ist_time() to print start time in IST
     try:
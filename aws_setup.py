@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
+import startup_profiler  # first, so the boot timeline starts here
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
@@ -10,6 +11,20 @@ import json
 from dotenv import load_dotenv
 from decimal import Decimal
 import logging
+import threading
+import chat_broker
+import collection_versions
+from notification_outbox import NotificationOutbox
+import local_sns
+import request_accounting
+import metrics
+import sampling_profiler
+import tracing
+import pagination
+import parallel_scan
+import exporters
+from functools import wraps
+startup_profiler.mark('imports')
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +48,11 @@ INVOICES_TABLE = 'medtrack_invoices'
 CHAT_MESSAGES_TABLE = 'medtrack_chat_messages'
 MOOD_LOGS_TABLE = 'medtrack_mood_logs'
 APPOINTMENT_REQUESTS_TABLE = 'medtrack_appointment_requests'
+METRICS_TABLE = 'medtrack_metrics'
+SNS_SUBSCRIPTIONS_TABLE = 'medtrack_sns_subscriptions'
+CHAT_DEPT_INDEX = 'dept-updated_at-index'  # Per-department, time-sorted chat changes
+DOCTOR_APPOINTMENTS_INDEX = 'doctor_email-created_at-index'  # A doctor's appointments by booking time
+PATIENT_VAULT_INDEX = 'patient_email-uploaded_at-index'  # A patient's vault by upload time
 SNS_TOPIC_ARN = os.getenv('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:908027408356:Medtrack_cloud_enabled_healthcare_management')
 
 
@@ -40,7 +60,11 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize AWS clients
+# MEDTRACK_STORAGE=local forces the LocalStorage fallback even when boto3 is configured
 try:
+    if os.getenv('MEDTRACK_STORAGE', '').lower() == 'local':
+        raise RuntimeError("MEDTRACK_STORAGE=local")
+    
     # Smart SNS Client Initialization
     # If ARN has a region (arn:aws:sns:REGION:...), use it.
     sns_region = AWS_REGION
@@ -50,44 +74,90 @@ try:
         except:
             pass
 
-    dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-    sns_client = boto3.client('sns', region_name=sns_region)
+    with startup_profiler.phase('aws_clients'):
+        dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
+        sns_client = boto3.client('sns', region_name=sns_region)
     
     # Table configurations
     TABLES_CONFIG = [
         {'name': PATIENTS_TABLE, 'key': 'email'},
         {'name': DOCTORS_TABLE, 'key': 'email'},
-        {'name': APPOINTMENTS_TABLE, 'key': 'appointment_id'},
-        {'name': MEDICAL_VAULT_TABLE, 'key': 'vault_id'},
+        {'name': APPOINTMENTS_TABLE, 'key': 'appointment_id',
+         'indexes': [{'name': DOCTOR_APPOINTMENTS_INDEX, 'hash': 'doctor_email', 'range': 'created_at'}]},
+        {'name': MEDICAL_VAULT_TABLE, 'key': 'vault_id',
+         'indexes': [{'name': PATIENT_VAULT_INDEX, 'hash': 'patient_email', 'range': 'uploaded_at'}]},
         {'name': BLOOD_BANK_TABLE, 'key': 'blood_group'},
         {'name': INVOICES_TABLE, 'key': 'invoice_id'},
-        {'name': CHAT_MESSAGES_TABLE, 'key': 'message_id'},
+        {'name': CHAT_MESSAGES_TABLE, 'key': 'message_id',
+         'indexes': [{'name': CHAT_DEPT_INDEX, 'hash': 'dept', 'range': 'updated_at'}]},
         {'name': MOOD_LOGS_TABLE, 'key': 'mood_id'},
-        {'name': APPOINTMENT_REQUESTS_TABLE, 'key': 'request_id'}
+        {'name': APPOINTMENT_REQUESTS_TABLE, 'key': 'request_id'},
+        {'name': METRICS_TABLE, 'key': 'metric_id'},
+        {'name': SNS_SUBSCRIPTIONS_TABLE, 'key': 'email'}
     ]
 
+    def _index_definitions(table_config):
+        """GSI specs and the attribute definitions they need"""
+        attributes = {}
+        indexes = []
+        for index in table_config.get('indexes', []):
+            key_schema = [{'AttributeName': index['hash'], 'KeyType': 'HASH'}]
+            attributes[index['hash']] = 'S'
+            if index.get('range'):
+                key_schema.append({'AttributeName': index['range'], 'KeyType': 'RANGE'})
+                attributes[index['range']] = 'S'
+            indexes.append({
+                'IndexName': index['name'],
+                'KeySchema': key_schema,
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            })
+        return attributes, indexes
+
     def create_tables():
-        """Create DynamoDB tables if they don't exist"""
+        """Create DynamoDB tables (and their GSIs) if they don't exist"""
         existing_tables = [t.name for t in dynamodb.tables.all()]
         
         for table_config in TABLES_CONFIG:
             table_name = table_config['name']
             key_name = table_config['key']
+            index_attributes, indexes = _index_definitions(table_config)
+            attributes = dict(index_attributes, **{key_name: 'S'})
+            attribute_definitions = [{'AttributeName': name, 'AttributeType': kind}
+                                     for name, kind in attributes.items()]
             
             if table_name not in existing_tables:
                 logger.info(f"Creating table: {table_name}")
                 try:
-                    dynamodb.create_table(
+                    params = dict(
                         TableName=table_name,
                         KeySchema=[{'AttributeName': key_name, 'KeyType': 'HASH'}],
-                        AttributeDefinitions=[{'AttributeName': key_name, 'AttributeType': 'S'}],
+                        AttributeDefinitions=attribute_definitions,
                         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
                     )
+                    if indexes:
+                        params['GlobalSecondaryIndexes'] = indexes
+                    dynamodb.create_table(**params)
                     logger.info(f"Table {table_name} creation initiated.")
                 except ClientError as e:
                     logger.error(f"Failed to create table {table_name}: {e}")
             else:
                 logger.info(f"Table {table_name} already exists.")
+                # Add any GSI introduced after the table was first created
+                existing_indexes = {gsi['IndexName'] for gsi in
+                                    (dynamodb.Table(table_name).global_secondary_indexes or [])}
+                for index in indexes:
+                    if index['IndexName'] in existing_indexes:
+                        continue
+                    logger.info(f"Creating index {index['IndexName']} on {table_name}")
+                    try:
+                        dynamodb.meta.client.update_table(
+                            TableName=table_name,
+                            AttributeDefinitions=attribute_definitions,
+                            GlobalSecondaryIndexUpdates=[{'Create': index}]
+                        )
+                    except ClientError as e:
+                        logger.error(f"Failed to create index {index['IndexName']}: {e}")
 
     # Initialize all DynamoDB tables (lazy reference)
     patients_table = dynamodb.Table(PATIENTS_TABLE)
@@ -99,6 +169,8 @@ try:
     chat_messages_table = dynamodb.Table(CHAT_MESSAGES_TABLE)
     mood_logs_table = dynamodb.Table(MOOD_LOGS_TABLE)
     appointment_requests_table = dynamodb.Table(APPOINTMENT_REQUESTS_TABLE)
+    metrics_table = dynamodb.Table(METRICS_TABLE)
+    sns_subscriptions_table = dynamodb.Table(SNS_SUBSCRIPTIONS_TABLE)
     
     logger.info("AWS services initialized successfully")
     AWS_AVAILABLE = True
@@ -120,10 +192,43 @@ except Exception as e:
     chat_messages_table = LocalStorage(CHAT_MESSAGES_TABLE)
     mood_logs_table = LocalStorage(MOOD_LOGS_TABLE)
     appointment_requests_table = LocalStorage(APPOINTMENT_REQUESTS_TABLE)
+    metrics_table = LocalStorage(METRICS_TABLE)
+    sns_subscriptions_table = LocalStorage(SNS_SUBSCRIPTIONS_TABLE)
     
     AWS_AVAILABLE = False
     logger.info("Local storage initialized - data will persist in local_data/ folder")
 
+# MEDTRACK_SNS=local routes notifications to the in-process stand-in (see local_sns.py)
+if local_sns.is_enabled():
+    sns_client = local_sns.get_client()
+    logger.info("Using the local SNS stand-in")
+SNS_AVAILABLE = AWS_AVAILABLE or local_sns.is_enabled()
+
+# Change versions behind the ETags of polled endpoints. On DynamoDB they live in the
+# metrics table, so a write on any host is seen by all; LocalStorage is single-host.
+VERSIONS_KEY = {'metric_id': 'versions'}
+if AWS_AVAILABLE:
+    versions = collection_versions.TableVersions(metrics_table, VERSIONS_KEY)
+else:
+    versions = collection_versions.SharedVersions()
+
+# Backend calls per request: counts, latency, N+1 warnings (see request_accounting.py)
+if AWS_AVAILABLE:
+    request_accounting.install(dynamodb, sns_client)
+else:
+    request_accounting.install()
+    request_accounting.instrument_local_storage(LocalStorage)
+request_accounting.init_app(app)
+
+# Prometheus /metrics (see metrics.py)
+metrics.init_app(app)
+
+# Admin-controlled sampling profiler (see sampling_profiler.py)
+sampling_profiler.init_app(app, lambda: session.get('role') == 'admin')
+
+# Slow-request log with per-span timings (see tracing.py)
+tracing.init_app(app)
+
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
@@ -142,22 +247,87 @@ def serialize_datetime(obj):
         return float(obj)
     return obj
 
-def deserialize_item(item):
-    """Deserialize DynamoDB item to Python dict"""
-    if not item:
-        return None
-    result = {}
-    for key, value in item.items():
-        if isinstance(value, str) and 'T' in value:
-            try:
-                result[key] = datetime.fromisoformat(value)
-            except ValueError:
-                result[key] = value
-        elif isinstance(value, Decimal):
-            result[key] = float(value)
-        else:
-            result[key] = value
-    return result
+# Attributes each table stores as ISO timestamps (parsed into datetime on read)
+# and numbers that need a specific type. Every other number comes back from
+# DynamoDB as Decimal and becomes a float; every other string is left alone,
+# including user-entered dates such as appointment_date that the views slice.
+TABLE_SCHEMAS = {
+    PATIENTS_TABLE: {'timestamps': ['created_at']},
+    DOCTORS_TABLE: {'timestamps': ['created_at']},
+    APPOINTMENTS_TABLE: {'timestamps': ['created_at', 'updated_at']},
+    MEDICAL_VAULT_TABLE: {'timestamps': ['uploaded_at']},
+    BLOOD_BANK_TABLE: {'timestamps': ['updated_at'], 'numbers': {'units': int}},
+    INVOICES_TABLE: {'timestamps': ['created_at', 'updated_at'], 'numbers': {'amount': float}},
+    CHAT_MESSAGES_TABLE: {'timestamps': ['created_at', 'updated_at']},
+    MOOD_LOGS_TABLE: {'timestamps': ['logged_at']},
+    APPOINTMENT_REQUESTS_TABLE: {'timestamps': ['created_at', 'updated_at']},
+    SNS_SUBSCRIPTIONS_TABLE: {'timestamps': ['subscribed_at']}
+}
+
+def _compile_deserializer(schema):
+    """Builds the item converter for one table schema"""
+    timestamps = tuple(schema.get('timestamps', ()))
+    numbers = tuple(schema.get('numbers', {}).items())
+    parse = datetime.fromisoformat
+    
+    def deserialize(item):
+        if not item:
+            return None
+        result = {key: float(value) if value.__class__ is Decimal else value for key, value in item.items()}
+        for key, convert in numbers:
+            if key in item and item[key].__class__ is Decimal:
+                result[key] = convert(item[key])
+        for key in timestamps:
+            value = result.get(key)
+            if value.__class__ is str and value:
+                try:
+                    result[key] = parse(value)
+                except ValueError:
+                    pass
+        return result
+    return deserialize
+
+_DESERIALIZERS = {table: _compile_deserializer(schema) for table, schema in TABLE_SCHEMAS.items()}
+# Without a table: every attribute any table declares as a timestamp
+_GENERIC_DESERIALIZER = _compile_deserializer({'timestamps': sorted(
+    {field for schema in TABLE_SCHEMAS.values() for field in schema.get('timestamps', [])})})
+
+def deserialize_item(item, table=None):
+    """Deserialize DynamoDB item to Python dict (using `table`'s schema when given)"""
+    return _DESERIALIZERS.get(table, _GENERIC_DESERIALIZER)(item)
+
+def deserialize_items(items, table=None):
+    """Deserialize a page of items with one schema lookup"""
+    deserialize = _DESERIALIZERS.get(table, _GENERIC_DESERIALIZER)
+    return [deserialize(item) for item in items]
+
+# Attributes each list view renders. Reading only these keeps password hashes,
+# medical_history and mood_history out of list pages and cuts read capacity.
+VIEW_PROJECTIONS = {
+    'doctor_list': ['email', 'name', 'specialization', 'status'],
+    'doctor_name': ['email', 'name'],
+    'patient_name': ['email', 'name'],
+    'appointment_list': ['appointment_id', 'patient_email', 'doctor_email', 'appointment_date',
+                         'symptoms', 'priority', 'status', 'created_at'],
+    'invoice_list': ['invoice_id', 'patient_email', 'appointment_id', 'amount', 'description', 'status',
+                     'insurance_claimed', 'created_at'],
+    'blood_stock': ['blood_group', 'units'],
+    'vault_metadata': ['vault_id', 'patient_email', 'file_name', 'file_type', 'uploaded_at'],
+    # rebuild_metrics() reads whole tables; only what the counters need
+    'metrics_doctor': ['email', 'specialization'],
+    'metrics_appointment': ['appointment_id', 'doctor_email', 'status'],
+    'metrics_invoice': ['invoice_id', 'amount', 'status'],
+    'key_only_email': ['email'],
+    'key_only_vault': ['vault_id']
+}
+
+def projection(view, names=None):
+    """ProjectionExpression kwargs for `view`; `names` are the call's own #aliases"""
+    if view is None:
+        return {'ExpressionAttributeNames': names} if names else {}
+    aliases = {f"#p{idx}": field for idx, field in enumerate(VIEW_PROJECTIONS[view])}
+    return {'ProjectionExpression': ', '.join(aliases),
+            'ExpressionAttributeNames': dict(names or {}, **aliases)}
 
 def generate_id(prefix=""):
     """Generate unique ID with optional prefix"""
@@ -168,23 +338,233 @@ def get_current_datetime():
     return datetime.now().isoformat()
 
 # ============================================
-# SNS NOTIFICATION SERVICE (Email & SMS)
+# AGGREGATE METRICS (Admin Dashboard Counters)
 # ============================================
 
-def send_notification(message, subject="MedTrack Notification"):
-    """Send SNS notification to topic subscribers"""
+# One counter item holds every dashboard number. Writers apply deltas with an
+# atomic DynamoDB `ADD`, so reading the dashboard is a single get_item instead
+# of scanning patients, doctors, appointments, vault and invoices.
+# Every ADD also bumps `revision`. `initialized` is only written by
+# rebuild_metrics, so an item created by a stray ADD still gets backfilled.
+METRICS_KEY = {'metric_id': 'global'}
+METRICS_VERSION = 1  # bump to force a rebuild when the counters change meaning
+REBUILD_ATTEMPTS = 5
+METRIC_FIELDS = ['doctors', 'patients', 'appointments', 'records', 'invoices',
+                 'income', 'pending_income']
+DEPT_LOAD_PREFIX = 'dept_load:'
+SPECIALIZATION_PREFIX = 'specialization:'
+ACTIVE_APPOINTMENT_STATUSES = ['BOOKED', 'CONFIRMED', 'CHECKED-IN', 'CONSULTING']
+
+def increment_metrics(deltas):
+    """Atomically add the given deltas to the global metrics item"""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return True
     try:
-        response = sns_client.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Message=message,
-            Subject=subject
+        clauses = ["#rev :one"]
+        expr_names = {'#rev': 'revision'}
+        expr_values = {':one': 1}
+        for idx, (field, delta) in enumerate(deltas.items()):
+            clauses.append(f"#m{idx} :d{idx}")
+            expr_names[f"#m{idx}"] = field
+            expr_values[f":d{idx}"] = to_decimal(delta)
+        
+        metrics_table.update_item(
+            Key=METRICS_KEY,
+            UpdateExpression="ADD " + ", ".join(clauses),
+            ExpressionAttributeNames=expr_names,
+            ExpressionAttributeValues=expr_values
         )
-        logger.info(f"SNS notification sent: {response['MessageId']}")
         return True
     except Exception as e:
-        logger.error(f"Failed to send SNS notification: {e}")
+        logger.error(f"Error updating metrics {deltas}: {e}")
         return False
 
+def _scan_metrics():
+    """Counter values computed from full table scans"""
+    doctors = parallel_scan.scan_all(doctors_table, **projection('metrics_doctor'))
+    specialization_by_doctor = {d.get('email'): d.get('specialization') or 'General' for d in doctors}
+    metrics = dict(METRICS_KEY)
+    metrics.update({
+        'doctors': len(doctors),
+        'patients': parallel_scan.count(patients_table, **projection('key_only_email')),
+        'records': parallel_scan.count(medical_vault_table, **projection('key_only_vault')),
+        'appointments': 0,
+        'invoices': 0,
+        'income': 0,
+        'pending_income': 0
+    })
+    for doctor in doctors:
+        field = SPECIALIZATION_PREFIX + (doctor.get('specialization') or 'General')
+        metrics[field] = metrics.get(field, 0) + 1
+    for appt in parallel_scan.scan(appointments_table, **projection('metrics_appointment')):
+        metrics['appointments'] += 1
+        if appt.get('status') in ACTIVE_APPOINTMENT_STATUSES:
+            field = DEPT_LOAD_PREFIX + specialization_by_doctor.get(appt.get('doctor_email'), 'General')
+            metrics[field] = metrics.get(field, 0) + 1
+    for inv in parallel_scan.scan(invoices_table, **projection('metrics_invoice')):
+        metrics['invoices'] += 1
+        if inv.get('status') == 'paid':
+            metrics['income'] += inv.get('amount', 0)
+        elif inv.get('status') == 'unpaid':
+            metrics['pending_income'] += inv.get('amount', 0)
+    return metrics
+
+def rebuild_metrics():
+    """Recompute the counter item from full scans (backfill / repair).
+
+    The write is conditional on `revision`: if any increment lands while the
+    tables are scanned, the put fails and the scan is repeated, so no ADD is
+    overwritten.
+    """
+    for attempt in range(REBUILD_ATTEMPTS):
+        try:
+            current = metrics_table.get_item(Key=METRICS_KEY, ConsistentRead=True).get('Item') or {}
+            revision = current.get('revision')
+            metrics = _scan_metrics()
+            metrics.update(initialized=METRICS_VERSION, revision=revision or 0)
+            if revision is None:
+                condition = {'ConditionExpression': 'attribute_not_exists(#rev)'}
+            else:
+                condition = {'ConditionExpression': '#rev = :rev', 'ExpressionAttributeValues': {':rev': revision}}
+            metrics_table.put_item(Item={k: to_decimal(v) for k, v in metrics.items()},
+                                   ExpressionAttributeNames={'#rev': 'revision'}, **condition)
+            logger.info("Metrics rebuilt from table scans")
+            return metrics
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error rebuilding metrics: {e}")
+                return None
+            logger.info(f"Metrics changed during rebuild; rescanning (attempt {attempt + 1})")
+        except Exception as e:
+            logger.error(f"Error rebuilding metrics: {e}")
+            return None
+    logger.error("Giving up rebuilding metrics: counters kept changing during the scans")
+    return None
+
+def get_admin_stats():
+    """Read dashboard counters in O(1); backfills the item until a rebuild has initialized it"""
+    try:
+        item = metrics_table.get_item(Key=METRICS_KEY).get('Item')
+        if item is None or item.get('initialized') != METRICS_VERSION:
+            item = rebuild_metrics() or item or {}
+    except Exception as e:
+        logger.error(f"Error reading metrics: {e}")
+        item = {}
+    
+    stats = {}
+    for field in METRIC_FIELDS:
+        value = item.get(field, 0)
+        stats[field] = int(value) if value == int(value) else float(value)
+    stats['dept_load'] = {
+        key[len(DEPT_LOAD_PREFIX):]: int(value)
+        for key, value in item.items()
+        if key.startswith(DEPT_LOAD_PREFIX) and value > 0
+    }
+    stats['departments'] = sum(
+        1 for key, value in item.items()
+        if key.startswith(SPECIALIZATION_PREFIX) and value > 0
+    )
+    return stats
+
+def adjust_department_load(doctor_email, delta):
+    """Move the active-appointment counter of the doctor's specialization"""
+    doctor = get_doctor(doctor_email) if doctor_email else None
+    specialization = (doctor.get('specialization') if doctor else None) or 'General'
+    return increment_metrics({DEPT_LOAD_PREFIX + specialization: delta})
+
+# ============================================
+# SNS NOTIFICATION SERVICE (Email & SMS)
+# ============================================
+
+def _sns_publisher():
+    """SNS client used by the outbox worker (None = log instead of sending)"""
+    return globals().get('sns_client') if SNS_AVAILABLE else None
+
+def _before_email_send(params):
+    """Outbox hook: make sure the recipient is subscribed before the first publish"""
+    email = params.get('MessageAttributes', {}).get('email', {}).get('StringValue')
+    if email:
+        ensure_email_subscribed(email)
+
+# Notifications are spooled and delivered by a background worker with batching
+# and retries, so request handlers never wait on SNS.
+notification_outbox = NotificationOutbox(_sns_publisher, channel='aws_setup', before_send=_before_email_send)
+metrics.gauge('medtrack_notification_queue_depth', 'Notifications waiting in the outbox',
+              lambda: {(('channel', notification_outbox.channel),): notification_outbox.pending_count()}, mode='max')
+
+def send_notification(message, subject="MedTrack Notification", coalesce_key=None, idempotency_key=None):
+    """Queue an SNS notification to topic subscribers (see NotificationOutbox.enqueue for the keys)"""
+    outbox_id = notification_outbox.enqueue(
+        coalesce_key=coalesce_key,
+        idempotency_key=idempotency_key,
+        TopicArn=SNS_TOPIC_ARN,
+        Message=message,
+        Subject=subject
+    )
+    if outbox_id is None:
+        return False
+    logger.info(f"SNS notification queued: {outbox_id}")
+    return True
+
+# Subscription registry: emails already subscribed to the topic (confirmed or
+# pending confirmation). Loaded once from the registry table plus a paginated
+# list_subscriptions_by_topic, then kept current by subscribe_email, so sending
+# to a known address costs one publish and no subscribe call.
+_subscribed_emails = set()
+_subscriptions_loaded = False
+_subscriptions_lock = threading.Lock()
+
+def load_subscription_registry():
+    """Populate the in-memory registry from the table and from SNS"""
+    global _subscriptions_loaded
+    with _subscriptions_lock:
+        if _subscriptions_loaded:
+            return
+        emails = set()
+        try:
+            items = parallel_scan.scan(sns_subscriptions_table, **projection('key_only_email'))
+            emails.update(item['email'].lower() for item in items if item.get('email'))
+        except Exception as e:
+            logger.error(f"Failed to read subscription registry: {e}")
+        
+        if SNS_AVAILABLE:
+            try:
+                # SNS is the source of truth; also picks up subscriptions made outside the app
+                params = {'TopicArn': SNS_TOPIC_ARN}
+                while True:
+                    response = sns_client.list_subscriptions_by_topic(**params)
+                    for sub in response.get('Subscriptions', []):
+                        if sub.get('Protocol') == 'email' and sub.get('Endpoint'):
+                            emails.add(sub['Endpoint'].lower())
+                    if not response.get('NextToken'):
+                        break
+                    params['NextToken'] = response['NextToken']
+            except Exception as e:
+                logger.error(f"Failed to list SNS subscriptions: {e}")
+        
+        _subscribed_emails.update(emails)
+        _subscriptions_loaded = True
+        logger.info(f"Subscription registry loaded: {len(_subscribed_emails)} email(s)")
+
+def preload_subscription_registry():
+    """Load the registry in a background thread, so no request or send waits for it"""
+    thread = threading.Thread(target=load_subscription_registry, name='sns-registry', daemon=True)
+    thread.start()
+    return thread
+
+def is_email_subscribed(email):
+    load_subscription_registry()
+    subscribed = email.lower() in _subscribed_emails
+    metrics.cache_result('sns_subscriptions', subscribed)
+    return subscribed
+
+def ensure_email_subscribed(email):
+    """Subscribe `email` unless the registry already knows it"""
+    if is_email_subscribed(email):
+        return True
+    return subscribe_email(email)
+
 def subscribe_email(email):
     """Subscribe email to SNS Topic"""
     try:
@@ -194,59 +574,69 @@ def subscribe_email(email):
             Endpoint=email
         )
         logger.info(f"Subscribed {email} to SNS Topic. Subscription ARN: {response.get('SubscriptionArn')}")
-        return True
     except Exception as e:
         logger.error(f"Failed to subscribe {email}: {e}")
         return False
-
-def send_email_notification(email, subject, message):
-    """Send email notification via SNS"""
+    
+    _subscribed_emails.add(email.lower())
     try:
-        # Ensure subscription first (Idempotent-ish)
-        subscribe_email(email)
-        
-        response = sns_client.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Message=message,
-            Subject=subject,
-            MessageAttributes={
-                'email': {
-                    'DataType': 'String',
-                    'StringValue': email
-                }
-            }
-        )
-        logger.info(f"Email notification sent to {email}: {response['MessageId']}")
-        return True
+        sns_subscriptions_table.put_item(Item={
+            'email': email.lower(),
+            'subscription_arn': response.get('SubscriptionArn') or 'pending confirmation',
+            'subscribed_at': get_current_datetime()
+        })
     except Exception as e:
-        logger.error(f"Failed to send email to {email}: {e}")
+        logger.error(f"Failed to record subscription for {email}: {e}")
+    return True
+
+def send_email_notification(email, subject, message, coalesce_key=None, idempotency_key=None):
+    """Queue an email notification via SNS (the subscription is ensured by the outbox worker)"""
+    outbox_id = notification_outbox.enqueue(
+        coalesce_key=coalesce_key,
+        idempotency_key=idempotency_key,
+        TopicArn=SNS_TOPIC_ARN,
+        Message=message,
+        Subject=subject,
+        MessageAttributes={
+            'email': {
+                'DataType': 'String',
+                'StringValue': email
+            }
+        }
+    )
+    if outbox_id is None:
         return False
+    logger.info(f"Email notification to {email} queued: {outbox_id}")
+    return True
 
 def send_sms_notification(phone_number, message):
-    """Send SMS notification via SNS (max 160 characters)"""
-    try:
-        # Format phone number (must be in E.164 format: +919876543210)
-        if not phone_number.startswith('+'):
-            phone_number = '+91' + phone_number.lstrip('0')
-        
-        response = sns_client.publish(
-            PhoneNumber=phone_number,
-            Message=message[:160],  # SMS limit
-            MessageAttributes={
-                'AWS.SNS.SMS.SMSType': {
-                    'DataType': 'String',
-                    'StringValue': 'Transactional'  # For important messages
-                }
+    """Queue an SMS notification via SNS (max 160 characters)"""
+    # Format phone number (must be in E.164 format: +919876543210)
+    if not phone_number.startswith('+'):
+        phone_number = '+91' + phone_number.lstrip('0')
+    
+    outbox_id = notification_outbox.enqueue(
+        PhoneNumber=phone_number,
+        Message=message[:160],  # SMS limit
+        MessageAttributes={
+            'AWS.SNS.SMS.SMSType': {
+                'DataType': 'String',
+                'StringValue': 'Transactional'  # For important messages
             }
-        )
-        logger.info(f"SMS sent to {phone_number}: {response['MessageId']}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send SMS to {phone_number}: {e}")
+        }
+    )
+    if outbox_id is None:
         return False
+    logger.info(f"SMS to {phone_number} queued: {outbox_id}")
+    return True
 
-def notify_appointment_status_change(patient_email, status, appointment_id=None, doctor_name=None):
-    """Send SNS notification when appointment status changes in patient tracking system"""
+def notify_appointment_status_change(patient_email, status, appointment_id=None, doctor_name=None, changed_at=None):
+    """Send SNS notification when appointment status changes in patient tracking system
+
+    `changed_at` (the updated_at the status change wrote) identifies the
+    change: re-sending the same change is a no-op, a later change to the
+    same status is still delivered.
+    """
     try:
         # Status-specific messages
         status_messages = {
@@ -270,10 +660,17 @@ def notify_appointment_status_change(patient_email, status, appointment_id=None,
         
         notification_data = status_messages.get(status)
         if notification_data:
+            # Rapid status steps of one appointment collapse into the latest one per recipient;
+            # the idempotency key names the change itself, so one change is never sent twice
+            entity = f"appointment-status:{appointment_id}" if appointment_id else None
+            change = entity and changed_at and f"{entity}:{status}:{changed_at}"
+            
             # Send notification via SNS Topic
             send_notification(
                 message=notification_data['message'],
-                subject=notification_data['subject']
+                subject=notification_data['subject'],
+                coalesce_key=entity and f"{entity}:topic",
+                idempotency_key=change and f"{change}:topic"
             )
             
             # Also send email notification if available
@@ -281,7 +678,9 @@ def notify_appointment_status_change(patient_email, status, appointment_id=None,
                 send_email_notification(
                     email=patient_email,
                     subject=notification_data['subject'],
-                    message=notification_data['message']
+                    message=notification_data['message'],
+                    coalesce_key=entity and f"{entity}:{patient_email}",
+                    idempotency_key=change and f"{change}:{patient_email}"
                 )
             
             logger.info(f"Status change notification sent for {patient_email}: {status}")
@@ -323,11 +722,11 @@ Thank you for choosing MedTrack!
 # PATIENT MANAGEMENT
 # ============================================
 
-def get_patient(email):
-    """Get patient by email from DynamoDB"""
+def get_patient(email, view=None):
+    """Get patient by email from DynamoDB (only `view`'s attributes when given)"""
     try:
-        response = patients_table.get_item(Key={'email': email})
-        return deserialize_item(response.get('Item'))
+        response = patients_table.get_item(Key={'email': email}, **projection(view))
+        return deserialize_item(response.get('Item'), PATIENTS_TABLE)
     except ClientError as e:
         logger.error(f"Error getting patient {email}: {e}")
         return None
@@ -356,9 +755,8 @@ def create_patient(email, password, name, phone, address, dob, blood_group):
             Item=patient_data,
             ConditionExpression='attribute_not_exists(email)'
         )
-        
-        # Subscribe patient to SNS notifications
-        subscribe_email(email)
+        increment_metrics({'patients': 1})
+        # No SNS call here: the outbox worker subscribes the address before its first email
         
         # Send notification
         send_notification(
@@ -411,11 +809,11 @@ def update_patient(email, updates):
 # DOCTOR MANAGEMENT
 # ============================================
 
-def get_doctor(email):
-    """Get doctor by email from DynamoDB"""
+def get_doctor(email, view=None):
+    """Get doctor by email from DynamoDB (only `view`'s attributes when given)"""
     try:
-        response = doctors_table.get_item(Key={'email': email})
-        return deserialize_item(response.get('Item'))
+        response = doctors_table.get_item(Key={'email': email}, **projection(view))
+        return deserialize_item(response.get('Item'), DOCTORS_TABLE)
     except ClientError as e:
         logger.error(f"Error getting doctor {email}: {e}")
         return None
@@ -443,6 +841,7 @@ def create_doctor(email, password, name, phone, specialization, license_number):
             Item=doctor_data,
             ConditionExpression='attribute_not_exists(email)'
         )
+        increment_metrics({'doctors': 1, SPECIALIZATION_PREFIX + (specialization or 'General'): 1})
         
         # Send notification
         send_notification(
@@ -462,11 +861,11 @@ def create_doctor(email, password, name, phone, specialization, license_number):
         logger.error(f"Unexpected error creating doctor {email}: {e}")
         return False
 
-def get_all_doctors():
+def get_all_doctors(view=None):
     """Get all doctors from DynamoDB"""
     try:
-        response = doctors_table.scan()
-        doctors = [deserialize_item(item) for item in response.get('Items', [])]
+        response = doctors_table.scan(**projection(view))
+        doctors = deserialize_items(response.get('Items', []), DOCTORS_TABLE)
         return doctors
     except ClientError as e:
         logger.error(f"Error getting all doctors: {e}")
@@ -503,6 +902,8 @@ def create_appointment(patient_email, doctor_email, appointment_date, symptoms,
         
         patient_name = patient.get('name', patient_email) if patient else patient_email
         doctor_name = doctor.get('name', doctor_email) if doctor else doctor_email
+        specialization = (doctor.get('specialization') if doctor else None) or 'General'
+        increment_metrics({'appointments': 1, DEPT_LOAD_PREFIX + specialization: 1})
         
         # Send notification
         send_notification(
@@ -515,7 +916,8 @@ def create_appointment(patient_email, doctor_email, appointment_date, symptoms,
             patient_email=patient_email,
             status='BOOKED',
             appointment_id=appointment_id,
-            doctor_name=doctor_name
+            doctor_name=doctor_name,
+            changed_at=appointment_data['updated_at']
         )
         
         logger.info(f"Appointment created: {appointment_id}")
@@ -528,7 +930,7 @@ def get_appointment(appointment_id):
     """Get appointment by ID"""
     try:
         response = appointments_table.get_item(Key={'appointment_id': appointment_id})
-        return deserialize_item(response.get('Item'))
+        return deserialize_item(response.get('Item'), APPOINTMENTS_TABLE)
     except ClientError as e:
         logger.error(f"Error getting appointment {appointment_id}: {e}")
         return None
@@ -559,23 +961,36 @@ def update_appointment_status(appointment_id, status, diagnosis='', prescription
             
         update_expr = update_expr.rstrip(', ')
         
-        appointments_table.update_item(
+        # ALL_OLD: the status this update actually replaced, even under concurrent updates
+        response = appointments_table.update_item(
             Key={'appointment_id': appointment_id},
             UpdateExpression=update_expr,
+            ConditionExpression='attribute_exists(appointment_id)',
             ExpressionAttributeValues=expr_values,
-            ExpressionAttributeNames=expr_names
+            ExpressionAttributeNames=expr_names,
+            ReturnValues='ALL_OLD'
         )
+        old = response.get('Attributes', {})
+        was_active = old.get('status') in ACTIVE_APPOINTMENT_STATUSES
+        is_active = status in ACTIVE_APPOINTMENT_STATUSES
+        if was_active != is_active:
+            adjust_department_load(old.get('doctor_email'), 1 if is_active else -1)
         
         # Send notification
         appointment = get_appointment(appointment_id)
         send_notification(
             f"Appointment {appointment_id} status updated to: {status}",
-            "Appointment Status Update"
+            "Appointment Status Update",
+            coalesce_key=f"appointment-update:{appointment_id}",
+            idempotency_key=f"appointment-update:{appointment_id}:{status}:{update_data['updated_at']}"
         )
         
         logger.info(f"Appointment updated: {appointment_id}")
         return True
     except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            logger.warning(f"Appointment not found: {appointment_id}")
+            return False
         logger.error(f"Error updating appointment {appointment_id}: {e}")
         return False
 
@@ -586,7 +1001,7 @@ def get_patient_appointments(patient_email):
             FilterExpression='patient_email = :email',
             ExpressionAttributeValues={':email': patient_email}
         )
-        appointments = [deserialize_item(item) for item in response.get('Items', [])]
+        appointments = deserialize_items(response.get('Items', []), APPOINTMENTS_TABLE)
         
         # Enrich appointments with details for display
         for appt in appointments:
@@ -597,7 +1012,7 @@ def get_patient_appointments(patient_email):
             
             # Get Doctor Name
             if 'doctor_email' in appt:
-                doc = get_doctor(appt['doctor_email'])
+                doc = get_doctor(appt['doctor_email'], view='doctor_name')
                 appt['doctor_name'] = doc.get('name', appt['doctor_email']) if doc else appt['doctor_email']
             else:
                  appt['doctor_name'] = 'Unknown Doctor'
@@ -607,42 +1022,117 @@ def get_patient_appointments(patient_email):
         logger.error(f"Error getting patient appointments: {e}")
         return []
 
-def get_doctor_appointments(doctor_email):
+def get_doctor_appointments(doctor_email, view=None):
     """Get all appointments for a specific doctor"""
     try:
         # DEMO OVERRIDE: Allow 'medtrack@gmail.com' to see ALL appointments (Super View)
         if doctor_email == 'medtrack@gmail.com':
-            response = appointments_table.scan()
+            items = parallel_scan.scan_all(appointments_table, **projection(view))
         else:
             # Filter appointments by doctor email for privacy
-            response = appointments_table.scan(
+            items = parallel_scan.scan_all(
+                appointments_table,
                 FilterExpression='doctor_email = :email',
-                ExpressionAttributeValues={':email': doctor_email}
+                ExpressionAttributeValues={':email': doctor_email},
+                **projection(view)
             )
         
-        appointments = [deserialize_item(item) for item in response.get('Items', [])]
-        
-        # Enrich with patient details
-        for appt in appointments:
-            # Map time
-            date_val = appt.get('appointment_date')
-            appt['time'] = str(date_val).replace('T', ' ') if date_val else 'N/A'
-            
-            # Get Patient Details
-            p_email = appt.get('patient_email')
-            if p_email:
-                patient = get_patient(p_email)
-                appt['patient_name'] = patient.get('name', p_email) if patient else p_email
-                appt['patient_id'] = p_email # Template uses this
-            else:
-                 appt['patient_name'] = 'Unknown'
-                 appt['patient_id'] = 'N/A'
-
+        appointments = deserialize_items(items, APPOINTMENTS_TABLE)
+        _add_patient_names(appointments)
         return sorted(appointments, key=lambda x: x.get('created_at', ''), reverse=True)
     except ClientError as e:
         logger.error(f"Error getting doctor appointments: {e}")
         return []
 
+def _add_patient_names(appointments):
+    """Enrich appointments with display time and patient details"""
+    for appt in appointments:
+        # Map time
+        date_val = appt.get('appointment_date')
+        appt['time'] = str(date_val).replace('T', ' ') if date_val else 'N/A'
+        
+        # Get Patient Details
+        p_email = appt.get('patient_email')
+        if p_email:
+            patient = get_patient(p_email, view='patient_name')
+            appt['patient_name'] = patient.get('name', p_email) if patient else p_email
+            appt['patient_id'] = p_email # Template uses this
+        else:
+             appt['patient_name'] = 'Unknown'
+             appt['patient_id'] = 'N/A'
+
+# Paged listings (see pagination.py): each returns (items, next_key)
+def _table_page(table, table_name, key, limit, start_key, view=None, **filters):
+    """One page of `table`, optionally filtered on attribute equality"""
+    params = {}
+    names = {}
+    if filters:
+        conditions = []
+        values = {}
+        for idx, (attr, value) in enumerate(filters.items()):
+            names[f"#f{idx}"] = attr
+            values[f":f{idx}"] = value
+            conditions.append(f"#f{idx} = :f{idx}")
+        params = {'FilterExpression': ' AND '.join(conditions), 'ExpressionAttributeValues': values}
+    try:
+        items, next_key = pagination.scan_page(
+            table.scan, limit, start_key, key_attrs=(key,),
+            read_limit=pagination.MAX_PAGE_SIZE * 10 if filters else None,
+            **params, **projection(view, names))
+        return deserialize_items(items, table_name), next_key
+    except ClientError as e:
+        logger.error(f"Error listing {table_name}: {e}")
+        return [], None
+
+def _index_page(table, table_name, index, hash_attr, hash_value, range_attr, key, limit, start_key, view=None):
+    """One page of `index` for `hash_value`, newest first (its range key is a timestamp)"""
+    names = {'#h': hash_attr}
+    try:
+        items, next_key = pagination.scan_page(
+            table.query, limit, start_key, key_attrs=(key, hash_attr, range_attr),
+            IndexName=index, KeyConditionExpression='#h = :h', ExpressionAttributeValues={':h': hash_value},
+            ScanIndexForward=False, **projection(view, names))
+        return deserialize_items(items, table_name), next_key
+    except ClientError as e:
+        logger.error(f"Error listing {table_name} by {hash_attr}: {e}")
+        return [], None
+
+def _newest_first(items, field='created_at'):
+    """Table scans page in key order; each page is shown newest first"""
+    items.sort(key=lambda item: str(item.get(field) or ''), reverse=True)
+    return items
+
+def get_doctor_appointments_page(doctor_email, limit, start_key=None, view=None):
+    # Same super view as get_doctor_appointments; it scans, so only each page is chronological
+    if doctor_email == 'medtrack@gmail.com':
+        appointments, next_key = get_appointments_page(limit, start_key, view)
+    else:
+        appointments, next_key = _index_page(appointments_table, APPOINTMENTS_TABLE, DOCTOR_APPOINTMENTS_INDEX,
+                                             'doctor_email', doctor_email, 'created_at', 'appointment_id',
+                                             limit, start_key, view)
+    _add_patient_names(appointments)
+    return appointments, next_key
+
+def get_appointments_page(limit, start_key=None, view=None):
+    appointments, next_key = _table_page(appointments_table, APPOINTMENTS_TABLE, 'appointment_id',
+                                         limit, start_key, view)
+    return _newest_first(appointments), next_key
+
+def get_patients_page(limit, start_key=None):
+    return _table_page(patients_table, PATIENTS_TABLE, 'email', limit, start_key, 'patient_name')
+
+def get_invoices_page(limit, start_key=None):
+    return _table_page(invoices_table, INVOICES_TABLE, 'invoice_id', limit, start_key, 'invoice_list')
+
+def get_patient_vault_page(patient_email, limit, start_key=None):
+    return _index_page(medical_vault_table, MEDICAL_VAULT_TABLE, PATIENT_VAULT_INDEX, 'patient_email',
+                       patient_email, 'uploaded_at', 'vault_id', limit, start_key)
+
+def get_vault_page(limit, start_key=None):
+    """Vault metadata of every patient (no file paths or analysis text)"""
+    return _table_page(medical_vault_table, MEDICAL_VAULT_TABLE, 'vault_id', limit, start_key,
+                       'vault_metadata')
+
 # ... (active_queue update usually in doctor_dashboard route but function is here)
 
 # Let me modify the doctor_dashboard route separately or if it's close enough.
@@ -670,6 +1160,7 @@ def create_appointment_request(doctor_email, patient_email, proposed_date, reaso
         }
         
         appointment_requests_table.put_item(Item=request_data)
+        versions.bump('appointment_requests', patient_email, doctor_email)
         
         # Get doctor and patient names
         doctor = get_doctor(doctor_email)
@@ -707,7 +1198,7 @@ def get_appointment_request(request_id):
     """Get appointment request by ID"""
     try:
         response = appointment_requests_table.get_item(Key={'request_id': request_id})
-        return deserialize_item(response.get('Item'))
+        return deserialize_item(response.get('Item'), APPOINTMENT_REQUESTS_TABLE)
     except ClientError as e:
         logger.error(f"Error getting appointment request {request_id}: {e}")
         return None
@@ -730,7 +1221,7 @@ def get_patient_appointment_requests(patient_email, status=None):
                 ExpressionAttributeValues={':email': patient_email}
             )
         
-        requests = [deserialize_item(item) for item in response.get('Items', [])]
+        requests = deserialize_items(response.get('Items', []), APPOINTMENT_REQUESTS_TABLE)
         
         # Enrich with doctor details
         for req in requests:
@@ -762,7 +1253,7 @@ def get_doctor_appointment_requests(doctor_email, status=None):
                 ExpressionAttributeValues={':email': doctor_email}
             )
         
-        requests = [deserialize_item(item) for item in response.get('Items', [])]
+        requests = deserialize_items(response.get('Items', []), APPOINTMENT_REQUESTS_TABLE)
         
         # Enrich with patient details
         for req in requests:
@@ -813,6 +1304,7 @@ def accept_appointment_request(request_id):
                     ':aid': appointment_id
                 }
             )
+            versions.bump('appointment_requests', request['patient_email'], request['doctor_email'])
             
             # Get names for notification
             doctor = get_doctor(request['doctor_email'])
@@ -881,6 +1373,7 @@ def decline_appointment_request(request_id, reason=''):
             ExpressionAttributeNames={'#status': 'status'},
             ExpressionAttributeValues=expr_values
         )
+        versions.bump('appointment_requests', request['patient_email'], request['doctor_email'])
         
         # Get names for notification
         doctor = get_doctor(request['doctor_email'])
@@ -935,6 +1428,7 @@ def add_to_medical_vault(patient_email, file_name, file_type, file_path, analysi
         }
         
         medical_vault_table.put_item(Item=vault_data)
+        increment_metrics({'records': 1})
         
         logger.info(f"Medical file added to vault: {vault_id} for patient {patient_email}")
         return vault_id
@@ -949,7 +1443,7 @@ def get_patient_vault(patient_email):
             FilterExpression='patient_email = :email',
             ExpressionAttributeValues={':email': patient_email}
         )
-        vault_items = [deserialize_item(item) for item in response.get('Items', [])]
+        vault_items = deserialize_items(response.get('Items', []), MEDICAL_VAULT_TABLE)
         return sorted(vault_items, key=lambda x: x.get('uploaded_at', ''), reverse=True)
     except ClientError as e:
         logger.error(f"Error getting patient vault: {e}")
@@ -962,7 +1456,7 @@ def get_patient_vault(patient_email):
 def get_blood_stock():
     """Get current blood stock for all blood groups"""
     try:
-        response = blood_bank_table.scan()
+        response = blood_bank_table.scan(**projection('blood_stock'))
         blood_stock = {}
         for item in response.get('Items', []):
             blood_group = item.get('blood_group')
@@ -1018,6 +1512,7 @@ def create_invoice(patient_email, appointment_id, amount, description):
         }
         
         invoices_table.put_item(Item=invoice_data)
+        increment_metrics({'invoices': 1, 'pending_income': amount})
         
         # Send notification
         send_notification(
@@ -1031,14 +1526,15 @@ def create_invoice(patient_email, appointment_id, amount, description):
         logger.error(f"Error creating invoice: {e}")
         return None
 
-def get_patient_invoices(patient_email):
+def get_patient_invoices(patient_email, view=None):
     """Get all invoices for a patient"""
     try:
         response = invoices_table.scan(
             FilterExpression='patient_email = :email',
-            ExpressionAttributeValues={':email': patient_email}
+            ExpressionAttributeValues={':email': patient_email},
+            **projection(view)
         )
-        invoices = [deserialize_item(item) for item in response.get('Items', [])]
+        invoices = deserialize_items(response.get('Items', []), INVOICES_TABLE)
         return sorted(invoices, key=lambda x: x.get('created_at', ''), reverse=True)
     except ClientError as e:
         logger.error(f"Error getting patient invoices: {e}")
@@ -1099,7 +1595,7 @@ def get_chat_messages(user1_email, user2_email):
     """Get all chat messages between two users"""
     try:
         response = chat_messages_table.scan()
-        all_messages = [deserialize_item(item) for item in response.get('Items', [])]
+        all_messages = deserialize_items(response.get('Items', []), CHAT_MESSAGES_TABLE)
         
         # Filter messages between the two users
         chat_messages = [
@@ -1131,6 +1627,7 @@ def log_mood(patient_email, mood, notes=''):
         }
         
         mood_logs_table.put_item(Item=mood_data)
+        versions.bump('mood', patient_email)
         
         logger.info(f"Mood logged: {mood_id} for patient {patient_email}")
         return mood_id
@@ -1145,7 +1642,7 @@ def get_mood_history(patient_email):
             FilterExpression='patient_email = :email',
             ExpressionAttributeValues={':email': patient_email}
         )
-        mood_logs = [deserialize_item(item) for item in response.get('Items', [])]
+        mood_logs = deserialize_items(response.get('Items', []), MOOD_LOGS_TABLE)
         return sorted(mood_logs, key=lambda x: x.get('logged_at', ''), reverse=True)
     except ClientError as e:
         logger.error(f"Error getting mood history: {e}")
@@ -1406,17 +1903,10 @@ def admin_dashboard():
         flash('Please login as admin first.', 'error')
         return redirect(url_for('login'))
     
-    # Simple stats for the dashboard
-    stats = {
-        'doctors': len(get_all_doctors()),
-        'patients': 0, # get_all_patients not implemented cheaply, skip for now or implement
-        'appointments': 0,
-        'departments': 4
-    }
-    
-    # We can try to scan if we want accurate numbers, but for speed just render template
+    # Dashboard counters come from the aggregate metrics item (single get_item)
     # Re-using the existing admin dashboard template but passing necessary variables
     # The existing template expects 'stats', 'patients', 'blood_stock' etc.
+    stats = get_admin_stats()
     
     return render_template('admin/dashboard.html', 
                          stats=stats,
@@ -1424,24 +1914,40 @@ def admin_dashboard():
                          blood_stock=get_blood_stock(),
                          capacity={'ICU': {'status': 'Normal', 'occupied': 8, 'total': 12}, 
                                    'General Ward': {'status': 'Normal', 'occupied': 45, 'total': 60}},
-                         dept_load={'Cardiology': 20},
+                         dept_load=stats['dept_load'],
                          pending_donations=[])
 
 @app.route('/admin/doctors')
 def admin_doctors():
     if session.get('role') != 'admin': return redirect(url_for('login'))
-    doctors = get_all_doctors()
+    doctors = get_all_doctors(view='doctor_list')
+    for d in doctors:
+        d['department'] = d.get('specialization', 'General')
+        d['id'] = d.get('email')
     return render_template('admin/doctors_list.html', doctors=doctors)
 
 @app.route('/admin/patients')
 def admin_patients():
     if session.get('role') != 'admin': return redirect(url_for('login'))
-    return render_template('admin/patients_list.html', patients=[])
+    limit, start_key = pagination.request_page()
+    patients, next_key = get_patients_page(limit, start_key)
+    for p in patients:
+        p['id'] = p.get('email')
+    return render_template('admin/patients_list.html', patients=patients,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/admin/appointments')
 def admin_appointments():
     if session.get('role') != 'admin': return redirect(url_for('login'))
-    return render_template('admin/appointments_list.html', appointments=[])
+    limit, start_key = pagination.request_page()
+    appointments, next_key = get_appointments_page(limit, start_key, view='appointment_list')
+    for appt in appointments:
+        appt['id'] = appt.get('appointment_id')
+        appt['time'] = str(appt.get('appointment_date') or 'N/A').replace('T', ' ')
+        appt['patient_id'] = appt.get('patient_email')
+        appt['doctor_id'] = appt.get('doctor_email')
+    return render_template('admin/appointments_list.html', appointments=appointments,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/admin/records')
 def admin_records():
@@ -1451,7 +1957,27 @@ def admin_records():
 @app.route('/admin/invoices')
 def admin_invoices():
     if session.get('role') != 'admin': return redirect(url_for('login'))
-    return render_template('admin/invoices_list.html', invoices=[])
+    limit, start_key = pagination.request_page()
+    invoices, next_key = get_invoices_page(limit, start_key)
+    for inv in invoices:
+        inv['id'] = inv.get('invoice_id')
+        inv['patient_id'] = inv.get('patient_email')
+        inv['reason'] = inv.get('description')
+    return render_template('admin/invoices_list.html', invoices=invoices,
+                           **pagination.template_args(next_key, limit))
+
+# Bulk exports for audits and billing reconciliation (see exporters.py)
+EXPORTS = {
+    'appointments': (lambda limit, start_key: get_appointments_page(limit, start_key, view='appointment_list'),
+                     VIEW_PROJECTIONS['appointment_list']),
+    'invoices': (get_invoices_page, VIEW_PROJECTIONS['invoice_list']),
+    'vault': (get_vault_page, VIEW_PROJECTIONS['vault_metadata'])
+}
+
+@app.route('/admin/export/<dataset>')
+def admin_export(dataset):
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    return exporters.response(EXPORTS, dataset)
 
 @app.route('/patient_dashboard')
 def patient_dashboard():
@@ -1471,7 +1997,7 @@ def patient_dashboard():
     upcoming_appointment = next((a for a in appointments if a.get('status') in active_statuses), None)
     
     # 2. Billing: Calculate unpaid balance
-    invoices = get_patient_invoices(user_id)
+    invoices = get_patient_invoices(user_id, view='invoice_list')
     unpaid_balance = sum(float(inv['amount']) for inv in invoices if inv['status'] == 'unpaid' and not inv.get('insurance_claimed'))
     
     # 3. Vault Stats: Prescriptions & Results
@@ -1575,7 +2101,7 @@ def advance_status(appt_id):
             flash('Appointment not found', 'error')
             return redirect(url_for('doctor_dashboard'))
         
-        appt = deserialize_item(response['Item'])
+        appt = deserialize_item(response['Item'], APPOINTMENTS_TABLE)
         current_status = appt.get('status', 'BOOKED')
         
         # Define status progression
@@ -1589,13 +2115,24 @@ def advance_status(appt_id):
         new_status = status_flow.get(current_status)
         
         if new_status:
-            # Update status
-            appointments_table.update_item(
-                Key={'appointment_id': appt_id},
-                UpdateExpression='SET #s = :status_val',
-                ExpressionAttributeNames={'#s': 'status'},
-                ExpressionAttributeValues={':status_val': new_status}
-            )
+            # Conditional write: only one of two concurrent advances gets past the status it read
+            changed_at = get_current_datetime()
+            try:
+                appointments_table.update_item(
+                    Key={'appointment_id': appt_id},
+                    UpdateExpression='SET #s = :status_val, updated_at = :updated',
+                    ConditionExpression='#s = :current',
+                    ExpressionAttributeNames={'#s': 'status'},
+                    ExpressionAttributeValues={':status_val': new_status, ':current': current_status,
+                                               ':updated': changed_at}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                flash('Appointment was updated by someone else. Please try again.', 'info')
+                return redirect(url_for('doctor_dashboard'))
+            if new_status not in ACTIVE_APPOINTMENT_STATUSES:
+                adjust_department_load(appt.get('doctor_email'), -1)
             
             # If completing appointment, auto-generate invoice
             if new_status == 'COMPLETED':
@@ -1618,7 +2155,8 @@ def advance_status(appt_id):
                         patient_email=appt.get('patient_email'),  # Fixed: was 'patient_id'
                         status='COMPLETED',
                         appointment_id=appt_id,
-                        doctor_name=session.get('user_name', 'Doctor')
+                        doctor_name=session.get('user_name', 'Doctor'),
+                        changed_at=changed_at
                     )
                 else:
                     flash('Appointment completed but invoice generation failed', 'warning')
@@ -1628,7 +2166,8 @@ def advance_status(appt_id):
                     patient_email=appt.get('patient_email'),  # Fixed: was 'patient_id'
                     status=new_status,
                     appointment_id=appt_id,
-                    doctor_name=session.get('user_name', 'Doctor')
+                    doctor_name=session.get('user_name', 'Doctor'),
+                    changed_at=changed_at
                 )
         else:
             flash('Appointment already completed', 'info')
@@ -1720,8 +2259,14 @@ def doctor_patients_list():
 @app.route('/doctor/appointments')
 def doctor_appointments_list():
     if session.get('role') != 'doctor': return redirect(url_for('login'))
-    appointments = get_doctor_appointments(session['user_id'])
-    return render_template('doctor/appointments_list.html', appointments=appointments)
+    limit, start_key = pagination.request_page()
+    appointments, next_key = get_doctor_appointments_page(session['user_id'], limit, start_key,
+                                                          view='appointment_list')
+    for appt in appointments:
+        appt['id'] = appt.get('appointment_id')
+        appt['reason'] = appt.get('symptoms')
+    return render_template('doctor/appointments_list.html', appointments=appointments,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/doctor/vault/<patient_id>', methods=['GET', 'POST'])
 def doctor_view_vault(patient_id):
@@ -1936,8 +2481,10 @@ def patient_vault():
                 
             return redirect(url_for('patient_vault'))
     
-    vault_items = get_patient_vault(session['user_id'])
-    return render_template('patient/vault.html', records=vault_items)
+    limit, start_key = pagination.request_page()
+    vault_items, next_key = get_patient_vault_page(session['user_id'], limit, start_key)
+    return render_template('patient/vault.html', records=vault_items,
+                           **pagination.template_args(next_key, limit))
 
 @app.route('/patient_invoices')
 def patient_invoices():
@@ -1947,7 +2494,7 @@ def patient_invoices():
         return redirect(url_for('login'))
     
     user_id = session['user_id']
-    patient_invoices_list = get_patient_invoices(user_id)
+    patient_invoices_list = get_patient_invoices(user_id, view='invoice_list')
     
     # Calculate totals
     total_amount = sum(float(inv.get('amount', 0)) for inv in patient_invoices_list)
@@ -1970,12 +2517,17 @@ def pay_invoice(invoice_id):
     
     try:
         # Update invoice status to paid
-        invoices_table.update_item(
+        response = invoices_table.update_item(
             Key={'invoice_id': invoice_id},
             UpdateExpression="SET #s = :status_val",
             ExpressionAttributeNames={'#s': 'status'},
-            ExpressionAttributeValues={':status_val': 'paid'}
+            ExpressionAttributeValues={':status_val': 'paid'},
+            ReturnValues='ALL_OLD'
         )
+        previous = response.get('Attributes', {})
+        if previous.get('status') == 'unpaid':
+            amount = previous.get('amount', 0)
+            increment_metrics({'income': amount, 'pending_income': -amount})
         
         flash('Payment successful! Invoice marked as paid.', 'success')
         
@@ -2092,6 +2644,7 @@ def api_chat_send():
     if not msg_text: return jsonify({'status': 'error', 'message': 'Empty message'}), 400
 
     message_id = generate_id("MSG")
+    now = get_current_datetime()
     chat_item = {
         'message_id': message_id,
         'id': message_id, # Alias for frontend
@@ -2100,13 +2653,16 @@ def api_chat_send():
         'dept': dept,
         'message': msg_text,
         'reply': None,
-        'created_at': get_current_datetime(),
+        'created_at': now,
+        'updated_at': now,  # Sort key of the per-department change index
         'time': datetime.now().strftime('%H:%M'),
         'role': session.get('role', 'patient')
     }
     
     # Use the table directly to support custom schema (dept, reply)
     chat_messages_table.put_item(Item=chat_item)
+    versions.bump('chats', dept)
+    chat_broker.publish(dept, [deserialize_item(chat_item, CHAT_MESSAGES_TABLE)], now)
     return jsonify({'status': 'success'})
 
 @app.route('/api/doctor/reply', methods=['POST'])
@@ -2120,30 +2676,99 @@ def api_doctor_reply():
     if not chat_id or not reply_text: return jsonify({'status': 'error', 'message': 'Missing data'}), 400
     
     # Update logic
-    chat_messages_table.update_item(
+    now = get_current_datetime()
+    response = chat_messages_table.update_item(
         Key={'message_id': chat_id},
-        UpdateExpression="set reply = :r",
-        ExpressionAttributeValues={':r': reply_text}
+        UpdateExpression="set reply = :r, updated_at = :u",
+        ExpressionAttributeValues={':r': reply_text, ':u': now},
+        ReturnValues='ALL_NEW'
     )
+    item = response.get('Attributes', {})
+    versions.bump('chats', item.get('dept'))
+    if item.get('dept'):
+        chat_broker.publish(item['dept'], [deserialize_item(item, CHAT_MESSAGES_TABLE)], now)
     return jsonify({'status': 'success'})
 
+# Incremental polls re-read this much history before the cursor, so a write that
+# reached the (eventually consistent) index late is still picked up. Clients
+# merge messages by id, which makes the overlap harmless.
+CHAT_CURSOR_OVERLAP_SECONDS = 5
+
+def get_chat_changes(dept, since):
+    """Raw chat items in `dept` created or replied to after the ISO timestamp `since`"""
+    from datetime import timedelta
+    try:
+        since_dt = datetime.fromisoformat(since) - timedelta(seconds=CHAT_CURSOR_OVERLAP_SECONDS)
+        lower_bound = since_dt.isoformat()
+    except ValueError:
+        lower_bound = since
+    
+    params = {'ExpressionAttributeValues': {':since': lower_bound}}
+    if dept and dept != 'All':
+        params.update(
+            IndexName=CHAT_DEPT_INDEX,
+            KeyConditionExpression='dept = :dept AND updated_at > :since'
+        )
+        params['ExpressionAttributeValues'][':dept'] = dept
+        fetch = chat_messages_table.query
+    else:
+        params['FilterExpression'] = 'updated_at > :since'
+        fetch = chat_messages_table.scan
+    
+    response = fetch(**params)
+    items = response.get('Items', [])
+    while 'LastEvaluatedKey' in response:
+        response = fetch(ExclusiveStartKey=response['LastEvaluatedKey'], **params)
+        items.extend(response.get('Items', []))
+    return items
+
 @app.route('/api/chat/get')
+@collection_versions.conditional_get(versions, lambda: [('chats', None if request.args.get('dept') in (None, '', 'All') else request.args.get('dept'))])
 def api_chat_get():
     dept = request.args.get('dept')
+    since = request.args.get('since')  # Cursor from the previous poll (ISO timestamp)
     
-    # Scan all messages (Demo efficiency)
-    response = chat_messages_table.scan()
-    items = response.get('Items', [])
-    messages = [deserialize_item(i) for i in items]
+    if since:
+        # Incremental poll: O(new messages) via the per-department index
+        items = get_chat_changes(dept, since)
+    else:
+        # First load: full history (also covers messages written before the index existed)
+        response = chat_messages_table.scan()
+        items = response.get('Items', [])
+        # Filter by dept if provided
+        if dept and dept != 'All':
+            items = [i for i in items if i.get('dept') == dept]
     
-    # Filter by dept if provided
-    if dept and dept != 'All':
-        messages = [m for m in messages if m.get('dept') == dept]
+    cursor = max([since or ''] + [i.get('updated_at') or i.get('created_at') or '' for i in items]) \
+        or get_current_datetime()
+    messages = deserialize_items(items, CHAT_MESSAGES_TABLE)
         
     # Sort by time
-    messages.sort(key=lambda x: x.get('created_at', ''))
+    messages.sort(key=lambda x: str(x.get('created_at', '')))
+    
+    return jsonify({'status': 'success', 'messages': messages, 'cursor': cursor})
+
+@app.route('/api/chat/stream')
+def api_chat_stream():
+    """Server-Sent Events feed of new messages and replies for a department"""
+    if 'user_id' not in session: return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
     
-    return jsonify({'status': 'success', 'messages': messages})
+    dept = request.args.get('dept')
+    # The browser resends the last event id on reconnect; replay from there
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    
+    def replay():
+        if not since:
+            return [], since
+        items = get_chat_changes(dept, since)
+        cursor = max([since] + [i.get('updated_at') or i.get('created_at') or '' for i in items])
+        messages = sorted(deserialize_items(items, CHAT_MESSAGES_TABLE), key=lambda x: str(x.get('created_at', '')))
+        return messages, cursor
+    stream = chat_broker.open_stream(None if dept == 'All' else dept, replay)
+    if stream is None:
+        # Every stream slot is taken: a non-200 answer makes the page poll /api/chat/get
+        return jsonify({'status': 'error', 'message': 'Too many open streams'}), 503
+    return Response(stream, mimetype='text/event-stream', headers=chat_broker.SSE_HEADERS)
 
 # ============================================
 # AI ASSISTANT & MOOD APIs
@@ -2286,6 +2911,7 @@ def decline_request(request_id):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/appointment_request/list')
+@collection_versions.conditional_get(versions, lambda: [('appointment_requests', session.get('user_id'))])
 def list_appointment_requests():
     """Get appointment requests for the logged-in user"""
     if 'user_id' not in session:
@@ -2329,10 +2955,9 @@ def debug_data():
     try:
         # Check if using DynamoDB boto3 Table resource
         if hasattr(appointments_table, 'scan'):
-            response = appointments_table.scan()
-            raw_appts = response.get('Items', [])
+            raw_appts = parallel_scan.scan_all(appointments_table)
             # Deserialize decimals if needed
-            raw_appts = [deserialize_item(a) for a in raw_appts]
+            raw_appts = deserialize_items(raw_appts, APPOINTMENTS_TABLE)
         # Check if using simple list (fallback)
         elif isinstance(appointments_table, list):
             raw_appts = appointments_table
@@ -2369,13 +2994,22 @@ def debug_data():
         'visibility_analysis': analysis
     })
 
+if __name__ != '__main__':
+    # Served by gunicorn / waitress: populate the registry at boot, off the request path
+    preload_subscription_registry()
+    startup_profiler.finish('aws_setup')
+
 if __name__ == '__main__':
     print("--- MedTrack AWS Setup Complete ---")
     print("Initializing DynamoDB Tables...")
-    try:
-        create_tables()
-    except Exception as e:
-        print(f"Warning: Could not create tables (Check AWS Credentials): {e}")
+    with startup_profiler.phase('table_check'):
+        try:
+            create_tables()
+        except Exception as e:
+            print(f"Warning: Could not create tables (Check AWS Credentials): {e}")
+    with startup_profiler.phase('subscriptions'):
+        load_subscription_registry()
+    startup_profiler.finish('aws_setup')
 
     print("Starting MedTrack Server with AWS Integration...")
     print(f"Server started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
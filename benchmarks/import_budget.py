@@ -0,0 +1,80 @@
+"""
+Startup import budget check.
+
+Imports the app in a fresh interpreter with `-X importtime`, prints the
+slowest imports and fails (exit 1) if the total exceeds the budget or if
+scikit-learn/TensorFlow were imported eagerly at startup.
+
+    python benchmarks/import_budget.py                      # checks app.py
+    python benchmarks/import_budget.py --module aws_setup --budget-ms 1500
+    MEDTRACK_IMPORT_BUDGET_MS=800 python benchmarks/import_budget.py --top 25
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('sklearn', 'tensorflow', 'keras', 'joblib')
+
+PROBE = """
+import sys
+import {module}
+print('LOADED ' + ' '.join(sorted(name for name in {heavy!r} if name in sys.modules)))
+"""
+
+
+def parse_importtime(stderr):
+    """Returns [(cumulative_us, self_us, module)] from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            rows.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))  # nesting = extra indent
+        except ValueError:
+            continue
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('MEDTRACK_IMPORT_BUDGET_MS', 2000)))
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ, MEDTRACK_ML_PRELOAD='off')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             PROBE.format(module=args.module, heavy=HEAVY_MODULES)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        print(f"FAIL: importing {args.module} raised")
+        return 1
+
+    rows = parse_importtime(result.stderr)
+    top_level = [row for row in rows if not row[2].startswith(' ')]
+    total_ms = sum(cumulative for cumulative, _, _ in top_level) / 1000.0
+    loaded = [line for line in result.stdout.splitlines() if line.startswith('LOADED')][-1].split()[1:]
+
+    print(f"Importing {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print("Slowest imports (cumulative):")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000.0:9.1f} ms  {self_us / 1000.0:8.1f} ms self  {name.strip()}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f"FAIL: startup imports took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+End-to-end load test for aws_setup.app and app.app (offline, in-process).
+
+Seeds patients, doctors, appointments, invoices, vault records and chat
+messages, then runs concurrent virtual users through the Flask test client
+with a role mix:
+- patients load dashboards and invoices and poll chat with ETags;
+- doctors open dashboards and advance their queues;
+- admins view the overview pages.
+
+Reports throughput and p50/p95/p99 latency per route, with backend calls
+per request (from the X-Backend-Calls header, see request_accounting.py).
+Results are written as JSON; --baseline compares against an earlier run.
+
+Storage:
+- aws_setup runs on LocalStorage (--backend local), or on moto's in-memory
+  DynamoDB (--backend moto, needs `pip install moto`).
+- app.py always runs on the in-memory database.py (MEDTRACK_DB=memory);
+  its DynamoDB adapter does not implement the chat and mood API the
+  routes use.
+
+    python benchmarks/load_test.py --app aws_setup --patients 200 --concurrency 16 --duration 30
+    python benchmarks/load_test.py --app both --mix patient=6,doctor=3,admin=1 --output results.json
+    python benchmarks/load_test.py --baseline results.json --output results-new.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import platform
+import tempfile
+import threading
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEPARTMENTS = ['Cardiology', 'Dermatology', 'General Medicine', 'Pediatrics', 'Orthopedics']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        role, _, weight = item.partition('=')
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # route -> list of (ms, status, backend calls)
+
+    def add(self, route, ms, status, backend_calls):
+        with self.lock:
+            self.samples.setdefault(route, []).append((ms, status, backend_calls))
+
+    def summary(self, elapsed):
+        routes = {}
+        total = errors = 0
+        for route, samples in sorted(self.samples.items()):
+            latencies = [s[0] for s in samples]
+            failed = sum(1 for s in samples if s[1] >= 500)
+            calls = [s[2] for s in samples if s[2] is not None]
+            total += len(samples)
+            errors += failed
+            routes[route] = {
+                'requests': len(samples),
+                'errors': failed,
+                'rps': round(len(samples) / elapsed, 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'backend_calls_per_request': round(sum(calls) / len(calls), 2) if calls else None
+            }
+        return {'requests': total, 'errors': errors, 'elapsed_s': round(elapsed, 3),
+                'throughput_rps': round(total / elapsed, 2), 'routes': routes}
+
+
+def timed_request(recorder, client, route, method, url, **kwargs):
+    started = time.perf_counter()
+    response = client.open(url, method=method, **kwargs)
+    ms = (time.perf_counter() - started) * 1000
+    calls = response.headers.get('X-Backend-Calls')
+    recorder.add(route, ms, response.status_code, int(calls) if calls is not None else None)
+    return response
+
+
+# --- aws_setup ---
+
+def seed_aws_setup(aws_setup, args, rng):
+    doctors, patients, appointments = [], [], {}
+    for i in range(args.doctors):
+        email = f"doctor{i}@load.test"
+        aws_setup.create_doctor(email, 'load-pass', f'Dr. Load {i}', f'90000{i:05d}',
+                                DEPARTMENTS[i % len(DEPARTMENTS)], f'LIC-{i}')
+        doctors.append(email)
+    for i in range(args.patients):
+        email = f"patient{i}@load.test"
+        aws_setup.create_patient(email, 'load-pass', f'Patient {i}', f'80000{i:05d}', 'Load Street',
+                                 '1990-01-01', 'O+')
+        patients.append(email)
+        for j in range(args.appointments_per_patient):
+            doctor = rng.choice(doctors)
+            appt_id = aws_setup.create_appointment(email, doctor, f"2030-{1 + j % 12:02d}-{1 + i % 28:02d}T10:00",
+                                                   f'load visit {j}')
+            if appt_id:
+                appointments.setdefault(doctor, []).append(appt_id)
+                aws_setup.create_invoice(email, appt_id, 500, 'Consultation Fee')
+        for j in range(args.records_per_patient):
+            aws_setup.add_to_medical_vault(email, f'report_{i}_{j}.pdf', 'Report', f'uploads/report_{i}_{j}.pdf',
+                                           'Seeded report')
+
+    client = aws_setup.app.test_client()
+    for i in range(args.chat_messages):
+        with client.session_transaction() as sess:
+            sess.update(user_id=rng.choice(patients), role='patient', user_name='Load Patient')
+        client.post('/api/chat/send', json={'message': f'load message {i}', 'dept': rng.choice(DEPARTMENTS)})
+    return {'doctors': doctors, 'patients': patients, 'appointments': appointments}
+
+
+def aws_setup_user(role, aws_setup, data, rng):
+    """Returns (session dict, step function) for one virtual user."""
+    etags = {}
+
+    if role == 'patient':
+        email = rng.choice(data['patients'])
+        session = {'user_id': email, 'role': 'patient', 'user_name': 'Load Patient'}
+
+        def step(client, recorder):
+            choice = rng.random()
+            if choice < 0.5:
+                dept = rng.choice(DEPARTMENTS)
+                headers = {'If-None-Match': etags[dept]} if dept in etags else {}
+                response = timed_request(recorder, client, 'GET /api/chat/get', 'GET',
+                                         f'/api/chat/get?dept={dept}', headers=headers)
+                if response.headers.get('ETag'):
+                    etags[dept] = response.headers['ETag']
+            elif choice < 0.75:
+                timed_request(recorder, client, 'GET /patient_dashboard', 'GET', '/patient_dashboard')
+            elif choice < 0.9:
+                timed_request(recorder, client, 'GET /patient_invoices', 'GET', '/patient_invoices')
+            elif choice < 0.97:
+                timed_request(recorder, client, 'GET /patient_vault', 'GET', '/patient_vault')
+            else:
+                timed_request(recorder, client, 'POST /api/chat/send', 'POST', '/api/chat/send',
+                              json={'message': 'load poll message', 'dept': rng.choice(DEPARTMENTS)})
+        return session, step
+
+    if role == 'doctor':
+        email = rng.choice(data['doctors'])
+        session = {'user_id': email, 'role': 'doctor', 'user_name': 'Dr. Load'}
+        queue = list(data['appointments'].get(email, []))
+
+        def step(client, recorder):
+            choice = rng.random()
+            if choice < 0.4:
+                timed_request(recorder, client, 'GET /doctor_dashboard', 'GET', '/doctor_dashboard')
+            elif choice < 0.7 and queue:
+                timed_request(recorder, client, 'GET /advance_status/<appt_id>', 'GET',
+                              f'/advance_status/{rng.choice(queue)}')
+            elif choice < 0.85:
+                timed_request(recorder, client, 'GET /doctor/appointments', 'GET', '/doctor/appointments')
+            else:
+                timed_request(recorder, client, 'GET /api/chat/get', 'GET', '/api/chat/get?dept=All')
+        return session, step
+
+    session = {'user_id': 'admin', 'role': 'admin', 'user_name': 'Load Admin'}
+
+    def step(client, recorder):
+        choice = rng.random()
+        if choice < 0.5:
+            timed_request(recorder, client, 'GET /admin_dashboard', 'GET', '/admin_dashboard')
+        elif choice < 0.75:
+            timed_request(recorder, client, 'GET /admin/appointments', 'GET', '/admin/appointments')
+        else:
+            timed_request(recorder, client, 'GET /admin/patients', 'GET', '/admin/patients')
+    return session, step
+
+
+# --- app.py (in-memory database.py) ---
+
+def seed_app(app_module, args, rng):
+    database = app_module.database
+    doctors = sorted(database.doctors_db)
+    patients, appointments = [], {}
+    for i in range(args.patients):
+        email, patient_id = f"patient{i}@load.test", f"lp{i}"
+        database.users[email] = {'id': patient_id, 'name': f'Patient {i}', 'email': email,
+                                 'password': 'load-pass', 'role': 'patient'}
+        patients.append(patient_id)
+        for j in range(args.appointments_per_patient):
+            doctor_id = rng.choice(doctors)
+            appt = database.create_appointment(patient_id, doctor_id, f"2030-{1 + j % 12:02d}-{1 + i % 28:02d}T10:00",
+                                               reason=f'load visit {j}')
+            appt_id = appt['id'] if isinstance(appt, dict) else appt
+            appointments.setdefault(doctor_id, []).append(appt_id)
+        for j in range(args.records_per_patient):
+            database.add_record(patient_id, f'report_{i}_{j}.pdf', 'Seeded report')
+        database.log_mood(patient_id, rng.randint(1, 5), 'seeded')
+    for i in range(args.chat_messages):
+        database.add_chat_message(f'Patient {i}', rng.choice(DEPARTMENTS), f'load message {i}')
+    return {'doctors': doctors, 'patients': patients, 'appointments': appointments}
+
+
+def app_user(role, app_module, data, rng):
+    etags = {}
+
+    if role == 'patient':
+        patient_id = rng.choice(data['patients'])
+        session = {'user_email': f"{patient_id}@load.test", 'user_id': patient_id,
+                   'user_role': 'patient', 'user_name': 'Load Patient'}
+
+        def step(client, recorder):
+            choice = rng.random()
+            if choice < 0.5:
+                dept = rng.choice(DEPARTMENTS)
+                headers = {'If-None-Match': etags[dept]} if dept in etags else {}
+                response = timed_request(recorder, client, 'GET /api/chat/get', 'GET',
+                                         f'/api/chat/get?dept={dept}', headers=headers)
+                if response.headers.get('ETag'):
+                    etags[dept] = response.headers['ETag']
+            elif choice < 0.75:
+                timed_request(recorder, client, 'GET /patient/dashboard', 'GET', '/patient/dashboard')
+            elif choice < 0.9:
+                timed_request(recorder, client, 'GET /patient/invoices', 'GET', '/patient/invoices')
+            else:
+                timed_request(recorder, client, 'GET /api/mood/history', 'GET', '/api/mood/history')
+        return session, step
+
+    if role == 'doctor':
+        doctor_id = rng.choice(data['doctors'])
+        session = {'user_email': f"{doctor_id}@load.test", 'user_id': doctor_id,
+                   'user_role': 'doctor', 'user_name': 'Dr. Load'}
+        queue = list(data['appointments'].get(doctor_id, []))
+
+        def step(client, recorder):
+            choice = rng.random()
+            if choice < 0.4:
+                timed_request(recorder, client, 'GET /doctor/dashboard', 'GET', '/doctor/dashboard')
+            elif choice < 0.7 and queue:
+                timed_request(recorder, client, 'GET /doctor/advance/<appt_id>', 'GET',
+                              f'/doctor/advance/{rng.choice(queue)}')
+            else:
+                timed_request(recorder, client, 'GET /doctor/my_appointments', 'GET', '/doctor/my_appointments')
+        return session, step
+
+    session = {'user_email': 'admin@example.com', 'user_id': 'admin', 'user_role': 'admin',
+               'user_name': 'Load Admin'}
+
+    def step(client, recorder):
+        if rng.random() < 0.6:
+            timed_request(recorder, client, 'GET /admin/dashboard', 'GET', '/admin/dashboard')
+        else:
+            timed_request(recorder, client, 'GET /admin/manage/appointments', 'GET', '/admin/manage/appointments')
+    return session, step
+
+
+# --- Runner ---
+
+def run_load(flask_app, make_user, data, args, seed):
+    recorder = Recorder()
+    mix = parse_mix(args.mix)
+    roles, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + args.duration
+    budget = [args.requests] if args.requests else None
+    budget_lock = threading.Lock()
+
+    def virtual_user(index):
+        rng = random.Random(seed + index)
+        role = rng.choices(roles, weights)[0]
+        session, step = make_user(role, data, rng)
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(session)
+        while time.perf_counter() < deadline:
+            if budget is not None:
+                with budget_lock:
+                    if budget[0] <= 0:
+                        return
+                    budget[0] -= 1
+            step(client, recorder)
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - started)
+
+
+def print_summary(name, result, baseline=None):
+    print(f"\n{name}: {result['requests']} requests in {result['elapsed_s']}s = {result['throughput_rps']} req/s, "
+          f"{result['errors']} errors")
+    print(f"  {'route':<34} {'n':>6} {'5xx':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'calls':>6}  vs baseline p95")
+    for route, stats in result['routes'].items():
+        delta = ''
+        previous = (baseline or {}).get('routes', {}).get(route)
+        if previous and previous['p95_ms']:
+            delta = f"{(stats['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100:+.1f}%"
+        calls = stats['backend_calls_per_request']
+        print(f"  {route:<34} {stats['requests']:>6} {stats['errors']:>5} {stats['p50_ms']:>7.2f}ms {stats['p95_ms']:>7.2f}ms "
+              f"{stats['p99_ms']:>7.2f}ms {calls if calls is not None else '-':>6}  {delta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=['aws_setup', 'app', 'both'], default='both')
+    parser.add_argument('--backend', choices=['local', 'moto'], default='local', help='storage for aws_setup')
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--doctors', type=int, default=10)
+    parser.add_argument('--appointments-per-patient', type=int, default=3)
+    parser.add_argument('--records-per-patient', type=int, default=2)
+    parser.add_argument('--chat-messages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per app')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests (0 = duration only)')
+    parser.add_argument('--mix', default='patient=6,doctor=3,admin=1')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--baseline', help='earlier --output file to compare p95 against')
+    args = parser.parse_args()
+
+    # Everything local and throwaway: must be set before the app modules are imported
+    workdir = tempfile.mkdtemp(prefix='medtrack_load_')
+    os.environ.update({
+        'MEDTRACK_SNS': 'local',
+        'MEDTRACK_DB': 'memory',
+        'MEDTRACK_LOCAL_DATA_DIR': workdir,
+        'MEDTRACK_OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'MEDTRACK_VERSION_DIR': os.path.join(workdir, 'versions'),
+        'MEDTRACK_METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'MEDTRACK_PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'MEDTRACK_REQUEST_ACCOUNTING': 'headers',
+    })
+    mock = None
+    if args.backend == 'moto':
+        try:
+            from moto import mock_aws
+        except ImportError:
+            try:
+                from moto import mock_dynamodb as mock_aws
+            except ImportError:
+                sys.exit("--backend moto needs moto (pip install moto)")
+        os.environ.update({'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                           'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_REGION': 'us-east-1'})
+        mock = mock_aws()
+        mock.start()
+    else:
+        os.environ['MEDTRACK_STORAGE'] = 'local'
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.ERROR)  # 5xx are counted per route instead of logged
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {
+        'config': vars(args),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'started_at': time.time(),
+        'apps': {}
+    }
+    quiet = io.StringIO()  # the apps print debug output on every request
+    try:
+        if args.app in ('aws_setup', 'both'):
+            with contextlib.redirect_stdout(quiet):
+                import aws_setup
+                if mock is not None:
+                    aws_setup.create_tables()
+                data = seed_aws_setup(aws_setup, args, random.Random(args.seed))
+                aws_setup.notification_outbox.flush(30)
+                result = run_load(aws_setup.app, lambda role, d, rng: aws_setup_user(role, aws_setup, d, rng),
+                                  data, args, args.seed)
+            results['apps']['aws_setup'] = result
+            print_summary(f"aws_setup ({args.backend})", result, (baseline or {}).get('apps', {}).get('aws_setup'))
+
+        if args.app in ('app', 'both'):
+            with contextlib.redirect_stdout(quiet):
+                import app as app_module
+                data = seed_app(app_module, args, random.Random(args.seed))
+                result = run_load(app_module.app, lambda role, d, rng: app_user(role, app_module, d, rng),
+                                  data, args, args.seed)
+            results['apps']['app'] = result
+            print_summary("app (in-memory)", result, (baseline or {}).get('apps', {}).get('app'))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults: {args.output}  (scratch data: {workdir})")
+
+
+if __name__ == '__main__':
+    main()
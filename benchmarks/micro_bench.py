@@ -0,0 +1,311 @@
+"""
+Micro-benchmarks for the storage and ML hot paths.
+
+Each case runs a few warm-up calls, then `--repeat` timed rounds of enough
+calls to fill about `--min-time` seconds. The result is the per-call
+min / median / mean. Peak memory comes from one extra call under
+tracemalloc, so tracing never slows the timed rounds.
+
+Suites:
+- storage:     LocalStorage put_item / get_item / update_item / scan / query,
+               on tables of each --sizes item count;
+- deserialize: aws_setup.deserialize_item on a typical appointment item;
+- symptoms:    MultimodalPredictor.predict, with growing symptom databases
+               and note lengths;
+- signal:      extract_features / apply_fft per batch size, and the
+               predict_*() one signal at a time vs predict_*_batch();
+- image:       predict_knn / predict_rf one image at a time vs *_batch().
+
+Results are JSON and tagged with the git commit; --baseline prints the
+change in median for every case the two runs share.
+
+    python benchmarks/micro_bench.py --output micro.json
+    python benchmarks/micro_bench.py --suite storage --sizes 1000,10000,100000
+    python benchmarks/micro_bench.py --quick --baseline micro.json --output micro-new.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ('storage', 'deserialize', 'symptoms', 'signal', 'image')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+
+    def run(self, name, fn, items=1):
+        """Times fn(); `items` is how many units one call handles (for per-item cost)."""
+        for _ in range(self.args.warmup):
+            fn()
+
+        # Calls per round: enough to fill --min-time, at least one
+        started = time.perf_counter()
+        fn()
+        single = max(time.perf_counter() - started, 1e-7)
+        number = max(1, min(self.args.max_number, int(self.args.min_time / single)))
+
+        rounds = []
+        for _ in range(self.args.repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            rounds.append((time.perf_counter() - started) / number)
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        median = percentile(rounds, 50)
+        self.results[name] = {
+            'calls_per_round': number,
+            'rounds': len(rounds),
+            'min_us': round(min(rounds) * 1e6, 3),
+            'median_us': round(median * 1e6, 3),
+            'mean_us': round(sum(rounds) / len(rounds) * 1e6, 3),
+            'per_item_us': round(median * 1e6 / items, 3),
+            'peak_kib': round(peak / 1024, 1)
+        }
+        print(f"  {name:<55} {median * 1e6:>12.1f} us   {peak / 1024:>10.1f} KiB peak")
+
+
+# --- storage ---
+
+def appointment(i, rng):
+    return {
+        'appointment_id': f"appt{i:07d}",
+        'patient_email': f"patient{i % 5000}@bench.test",
+        'doctor_email': f"doctor{i % 50}@bench.test",
+        'appointment_date': f"2030-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00",
+        'status': rng.choice(['BOOKED', 'CONFIRMED', 'COMPLETED']),
+        'dept': rng.choice(['Cardiology', 'Dermatology', 'Pediatrics']),
+        'reason': 'routine check-up',
+        'created_at': f"2029-12-{1 + i % 28:02d}T09:{i % 60:02d}:00"
+    }
+
+
+def bench_storage(bench, args, rng):
+    from local_storage import LocalStorage
+
+    for size in args.sizes:
+        print(f"storage ({size} items)")
+        table = LocalStorage('medtrack_appointments')
+        table.data = [appointment(i, rng) for i in range(size)]
+        table._save()
+        keys = [f"appt{rng.randrange(size):07d}" for _ in range(1000)]
+        counter = iter(range(size, size * 1000))
+
+        bench.run(f"storage.get_item[{size}]", lambda: table.get_item(Key={'appointment_id': rng.choice(keys)}))
+        bench.run(f"storage.put_item[{size}]", lambda: table.put_item(Item=appointment(next(counter), rng)))
+        bench.run(f"storage.update_item[{size}]", lambda: table.update_item(
+            Key={'appointment_id': rng.choice(keys)}, UpdateExpression='SET #s = :s',
+            ExpressionAttributeNames={'#s': 'status'}, ExpressionAttributeValues={':s': 'CONFIRMED'}))
+        bench.run(f"storage.scan[{size}]", lambda: table.scan(), items=size)
+        bench.run(f"storage.scan_filtered[{size}]", lambda: table.scan(
+            FilterExpression='dept = :d', ExpressionAttributeValues={':d': 'Cardiology'}), items=size)
+        bench.run(f"storage.query[{size}]", lambda: table.query(
+            KeyConditionExpression='doctor_email = :e AND appointment_date > :t',
+            ExpressionAttributeValues={':e': 'doctor7@bench.test', ':t': '2030-06'}), items=size)
+
+
+# --- deserialize ---
+
+def bench_deserialize(bench, args, rng):
+    from decimal import Decimal
+    with contextlib.redirect_stdout(io.StringIO()):
+        import aws_setup
+
+    print("deserialize")
+    item = dict(appointment(1, rng), fee=Decimal('500'), rating=Decimal('4.5'),
+                notes='Patient reports mild headache', token_number=Decimal('12'),
+                symptoms='Tightness in chest, Tired after meals', patient_name='Tara Thomas',
+                file_name='ECG_Trace.pdf', updated_at='2029-12-02T09:30:00')
+    items = [dict(item, appointment_id=f"appt{i:07d}") for i in range(1000)]
+    bench.run("deserialize_item[single]", lambda: aws_setup.deserialize_item(item))
+    bench.run("deserialize_item[list of 1000]",
+              lambda: [aws_setup.deserialize_item(i) for i in items], items=len(items))
+    if hasattr(aws_setup, 'deserialize_items'):
+        table = aws_setup.APPOINTMENTS_TABLE
+        bench.run("deserialize_item[single, table schema]", lambda: aws_setup.deserialize_item(item, table))
+        bench.run("deserialize_items[page of 1000, table schema]",
+                  lambda: aws_setup.deserialize_items(items, table), items=len(items))
+
+
+# --- symptoms ---
+
+def bench_symptoms(bench, args, rng):
+    from ml_engine import MultimodalPredictor
+
+    print("symptoms")
+    vocabulary = [f"symptom{i}" for i in range(5000)]
+    for diseases in (len(MultimodalPredictor().symptom_db), 200, 2000):
+        predictor = MultimodalPredictor()
+        for i in range(diseases - len(predictor.symptom_db)):
+            predictor.symptom_db[f"Condition {i}"] = rng.sample(vocabulary, 6)
+        for words in (10, 200, 2000):
+            note = ' '.join(rng.choice(vocabulary) for _ in range(words))
+            bench.run(f"symptoms.predict[{diseases} diseases, {words} words]",
+                      lambda: predictor.predict(note, 'scan.png'))
+
+
+# --- signal ---
+
+def bench_signal(bench, args, rng):
+    import numpy as np
+    from signal_diagnostic import SignalDiagnosticEngine, SKLEARN_AVAILABLE
+
+    print("signal")
+    engine = SignalDiagnosticEngine(model_dir=os.path.join(args.workdir, 'signal_models'))
+    for batch in args.batch_sizes:
+        signals, _ = engine.generate_synthetic_data(n_samples=batch, length=100)
+        signals = np.asarray(signals)
+        bench.run(f"signal.extract_features[batch {batch}]", lambda: engine.extract_features(signals), items=batch)
+        bench.run(f"signal.apply_fft[batch {batch}]", lambda: engine.apply_fft(signals), items=batch)
+
+    if not SKLEARN_AVAILABLE:
+        print("  (scikit-learn not installed: skipping predict_*)")
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.train_simple_model()
+        engine.train_intermediate_model()
+    signals, _ = engine.generate_synthetic_data(n_samples=max(args.batch_sizes), length=100)
+    signals = np.asarray(signals)
+    for kind in ('simple', 'intermediate'):
+        single = getattr(engine, f"predict_{kind}")
+        batched = getattr(engine, f"predict_{kind}_batch")
+        bench.run(f"signal.predict_{kind}[loop of {len(signals)}]",
+                  lambda: [single(s) for s in signals], items=len(signals))
+        bench.run(f"signal.predict_{kind}_batch[{len(signals)}]", lambda: batched(signals), items=len(signals))
+
+
+# --- image ---
+
+def bench_image(bench, args, rng):
+    import numpy as np
+    from image_diagnostic import ImageDiagnosticEngine, SKLEARN_AVAILABLE
+
+    if not SKLEARN_AVAILABLE:
+        print("image: scikit-learn not installed, skipped")
+        return
+    print("image")
+    engine = ImageDiagnosticEngine(model_dir=os.path.join(args.workdir, 'image_models'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.train_knn()
+        engine.train_rf_with_pca()
+    images, _ = engine.generate_synthetic_data(n_samples=args.images)
+    for kind in ('knn', 'rf'):
+        single = getattr(engine, f"predict_{kind}")
+        batched = getattr(engine, f"predict_{kind}_batch")
+        bench.run(f"image.predict_{kind}[loop of {len(images)}]",
+                  lambda: [single(img) for img in images], items=len(images))
+        bench.run(f"image.predict_{kind}_batch[{len(images)}]", lambda: batched(images), items=len(images))
+
+
+# --- reporting ---
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print(f"\nvs baseline ({baseline.get('commit') or 'unknown commit'}):")
+    for name, current in results.items():
+        before = baseline.get('cases', {}).get(name)
+        if not before or not before['median_us']:
+            continue
+        change = (current['median_us'] - before['median_us']) / before['median_us'] * 100
+        print(f"  {name:<55} {before['median_us']:>12.1f} -> {current['median_us']:>12.1f} us  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', default=','.join(SUITES), help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument('--sizes', default='1000,10000,100000', help='LocalStorage table sizes')
+    parser.add_argument('--batch-sizes', default='1,32,256,1024', help='signal batch sizes')
+    parser.add_argument('--images', type=int, default=32, help='images per predict_* case')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timed round')
+    parser.add_argument('--max-number', type=int, default=10000, help='calls per round at most')
+    parser.add_argument('--quick', action='store_true', help='small sizes, 1 warm-up, 3 rounds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='micro_bench_results.json')
+    parser.add_argument('--baseline', help='earlier --output file to compare medians against')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes, args.batch_sizes = '1000,10000', '1,32,256'
+        args.warmup, args.repeat, args.min_time = 1, 3, 0.05
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+    args.batch_sizes = [int(s) for s in args.batch_sizes.split(',') if s]
+    suites = [s.strip() for s in args.suite.split(',') if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    # Throwaway storage, no AWS: must be set before the app modules are imported
+    args.workdir = tempfile.mkdtemp(prefix='medtrack_micro_')
+    os.environ.update({
+        'MEDTRACK_STORAGE': 'local',
+        'MEDTRACK_SNS': 'local',
+        'MEDTRACK_LOCAL_DATA_DIR': args.workdir,
+        'MEDTRACK_OUTBOX_PATH': os.path.join(args.workdir, 'outbox.sqlite3'),
+        'MEDTRACK_VERSION_DIR': os.path.join(args.workdir, 'versions'),
+        'MEDTRACK_METRICS_DIR': os.path.join(args.workdir, 'metrics'),
+        'MEDTRACK_PROFILE_DIR': os.path.join(args.workdir, 'profiles'),
+        'MEDTRACK_ML_PRELOAD': 'off',
+    })
+    sys.path.insert(0, ROOT)
+
+    bench = Bench(args)
+    rng = random.Random(args.seed)
+    runners = {'storage': bench_storage, 'deserialize': bench_deserialize, 'symptoms': bench_symptoms,
+               'signal': bench_signal, 'image': bench_image}
+    for suite in suites:
+        runners[suite](bench, args, rng)
+
+    config = {k: v for k, v in vars(args).items() if k != 'workdir'}
+    output = {
+        'commit': git_commit(),
+        'config': config,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'finished_at': time.time(),
+        'cases': bench.results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(bench.results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
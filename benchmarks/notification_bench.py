@@ -0,0 +1,132 @@
+"""
+Notification throughput benchmark (offline).
+
+Books appointments and walks them through the status flow via aws_setup's
+Flask routes, with LocalStorage and the local SNS stand-in (local_sns.py),
+then waits for the notification outbox to drain. Reports request latency
+(which should not include SNS latency), drain time, SNS API calls and how
+well the outbox batched and retried.
+
+    python benchmarks/notification_bench.py --appointments 200 --latency-ms 80 --throttle-rate 0.05
+    python benchmarks/notification_bench.py --max-tps 20 --backoff-base 0.2 --batch-size 5
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(name, samples_ms):
+    print(f"  {name:<18} n={len(samples_ms):<5} p50={percentile(samples_ms, 50):7.2f}ms "
+          f"p95={percentile(samples_ms, 95):7.2f}ms max={max(samples_ms or [0]):7.2f}ms")
+
+
+def timed(samples, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='latency added to every SNS call')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='chance an SNS call is throttled')
+    parser.add_argument('--max-tps', type=float, default=0.0, help='SNS calls per second before throttling')
+    parser.add_argument('--batch-size', type=int, default=10, help='outbox publish_batch size (max 10)')
+    parser.add_argument('--backoff-base', type=float, default=0.2, help='outbox backoff base in seconds')
+    parser.add_argument('--linger-ms', type=float, default=50.0, help='outbox batching window')
+    parser.add_argument('--coalesce-seconds', type=float, default=1.0,
+                        help='window in which status notifications collapse (0 disables)')
+    parser.add_argument('--drain-timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    # Everything local and throwaway: must be set before the app modules are imported
+    workdir = tempfile.mkdtemp(prefix='medtrack_bench_')
+    os.environ.update({
+        'MEDTRACK_STORAGE': 'local',
+        'MEDTRACK_SNS': 'local',
+        'MEDTRACK_LOCAL_DATA_DIR': workdir,
+        'MEDTRACK_OUTBOX_PATH': os.path.join(workdir, 'outbox.sqlite3'),
+        'MEDTRACK_VERSION_DIR': os.path.join(workdir, 'versions'),
+        'MEDTRACK_LOCAL_SNS_LATENCY_MS': str(args.latency_ms),
+        'MEDTRACK_LOCAL_SNS_THROTTLE_RATE': str(args.throttle_rate),
+        'MEDTRACK_LOCAL_SNS_MAX_TPS': str(args.max_tps),
+    })
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)
+
+    import notification_outbox
+    import local_sns
+    import aws_setup
+
+    notification_outbox.BATCH_SIZE = min(args.batch_size, local_sns.MAX_BATCH_ENTRIES)
+    notification_outbox.BACKOFF_BASE_SECONDS = args.backoff_base
+    notification_outbox.LINGER_SECONDS = args.linger_ms / 1000.0
+    notification_outbox.COALESCE_WINDOW_SECONDS = args.coalesce_seconds
+    outbox = aws_setup.notification_outbox
+    sns = local_sns.get_client()
+
+    doctor_email, patient_email = 'bench.doctor@example.com', 'bench.patient@example.com'
+    aws_setup.create_doctor(doctor_email, 'bench-pass', 'Bench Doctor', '9000000000', 'Cardiology', 'LIC-1')
+    aws_setup.create_patient(patient_email, 'bench-pass', 'Bench Patient', '9000000001', 'Bench Street',
+                             '1990-01-01', 'O+')
+    outbox.flush(args.drain_timeout)
+    sns.reset()
+
+    client = aws_setup.app.test_client()
+    booking_ms, advance_ms = [], []
+    started = time.perf_counter()
+
+    with client.session_transaction() as sess:
+        sess.update(user_id=patient_email, role='patient', user_name='Bench Patient')
+    for i in range(args.appointments):
+        timed(booking_ms, client.post, '/book_appointment', data={
+            'doctor_email': doctor_email,
+            'appointment_date': f"2030-01-{1 + i % 28:02d}T10:00",
+            'symptoms': f'benchmark visit {i}'
+        })
+
+    appointment_ids = [item['appointment_id'] for item in aws_setup.appointments_table.scan()['Items']
+                       if item.get('patient_email') == patient_email]
+
+    with client.session_transaction() as sess:
+        sess.update(user_id=doctor_email, role='doctor', user_name='Bench Doctor')
+    for appt_id in appointment_ids:
+        for _ in range(4):  # BOOKED -> CONFIRMED -> CHECKED-IN -> CONSULTING -> COMPLETED
+            timed(advance_ms, client.get, f'/advance_status/{appt_id}')
+
+    requests_done = time.perf_counter()
+    drained = outbox.flush(args.drain_timeout)
+    finished = time.perf_counter()
+
+    counters = sns.snapshot()
+    api_calls = counters['publish'] + counters['publish_batch']
+    print(f"Notification benchmark: {len(appointment_ids)} appointments, SNS latency {args.latency_ms}ms, "
+          f"throttle rate {args.throttle_rate}, max tps {args.max_tps or 'unlimited'}")
+    print("Request latency:")
+    summarize('book_appointment', booking_ms)
+    summarize('advance_status', advance_ms)
+    print(f"Requests finished in {requests_done - started:.2f}s; outbox "
+          f"{'drained' if drained else 'NOT drained'} {finished - requests_done:.2f}s later")
+    print(f"SNS: {counters['messages']} messages in {api_calls} publish calls "
+          f"({counters['publish_batch']} batched, {counters['messages'] / max(api_calls, 1):.1f} msg/call), "
+          f"{counters['subscribe']} subscribe, {counters['throttled']} throttled")
+    print(f"Outbox: {outbox.stats}")
+    print(f"Scratch data: {workdir}")
+
+
+if __name__ == '__main__':
+    main()
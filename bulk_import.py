@@ -0,0 +1,294 @@
+"""
+Bulk import for clinic onboarding (doctors, patients, historical appointments).
+
+    python bulk_import.py doctors doctors.csv
+    python bulk_import.py patients patients.jsonl --workers 8
+    python bulk_import.py appointments history.csv --notify
+
+Rows come from CSV (header row) or JSONL, with the same fields as the
+registration forms / create_* functions in aws_setup.py. Compared with
+calling create_patient per row:
+
+- passwords are hashed (pbkdf2:sha256, CPU-bound) in a process pool;
+- items are written with batch_writer, 25 per BatchWriteItem, and a
+  batch that still fails after botocore's own retries (throttling) is
+  retried with backoff. Puts are idempotent, so re-sending is safe;
+- SNS is left alone: no per-row publish or subscribe. Patients are
+  subscribed by the outbox worker before their first email, or straight
+  away with --subscribe. --notify queues one summary notification;
+- dashboard counters get one increment at the end.
+
+Rows are streamed in batches of BATCH_ROWS, so the file is never loaded
+whole. Existing doctors / patients are skipped, as create_* does
+(--overwrite replaces them). Appointments without an appointment_id get
+a new one, so re-running an appointment file duplicates it.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from botocore.exceptions import ClientError
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger("MedTrack-Import")
+
+BATCH_ROWS = 500
+WRITE_ATTEMPTS = 5
+RETRYABLE_ERRORS = {'ProvisionedThroughputExceededException', 'ThrottlingException',
+                    'RequestLimitExceeded', 'InternalServerError'}
+
+# kind -> aws_setup table attribute, key, fields a row must have
+KINDS = {
+    'doctors': ('doctors_table', 'email', ['email', 'password', 'name']),
+    'patients': ('patients_table', 'email', ['email', 'password', 'name']),
+    'appointments': ('appointments_table', 'appointment_id', ['patient_email', 'doctor_email', 'appointment_date'])
+}
+
+
+def hash_password(password):
+    """Same hash as create_patient / create_doctor (runs in the worker processes)."""
+    return generate_password_hash(password.strip(), method='pbkdf2:sha256')
+
+
+def read_rows(path, fmt=None):
+    """Yields dict rows from a CSV or JSONL file (format from the extension unless given)."""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {(k or '').strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    logger.error(f"{path}:{line_no}: skipping malformed JSON ({e})")
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def doctor_item(row, now):
+    return {
+        'email': row['email'].strip().lower(),
+        'name': row['name'],
+        'phone': row.get('phone') or '',
+        'specialization': row.get('specialization') or '',
+        'license_number': row.get('license_number') or '',
+        'role': 'doctor',
+        'status': row.get('status') or 'available',
+        'created_at': row.get('created_at') or now
+    }
+
+
+def patient_item(row, now):
+    return {
+        'email': row['email'].strip().lower(),
+        'name': row['name'],
+        'phone': row.get('phone') or '',
+        'address': row.get('address') or '',
+        'dob': row.get('dob') or '',
+        'blood_group': row.get('blood_group') or '',
+        'role': 'patient',
+        'created_at': row.get('created_at') or now,
+        'mood_history': []
+    }
+
+
+def appointment_item(row, now, generate_id):
+    return {
+        'appointment_id': row.get('appointment_id') or generate_id("APPT"),
+        'patient_email': row['patient_email'].strip().lower(),
+        'doctor_email': row['doctor_email'].strip().lower(),
+        'appointment_date': row['appointment_date'],
+        'symptoms': row.get('symptoms') or '',
+        'priority': row.get('priority') or 'normal',
+        'status': row.get('status') or 'BOOKED',
+        'diagnosis': row.get('diagnosis') or '',
+        'prescription': row.get('prescription') or '',
+        'created_at': row.get('created_at') or now,
+        'updated_at': row.get('updated_at') or now
+    }
+
+
+def write_items(table, items, key):
+    """batch_writer puts, re-sending the whole batch if DynamoDB keeps throttling it."""
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            # BatchWriter itself re-queues UnprocessedItems until they are written
+            with table.batch_writer(overwrite_by_pkeys=[key]) as writer:
+                for item in items:
+                    writer.put_item(Item=item)
+            return
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in RETRYABLE_ERRORS or attempt == WRITE_ATTEMPTS - 1:
+                raise
+            delay = 0.2 * 2 ** attempt
+            logger.warning(f"Batch write throttled ({code}); retrying {len(items)} items in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _add(deltas, field, delta):
+    deltas[field] = deltas.get(field, 0) + delta
+
+
+def import_rows(kind, rows, workers=None, overwrite=False, subscribe=False, notify=False, dry_run=False):
+    """Imports `rows` of `kind` into aws_setup's tables; returns counts.
+
+    Counter deltas cover only keys that did not exist before; a replaced
+    doctor moves its specialization count, a replaced appointment its
+    department load.
+    """
+    import aws_setup  # builds the tables; kept out of the worker processes
+    import parallel_scan
+
+    table_attr, key, required = KINDS[kind]
+    table = getattr(aws_setup, table_attr)
+    counts = {'read': 0, 'written': 0, 'replaced': 0, 'existing': 0, 'invalid': 0}
+    deltas = {}
+    imported_emails = []
+    moved_doctors = {}  # email -> (old, new) specialization, for their active appointments
+
+    # key -> what the counters currently hold for it (specialization / (doctor, status))
+    previous = {}
+    if kind == 'doctors':
+        previous = {d['email']: d.get('specialization') or 'General' for d in
+                    parallel_scan.scan(table, **aws_setup.projection('metrics_doctor'))}
+    elif kind == 'patients':
+        previous = {item['email']: True for item in
+                    parallel_scan.scan(table, **aws_setup.projection('key_only_email'))}
+    specialization = {}
+    if kind == 'appointments':
+        specialization = {d['email']: d.get('specialization') or 'General' for d in
+                          parallel_scan.scan(aws_setup.doctors_table, **aws_setup.projection('metrics_doctor'))}
+    appointments_loaded = False
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if kind != 'appointments' else None
+    try:
+        for batch in _batches(rows, BATCH_ROWS):
+            now = aws_setup.get_current_datetime()
+            items, passwords, batch_keys = [], [], set()
+            for row in batch:
+                counts['read'] += 1
+                missing = [field for field in required if not str(row.get(field) or '').strip()]
+                if missing:
+                    counts['invalid'] += 1
+                    logger.error(f"Skipping {kind} row {counts['read']}: missing {', '.join(missing)}")
+                    continue
+                if kind == 'appointments':
+                    if row.get('appointment_id') and not appointments_loaded:
+                        # Supplied ids may replace stored appointments: learn their state once
+                        previous = {a['appointment_id']: (a.get('doctor_email'), a.get('status')) for a in
+                                    parallel_scan.scan(table, **aws_setup.projection('metrics_appointment'))}
+                        appointments_loaded = True
+                    items.append(appointment_item(row, now, aws_setup.generate_id))
+                    continue
+                item = doctor_item(row, now) if kind == 'doctors' else patient_item(row, now)
+                if not overwrite and (item['email'] in previous or item['email'] in batch_keys):
+                    counts['existing'] += 1
+                    continue
+                batch_keys.add(item['email'])
+                items.append(item)
+                passwords.append(str(row['password']))
+
+            if pool is not None and items:
+                chunksize = max(1, len(passwords) // (workers * 4))
+                for item, hashed in zip(items, pool.map(hash_password, passwords, chunksize=chunksize)):
+                    item['password'] = hashed
+            if not dry_run and items:
+                write_items(table, items, key)
+            counts['written'] += len(items)
+
+            for item in items:
+                item_key = item[key]
+                replaced = item_key in previous
+                counts['replaced'] += replaced
+                if not replaced:
+                    _add(deltas, kind, 1)
+                if kind == 'doctors':
+                    old = previous.get(item_key)
+                    new = previous[item_key] = item['specialization'] or 'General'
+                    if old != new:
+                        if old:
+                            _add(deltas, aws_setup.SPECIALIZATION_PREFIX + old, -1)
+                            first = moved_doctors.get(item_key, (old, None))[0]
+                            moved_doctors[item_key] = (first, new)
+                        _add(deltas, aws_setup.SPECIALIZATION_PREFIX + new, 1)
+                elif kind == 'appointments':
+                    old_doctor, old_status = previous.get(item_key, (None, None))
+                    previous[item_key] = (item['doctor_email'], item['status'])
+                    if replaced and old_status in aws_setup.ACTIVE_APPOINTMENT_STATUSES:
+                        _add(deltas, aws_setup.DEPT_LOAD_PREFIX + specialization.get(old_doctor, 'General'), -1)
+                    if item['status'] in aws_setup.ACTIVE_APPOINTMENT_STATUSES:
+                        _add(deltas, aws_setup.DEPT_LOAD_PREFIX + specialization.get(item['doctor_email'], 'General'), 1)
+                else:
+                    previous[item_key] = True
+                    if not replaced:
+                        imported_emails.append(item_key)
+            logger.info(f"{kind}: {counts['written']} written, {counts['read']} read")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if dry_run or not counts['written']:
+        return counts
+    if moved_doctors:
+        # Their active appointments count towards the department load of the new specialization
+        for appt in parallel_scan.scan(aws_setup.appointments_table, **aws_setup.projection('metrics_appointment')):
+            old, new = moved_doctors.get(appt.get('doctor_email'), (None, None))
+            if old != new and appt.get('status') in aws_setup.ACTIVE_APPOINTMENT_STATUSES:
+                _add(deltas, aws_setup.DEPT_LOAD_PREFIX + old, -1)
+                _add(deltas, aws_setup.DEPT_LOAD_PREFIX + new, 1)
+    aws_setup.increment_metrics(deltas)
+    if subscribe:
+        for email in imported_emails:
+            aws_setup.ensure_email_subscribed(email)
+    if notify:
+        added = counts['written'] - counts['replaced']
+        aws_setup.send_notification(f"Bulk import: {added} {kind} added, {counts['replaced']} updated",
+                                    "MedTrack Bulk Import")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load doctors, patients or appointments.")
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path', help="CSV (with header) or JSONL file")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="default: from the file extension")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="password hashing processes")
+    parser.add_argument('--overwrite', action='store_true', help="replace doctors/patients that already exist")
+    parser.add_argument('--subscribe', action='store_true', help="subscribe imported patients to SNS now")
+    parser.add_argument('--notify', action='store_true', help="queue one summary notification")
+    parser.add_argument('--dry-run', action='store_true', help="validate and hash, write nothing")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    started = time.perf_counter()
+    counts = import_rows(args.kind, read_rows(args.path, args.format), workers=args.workers,
+                         overwrite=args.overwrite, subscribe=args.subscribe, notify=args.notify,
+                         dry_run=args.dry_run)
+    print(f"{args.kind}: {counts['written']} {'would be ' if args.dry_run else ''}written "
+          f"({counts['replaced']} replacing existing), {counts['existing']} already existed, "
+          f"{counts['invalid']} invalid "
+          f"({counts['read']} rows, {time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    return 1 if counts['invalid'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Chat push channel: an in-process pub/sub broker feeding the
+Server-Sent Events endpoint (/api/chat/stream).
+
+Writers call `publish(dept, messages, cursor)`; every open stream for that
+department (or for ALL departments) receives the event. With a single
+process the local backend is enough. With several workers (gunicorn), set
+MEDTRACK_CHAT_BROKER_URL=redis://host:6379/0 so events published in one
+worker reach streams held by the others. Without it, a stream still
+catches up from its cursor when it reconnects.
+
+Every open stream holds a server thread, so each process serves at most
+MEDTRACK_SSE_MAX_STREAMS of them; past that, `open_stream` returns None and
+the route answers 503, which makes the browser fall back to polling.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger("MedTrack-ChatBroker")
+
+ALL = '*'  # Subscribe to every department
+CHANNEL_PREFIX = 'medtrack:chat:'
+SUBSCRIBER_QUEUE_SIZE = 256
+KEEPALIVE_SECONDS = 15  # Comment frames keep proxies from closing idle streams
+RETRY_MS = 3000  # Browser reconnect delay after a stream ends
+# Streams are recycled periodically so a worker's threads are never pinned forever
+STREAM_MAX_SECONDS = int(os.environ.get('MEDTRACK_SSE_MAX_SECONDS', 300))
+# Open streams per process; keep it well below the server's thread count (32 by default)
+MAX_STREAMS = int(os.environ.get('MEDTRACK_SSE_MAX_STREAMS', 16))
+
+
+class Subscription:
+    def __init__(self, dept):
+        self.dept = dept
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False  # Set when events were dropped; the stream then restarts
+
+
+class LocalBackend:
+    """Delivers events to subscribers in this process only."""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, dept, payload):
+        self.deliver(dept, payload)
+
+
+class RedisBackend:
+    """Fans events out through Redis pub/sub; every worker relays them to its own subscribers."""
+
+    def __init__(self, deliver, url):
+        self.deliver = deliver
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        thread = threading.Thread(target=self._listen, name='chat-broker-redis', daemon=True)
+        thread.start()
+
+    def publish(self, dept, payload):
+        self.client.publish(CHANNEL_PREFIX + dept, payload)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                for item in pubsub.listen():
+                    if item['type'] != 'pmessage':
+                        continue
+                    dept = item['channel'].decode()[len(CHANNEL_PREFIX):]
+                    self.deliver(dept, item['data'].decode())
+            except Exception as e:
+                logger.error(f"Chat broker lost Redis connection: {e}")
+                time.sleep(1)
+
+
+class ChatBroker:
+    def __init__(self, url=None):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # dept -> set of Subscription
+        self._streams = 0
+        self.backend = LocalBackend(self._deliver)
+
+        url = url or os.environ.get('MEDTRACK_CHAT_BROKER_URL')
+        if url:
+            if not REDIS_AVAILABLE:
+                logger.warning("MEDTRACK_CHAT_BROKER_URL is set but the redis package is missing; using the local broker")
+            else:
+                try:
+                    self.backend = RedisBackend(self._deliver, url)
+                    logger.info("Chat broker using Redis fan-out")
+                except Exception as e:
+                    logger.error(f"Chat broker could not reach Redis ({e}); using the local broker")
+
+    def subscribe(self, dept=None):
+        sub = Subscription(dept or ALL)
+        with self._lock:
+            self._subscribers.setdefault(sub.dept, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.dept)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.dept]
+
+    def acquire_stream(self, limit=None):
+        """Reserves one of the process' stream slots; False when all `limit` are taken."""
+        with self._lock:
+            if self._streams >= (MAX_STREAMS if limit is None else limit):
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def publish(self, dept, messages, cursor):
+        """Pushes `messages` (already JSON-friendly dicts) to every stream watching `dept`."""
+        payload = json.dumps({'messages': messages, 'cursor': cursor}, default=str)
+        try:
+            self.backend.publish(dept, payload)
+        except Exception as e:
+            # Remote fan-out failed: still serve this worker's own streams
+            logger.error(f"Chat broker publish failed: {e}")
+            self._deliver(dept, payload)
+
+    def _deliver(self, dept, payload):
+        with self._lock:
+            targets = list(self._subscribers.get(dept, ())) + list(self._subscribers.get(ALL, ()))
+        for sub in targets:
+            try:
+                sub.queue.put_nowait(payload)
+            except queue.Full:
+                sub.lagged = True
+
+
+broker = ChatBroker()
+
+
+def publish(dept, messages, cursor):
+    broker.publish(dept, messages, cursor)
+
+
+def _frame(payload, cursor=None):
+    frame = f"id: {cursor}\n" if cursor is not None else ""
+    return frame + f"data: {payload}\n\n"
+
+
+def event_stream(dept, replay, max_seconds=STREAM_MAX_SECONDS):
+    """
+    Yields SSE frames for `dept`. `replay()` returns (messages, cursor) for
+    changes the client missed; it runs after subscribing, so nothing published
+    in between is lost (duplicates are merged by id on the client).
+    """
+    sub = broker.subscribe(dept)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        messages, cursor = replay()
+        if messages:
+            yield _frame(json.dumps({'messages': messages, 'cursor': cursor}, default=str), cursor)
+
+        deadline = time.monotonic() + max_seconds
+        while not sub.lagged:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                payload = sub.queue.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield _frame(payload, json.loads(payload)['cursor'])
+    finally:
+        broker.unsubscribe(sub)
+
+
+class _SlotStream:
+    """Response iterable that gives its stream slot back on close(), even if never iterated."""
+
+    def __init__(self, frames, release):
+        self.frames = frames
+        self._release = release
+
+    def __iter__(self):
+        return self.frames
+
+    def close(self):
+        release, self._release = self._release, None
+        if release:
+            self.frames.close()
+            release()
+
+
+def open_stream(dept, replay, max_seconds=STREAM_MAX_SECONDS):
+    """event_stream() holding one of MAX_STREAMS slots, or None when none is free (poll instead)."""
+    if not broker.acquire_stream():
+        logger.warning(f"{MAX_STREAMS} chat streams already open; client falls back to polling")
+        return None
+    return _SlotStream(event_stream(dept, replay, max_seconds), broker.release_stream)
+
+
+# Headers for an event_stream() response; X-Accel-Buffering stops nginx from buffering frames
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
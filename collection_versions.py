@@ -0,0 +1,164 @@
+"""
+Change versions for polled collections (chat, mood logs, appointment requests).
+
+Writers call `bump(collection, scope...)` after a change; read endpoints build
+an ETag from the versions they depend on and answer 304 without touching the
+data store when the client's copy is still current.
+
+Three flavours:
+- LocalVersions: counters in process memory, for stores that live in the
+  same process (database.py). The ETag carries a per-process token, so a
+  restart or another worker never matches a stale tag.
+- TableVersions: counters in one DynamoDB item, bumped with an atomic ADD,
+  for stores shared between hosts (DynamoDB). Every host sees every bump.
+- SharedVersions: one small file per key under a directory on this host,
+  for stores shared only by this host's workers (LocalStorage). Single host
+  only: a write on another host never changes these files.
+
+Writes made outside this app are invisible to the shared flavours, so their
+tags also roll over every MEDTRACK_VERSION_MAX_AGE seconds.
+"""
+import os
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from functools import wraps
+
+logger = logging.getLogger("MedTrack-Versions")
+
+ALL = None  # Collection-wide scope, bumped together with every scoped change
+
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:20]
+
+
+class LocalVersions:
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def bump(self, collection, *scopes):
+        with self._lock:
+            for scope in set(scopes) | {ALL}:
+                key = (collection, scope)
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def version(self, collection, scope=ALL):
+        return self._counters.get((collection, scope), 0)
+
+    def etag(self, keys, request_key=''):
+        """Opaque tag for the response to `request_key`, built from the (collection, scope) `keys`."""
+        return _digest(self.token, request_key, *(self.version(c, s) for c, s in keys))
+
+
+class TableVersions:
+    """Versions as numeric attributes of the `key` item in `table` (one read per ETag)."""
+
+    def __init__(self, table, key, max_age=None):
+        self.table = table
+        self.key = key
+        self.max_age = max_age or int(os.environ.get('MEDTRACK_VERSION_MAX_AGE', 60))
+
+    @staticmethod
+    def _attribute(collection, scope):
+        return f"{collection}:{_digest(scope)}"
+
+    def bump(self, collection, *scopes):
+        names = {f"#v{idx}": self._attribute(collection, scope)
+                 for idx, scope in enumerate(set(scopes) | {ALL})}
+        try:
+            self.table.update_item(
+                Key=self.key,
+                UpdateExpression="ADD " + ", ".join(f"{name} :one" for name in names),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':one': 1})
+        except Exception as e:
+            logger.error(f"Could not bump {collection} versions: {e}")
+
+    def versions(self, keys):
+        names = {f"#v{idx}": self._attribute(c, s) for idx, (c, s) in enumerate(keys)}
+        if not names:
+            return []
+        item = self.table.get_item(Key=self.key, ConsistentRead=True,
+                                   ProjectionExpression=", ".join(names),
+                                   ExpressionAttributeNames=names).get('Item') or {}
+        return [int(item.get(attribute, 0)) for attribute in names.values()]
+
+    def version(self, collection, scope=ALL):
+        return self.versions([(collection, scope)])[0]
+
+    def etag(self, keys, request_key=''):
+        try:
+            versions = self.versions(list(keys))
+        except Exception as e:
+            # Never answer 304 when the versions cannot be read
+            logger.error(f"Could not read versions: {e}")
+            return uuid.uuid4().hex
+        epoch = int(time.time() // self.max_age)
+        return _digest(epoch, request_key, *versions)
+
+
+class SharedVersions:
+    def __init__(self, directory=None, max_age=None):
+        self.directory = directory or os.environ.get(
+            'MEDTRACK_VERSION_DIR', os.path.join(tempfile.gettempdir(), 'medtrack_versions'))
+        self.max_age = max_age or int(os.environ.get('MEDTRACK_VERSION_MAX_AGE', 60))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, collection, scope):
+        return os.path.join(self.directory, f"{collection}-{_digest(scope)}")
+
+    def bump(self, collection, *scopes):
+        # Each bump writes a fresh random value with an atomic rename: no locking,
+        # and concurrent writers can never leave an unchanged version behind.
+        for scope in set(scopes) | {ALL}:
+            path = self._path(collection, scope)
+            tmp = f"{path}.{uuid.uuid4().hex}"
+            with open(tmp, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(tmp, path)
+
+    def version(self, collection, scope=ALL):
+        try:
+            with open(self._path(collection, scope)) as f:
+                return f.read()
+        except OSError:
+            return '0'
+
+    def etag(self, keys, request_key=''):
+        epoch = int(time.time() // self.max_age)
+        return _digest(self.directory, epoch, request_key, *(self.version(c, s) for c, s in keys))
+
+
+def conditional_get(versions, keys):
+    """ETag / 304 for polled JSON endpoints.
+
+    `keys()` lists the (collection, scope) versions the response depends on.
+    The tag is checked before the view runs, so an unchanged collection is
+    answered without reading the data store.
+    """
+    from flask import request, session, make_response
+    import metrics
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            tag = versions.etag(keys(), f"{session.get('user_id')}:{request.full_path}")
+            hit = request.if_none_match.contains(tag)
+            metrics.cache_result('etag', hit)
+            if hit:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
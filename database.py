@@ -1,8 +1,15 @@
 
 # Mock Database for Medtrack
 # Using Python dictionaries for data persistence (in-memory)
+import bisect
 import datetime
+import itertools
+import threading
+from contextlib import contextmanager
 import pytz
+import chat_broker
+import collection_versions
+import pagination
 
 # --- Timezone Helper (IST) ---
 def get_ist_time():
@@ -14,6 +21,49 @@ def get_formatted_date_time():
     """Returns formatted date string DD-MM-YYYY HH:MM AM/PM"""
     return get_ist_time().strftime("%d-%m-%Y %I:%M %p")
 
+# --- Concurrency ---
+# waitress serves requests from a thread pool, so every read-modify-write on the
+# shared collections below runs under that collection's lock. Functions touching
+# several collections take the locks in LOCK_ORDER, which rules out deadlocks.
+LOCK_ORDER = ["appointments", "invoices", "records", "chats", "donations",
+              "blood_bank", "capacity", "mood", "stats"]
+_locks = {name: threading.RLock() for name in LOCK_ORDER}
+
+@contextmanager
+def locked(*names):
+    """Acquires the named collection locks in canonical order."""
+    ordered = sorted(set(names), key=LOCK_ORDER.index)
+    for name in ordered:
+        _locks[name].acquire()
+    try:
+        yield
+    finally:
+        for name in reversed(ordered):
+            _locks[name].release()
+
+# --- ID Allocation ---
+# One monotonic counter per entity. next() on an itertools.count is atomic under
+# the GIL, so concurrent request threads can never be handed the same id (the old
+# len(collection) + 1 scheme could) and no lock is needed.
+# Prefixed ids are zero-padded, so sorting ids (as strings) == creation order.
+ID_WIDTH = 8
+_id_counters = {
+    "appt": itertools.count(1),
+    "inv": itertools.count(1),
+    "rec": itertools.count(1),
+    "don": itertools.count(1),
+    "chat": itertools.count(1),
+    "chat_change": itertools.count(1)
+}
+
+def next_id(entity):
+    """Returns the next integer id for an entity (e.g. chat message ids)."""
+    return next(_id_counters[entity])
+
+def next_prefixed_id(prefix):
+    """Returns the next sortable string id, e.g. appt_00000042."""
+    return f"{prefix}_{next(_id_counters[prefix]):0{ID_WIDTH}d}"
+
 # Users Data: Key = Email
 users = {
     "patient@example.com": {
@@ -117,6 +167,153 @@ chats = [] # List of messaging objects
 blood_donations = [] 
 blood_requests = []
 
+# Secondary indexes (maintained on every mutation below).
+# Lookups cost O(result size) instead of walking the whole collection.
+appointments_by_patient = {} # Key = Patient ID, Value = [Appointment ID]
+appointments_by_doctor = {}  # Key = Doctor ID, Value = [Appointment ID]
+invoices_by_patient = {}     # Key = Patient ID, Value = [Invoice ID]
+records_by_id = {}           # Key = Record ID, Value = (Patient ID, record)
+# Sorted key lists behind the paginated lists: a page is a bisect + slice.
+# Prefixed ids sort in creation order; patients are listed by email.
+appointment_ids = []
+invoice_ids = []
+record_ids = []
+record_ids_by_patient = {}   # Key = Patient ID
+patient_emails = sorted(email for email, user in users.items() if user['role'] == 'patient')
+donations_by_id = {}         # Key = Donation ID
+donations_by_status = {}     # Key = Status, Value = {Donation ID: donation}
+chats_by_id = {}             # Key = Chat ID
+chats_by_dept = {}           # Key = Department, Value = [message] in creation order
+
+# Chat change log for cursor-based polling: (change seq, chat id) in seq order.
+# A new message or a reply appends an entry, so "what changed since cursor N"
+# is a bisect + slice. Per department plus one log across all departments.
+chat_changes = []
+chat_changes_by_dept = {}    # Key = Department
+
+# Aggregate counters for the admin dashboard.
+# Kept in step with every create/update below so the dashboard reads them in O(1)
+# instead of walking appointments, records and invoices on each render.
+ACTIVE_APPOINTMENT_STATUSES = ['BOOKED', 'CHECKED-IN', 'CONSULTING']
+
+stats = {
+    "doctors": 0,
+    "patients": 0,
+    "departments": 0,
+    "appointments": 0,
+    "records": 0,
+    "invoices": 0,
+    "income": 0,          # Sum of Paid invoices
+    "pending_income": 0,  # Sum of Unpaid invoices
+    "dept_load": {}       # Department -> active appointment count
+}
+
+def _income_bucket(status):
+    """Maps an invoice status to the stats key its amount is counted under."""
+    if status == 'Paid':
+        return 'income'
+    if status == 'Unpaid':
+        return 'pending_income'
+    return None
+
+def _adjust_dept_load(dept, delta):
+    load = stats["dept_load"]
+    load[dept] = load.get(dept, 0) + delta
+    if load[dept] <= 0:
+        del load[dept]
+
+def rebuild_stats():
+    """Recomputes every counter from scratch (startup / after bulk edits)."""
+    with locked(*LOCK_ORDER):
+        _rebuild_stats()
+
+def _rebuild_stats():
+    stats["doctors"] = len(doctors_db)
+    stats["patients"] = sum(1 for u in users.values() if u['role'] == 'patient')
+    stats["departments"] = len(set(d['department'] for d in doctors_db.values()))
+    stats["appointments"] = len(appointments)
+    stats["records"] = sum(len(v) for v in records.values())
+    stats["invoices"] = len(invoices)
+    stats["income"] = 0
+    stats["pending_income"] = 0
+    for inv in invoices.values():
+        bucket = _income_bucket(inv['status'])
+        if bucket:
+            stats[bucket] += inv['amount']
+    stats["dept_load"] = {}
+    for appt in appointments.values():
+        if appt['status'] in ACTIVE_APPOINTMENT_STATUSES:
+            _adjust_dept_load(appt.get('doctor_dept', 'General'), 1)
+
+# Ids are allocated before the lock is taken, so every index inserts in order rather than appends
+def _index_appointment(appt):
+    bisect.insort(appointments_by_patient.setdefault(appt["patient_id"], []), appt["id"])
+    bisect.insort(appointments_by_doctor.setdefault(appt["doctor_id"], []), appt["id"])
+    bisect.insort(appointment_ids, appt["id"])
+
+def _index_invoice(inv):
+    bisect.insort(invoices_by_patient.setdefault(inv["patient_id"], []), inv["id"])
+    bisect.insort(invoice_ids, inv["id"])
+
+def _index_record(patient_id, rec):
+    records_by_id[rec["id"]] = (patient_id, rec)
+    bisect.insort(record_ids, rec["id"])
+    bisect.insort(record_ids_by_patient.setdefault(patient_id, []), rec["id"])
+
+def _index_donation(don):
+    donations_by_id[don["id"]] = don
+    donations_by_status.setdefault(don["status"], {})[don["id"]] = don
+
+def _set_donation_status(don, status):
+    donations_by_status.get(don["status"], {}).pop(don["id"], None)
+    don["status"] = status
+    donations_by_status.setdefault(status, {})[don["id"]] = don
+
+def rebuild_indexes():
+    """Rebuilds every secondary index from the primary collections."""
+    with locked(*LOCK_ORDER):
+        _rebuild_indexes()
+
+def _rebuild_indexes():
+    for index in (appointments_by_patient, appointments_by_doctor, invoices_by_patient, records_by_id,
+                  appointment_ids, invoice_ids, record_ids, record_ids_by_patient,
+                  donations_by_id, donations_by_status, chats_by_id, chats_by_dept):
+        index.clear()
+    for appt in appointments.values():
+        _index_appointment(appt)
+    for inv in invoices.values():
+        _index_invoice(inv)
+    for patient_id, recs in records.items():
+        for rec in recs:
+            _index_record(patient_id, rec)
+    patient_emails[:] = sorted(email for email, user in users.items() if user['role'] == 'patient')
+    for don in blood_donations:
+        _index_donation(don)
+    chat_changes.clear()
+    chat_changes_by_dept.clear()
+    for msg in chats:
+        chats_by_id[msg["id"]] = msg
+        chats_by_dept.setdefault(msg["dept"], []).append(msg)
+        _log_chat_change(msg)
+
+def _log_chat_change(msg):
+    entry = (next_id("chat_change"), msg["id"])
+    chat_changes.append(entry)
+    chat_changes_by_dept.setdefault(msg["dept"], []).append(entry)
+    return entry[0]
+
+def get_admin_stats():
+    """Returns a snapshot of the dashboard counters."""
+    with locked("stats"):
+        snapshot = dict(stats)
+        snapshot["dept_load"] = dict(stats["dept_load"])
+    return snapshot
+
+rebuild_stats()
+
+# Change versions behind the ETags of polled endpoints (chat, mood history)
+versions = collection_versions.LocalVersions()
+
 # --- Accessor Functions for Locations ---
 def get_locations():
     return hospitals_db
@@ -134,64 +331,92 @@ def get_all_doctors():
 def get_all_patients():
     return [user for user in users.values() if user['role'] == 'patient']
 
+def get_patients_page(limit, start_key=None):
+    """One page of patients (no password) and the key of the next page."""
+    def patient(email):
+        user = users[email]
+        return {'id': user['id'], 'name': user['name'], 'email': email}
+    return pagination.paginate(patient_emails, limit, start_key, key='email', lookup=patient)
+
 # --- Blood Bank Functions ---
 def get_blood_stock():
     return blood_bank_db
 
 def add_donation(donor_name, group):
     donation = {
-        "id": f"don_{len(blood_donations) + 1}",
+        "id": next_prefixed_id("don"),
         "donor": donor_name,
         "group": group,
         "status": "Pending",
         "date": get_formatted_date_time()
     }
-    blood_donations.append(donation)
+    with locked("donations"):
+        blood_donations.append(donation)
+        _index_donation(donation)
     return donation
 
 def verify_donation(donation_id):
-    for don in blood_donations:
-        if don['id'] == donation_id and don['status'] == 'Pending':
-            don['status'] = 'Verified'
+    with locked("donations", "blood_bank"):
+        don = donations_by_id.get(donation_id)
+        if don and don['status'] == 'Pending':
+            _set_donation_status(don, 'Verified')
             if don['group'] in blood_bank_db:
-                blood_bank_db[don['group']]['units'] += 1
+                _adjust_blood_units(don['group'], 1)
             return True
     return False
 
 def get_pending_donations():
-    return [d for d in blood_donations if d['status'] == 'Pending']
+    with locked("donations"):
+        return list(donations_by_status.get('Pending', {}).values())
+
+def _blood_status(units):
+    if units < 5:
+        return 'Critical'
+    elif units < 10:
+        return 'Low'
+    return 'Available'
+
+def _adjust_blood_units(group, delta):
+    entry = blood_bank_db[group]
+    entry['units'] = max(0, entry['units'] + delta)
+    entry['status'] = _blood_status(entry['units'])
+    return entry
+
+def adjust_blood_stock(group, delta):
+    """Atomically adds delta units (never below zero) and refreshes the status."""
+    with locked("blood_bank"):
+        if group not in blood_bank_db:
+            return None
+        return dict(_adjust_blood_units(group, delta))
 
 # --- Hospital Capacity Functions ---
 def get_hospital_capacity():
     return hospital_capacity
 
 def update_hospital_capacity(ward_name, occupied, status):
-    if ward_name in hospital_capacity:
-        hospital_capacity[ward_name]['occupied'] = int(occupied)
-        hospital_capacity[ward_name]['status'] = status
-        return True
+    with locked("capacity"):
+        if ward_name in hospital_capacity:
+            hospital_capacity[ward_name]['occupied'] = int(occupied)
+            hospital_capacity[ward_name]['status'] = status
+            return True
     return False
 
 def get_department_load():
-    load = {}
-    for appt in appointments.values():
-        if appt['status'] in ['BOOKED', 'CHECKED-IN', 'CONSULTING']:
-            dept = appt.get('doctor_dept', 'General')
-            load[dept] = load.get(dept, 0) + 1
-    return load
+    with locked("stats"):
+        return dict(stats["dept_load"])
 
 # --- Appointment Functions ---
 def create_appointment(patient_id, doctor_id, time, center=None, state=None, age=None, gender=None, reason=None):
-    appt_id = f"appt_{len(appointments) + 1}"
+    appt_id = next_prefixed_id("appt")
     
     # Auto-generate an invoice 
     invoice_amount = 500  # ₹500 standard consultation fee
-    inv_id = f"inv_{len(invoices) + 1}"
+    inv_id = next_prefixed_id("inv")
     
     # Simple date handling
     date_str = time.replace("T", " ") if time else get_formatted_date_time()
 
-    invoices[inv_id] = {
+    invoice = {
         "id": inv_id,
         "appt_id": appt_id,
         "patient_id": patient_id,
@@ -201,7 +426,7 @@ def create_appointment(patient_id, doctor_id, time, center=None, state=None, age
         "details": f"Consultation Fee - {center if center else 'General'}"
     }
 
-    appointments[appt_id] = {
+    appointment = {
         "id": appt_id,
         "patient_id": patient_id,
         "doctor_id": doctor_id,
@@ -216,36 +441,104 @@ def create_appointment(patient_id, doctor_id, time, center=None, state=None, age
         "gender": gender,
         "reason": reason
     }
-    return appointments[appt_id]
+
+    with locked("appointments", "invoices", "stats"):
+        invoices[inv_id] = invoice
+        appointments[appt_id] = appointment
+        _index_invoice(invoice)
+        _index_appointment(appointment)
+
+        stats["invoices"] += 1
+        stats["pending_income"] += invoice_amount
+        stats["appointments"] += 1
+        _adjust_dept_load(appointment["doctor_dept"], 1)
+    return appointment
+
+def get_appointment(appt_id):
+    return appointments.get(appt_id)
 
 def get_appointments_by_patient(patient_id):
-    return [appt for appt in appointments.values() if appt["patient_id"] == patient_id]
+    with locked("appointments"):
+        return [appointments[appt_id] for appt_id in appointments_by_patient.get(patient_id, [])]
 
 def get_appointments_by_doctor(doctor_id):
-    return [appt for appt in appointments.values() if appt["doctor_id"] == doctor_id]
+    with locked("appointments"):
+        return [appointments[appt_id] for appt_id in appointments_by_doctor.get(doctor_id, [])]
+
+def get_appointments_page(limit, start_key=None):
+    """One page of all appointments, in creation order."""
+    with locked("appointments"):
+        return pagination.paginate(appointment_ids, limit, start_key, lookup=appointments.get)
+
+def get_appointments_by_doctor_page(doctor_id, limit, start_key=None):
+    with locked("appointments"):
+        return pagination.paginate(appointments_by_doctor.get(doctor_id, []), limit, start_key,
+                                   lookup=appointments.get)
+
+def _set_appointment_status(appt, new_status):
+    was_active = appt["status"] in ACTIVE_APPOINTMENT_STATUSES
+    is_active = new_status in ACTIVE_APPOINTMENT_STATUSES
+    appt["status"] = new_status
+    if was_active != is_active:
+        _adjust_dept_load(appt.get("doctor_dept", "General"), 1 if is_active else -1)
 
 def update_appointment_status(appt_id, new_status):
-    if appt_id in appointments:
-        appointments[appt_id]["status"] = new_status
-        return True
+    with locked("appointments", "stats"):
+        if appt_id in appointments:
+            _set_appointment_status(appointments[appt_id], new_status)
+            return True
     return False
 
+# Doctor workflow: BOOKED -> CHECKED-IN -> CONSULTING -> COMPLETED
+APPOINTMENT_STATUS_FLOW = {
+    'BOOKED': 'CHECKED-IN',
+    'CHECKED-IN': 'CONSULTING',
+    'CONSULTING': 'COMPLETED'
+}
+
+def advance_appointment_status(appt_id):
+    """Atomically moves an appointment to its next status.
+
+    Returns the resulting status (unchanged when already final), or None if the
+    appointment does not exist.
+    """
+    with locked("appointments", "stats"):
+        appt = appointments.get(appt_id)
+        if appt is None:
+            return None
+        next_status = APPOINTMENT_STATUS_FLOW.get(appt["status"], appt["status"])
+        if next_status != appt["status"]:
+            _set_appointment_status(appt, next_status)
+        return next_status
+
 # --- Invoice Functions ---
 def get_patient_invoices(patient_id):
-    return [inv for inv in invoices.values() if inv["patient_id"] == patient_id]
+    with locked("invoices"):
+        return [invoices[inv_id] for inv_id in invoices_by_patient.get(patient_id, [])]
+
+def get_invoices_page(limit, start_key=None):
+    """One page of all invoices, in creation order."""
+    with locked("invoices"):
+        return pagination.paginate(invoice_ids, limit, start_key, lookup=invoices.get)
 
 def update_invoice_status(inv_id, status):
-    if inv_id in invoices:
-        invoices[inv_id]["status"] = status
-        return True
+    with locked("invoices", "stats"):
+        if inv_id in invoices:
+            inv = invoices[inv_id]
+            old_bucket = _income_bucket(inv["status"])
+            new_bucket = _income_bucket(status)
+            inv["status"] = status
+            if old_bucket != new_bucket:
+                if old_bucket:
+                    stats[old_bucket] -= inv["amount"]
+                if new_bucket:
+                    stats[new_bucket] += inv["amount"]
+            return True
     return False
 
 # --- Medical Record Functions ---
 def add_record(patient_id, filename, ai_summary, category='Report'):
-    if patient_id not in records:
-        records[patient_id] = []
-    
-    record_id = f"rec_{len(records.get(patient_id, [])) + 1}"
+    record_id = next_prefixed_id("rec")
     new_record = {
         "id": record_id,
         "filename": filename,
@@ -253,16 +546,33 @@ def add_record(patient_id, filename, ai_summary, category='Report'):
         "category": category,
         "date": get_formatted_date_time()
     }
-    if patient_id not in records: records[patient_id] = []
-    records[patient_id].append(new_record)
+    with locked("records", "stats"):
+        records.setdefault(patient_id, []).append(new_record)
+        _index_record(patient_id, new_record)
+        stats["records"] += 1
     return new_record
 
 def get_patient_records(patient_id):
-    return records.get(patient_id, [])
+    with locked("records"):
+        return list(records.get(patient_id, []))
+
+def get_patient_records_page(patient_id, limit, start_key=None):
+    with locked("records"):
+        return pagination.paginate(record_ids_by_patient.get(patient_id, []), limit, start_key,
+                                   lookup=lambda rec_id: records_by_id[rec_id][1])
+
+def _record_with_patient(rec_id):
+    patient_id, rec = records_by_id[rec_id]
+    return dict(rec, patient_id=patient_id)
+
+def get_records_page(limit, start_key=None):
+    """One page of every patient's records, each tagged with its patient_id."""
+    with locked("records"):
+        return pagination.paginate(record_ids, limit, start_key, lookup=_record_with_patient)
 
 # --- Chat Functions ---
 def add_chat_message(sender_name, department, message, sender_role='patient'):
-    chat_id = len(chats) + 1
+    chat_id = next_id("chat")
     new_msg = {
         'id': chat_id,
         'sender': sender_name,
@@ -272,37 +582,65 @@ def add_chat_message(sender_name, department, message, sender_role='patient'):
         'time': get_formatted_date_time(),
         'reply': None
     }
-    chats.append(new_msg)
+    with locked("chats"):
+        chats.append(new_msg)
+        chats_by_id[chat_id] = new_msg
+        chats_by_dept.setdefault(department, []).append(new_msg)
+        # Published under the chats lock so streams receive changes in cursor order
+        chat_broker.publish(department, [dict(new_msg)], _log_chat_change(new_msg))
+    versions.bump("chats", department)
     return new_msg
 
 def get_chat_messages(department=None):
-    if department:
-        return [msg for msg in chats if msg['dept'] == department]
-    return chats
+    with locked("chats"):
+        if department:
+            return list(chats_by_dept.get(department, []))
+        return list(chats)
+
+def get_chat_updates(department=None, since=0):
+    """Returns (messages, cursor): messages created or replied to after `since`.
+
+    Cost is O(log n + changes since the cursor). Pass the returned cursor back
+    as `since` on the next poll. since=0 returns the full history in creation order.
+    """
+    with locked("chats"):
+        log = chat_changes_by_dept.get(department, []) if department else chat_changes
+        cursor = log[-1][0] if log else since
+        if not since:
+            return get_chat_messages(department), cursor
+        start = bisect.bisect_right(log, (since, float('inf')))
+        seen = {}
+        for _, chat_id in log[start:]:
+            seen.pop(chat_id, None)
+            seen[chat_id] = chats_by_id[chat_id]
+        return list(seen.values()), max(cursor, since)
 
 def request_doctor_reply(chat_id, reply_text):
-    for msg in chats:
-        if msg['id'] == int(chat_id):
-            msg['reply'] = reply_text
-            return True
-    return False
+    with locked("chats"):
+        msg = chats_by_id.get(int(chat_id))
+        if not msg:
+            return False
+        msg['reply'] = reply_text
+        chat_broker.publish(msg['dept'], [dict(msg)], _log_chat_change(msg))
+    versions.bump("chats", msg['dept'])
+    return True
 
 # --- Mood Logging ---
 def log_mood(patient_id, score, note):
-    if patient_id not in mood_logs:
-        mood_logs[patient_id] = []
-        
     entry = {
         "date": datetime.datetime.now().strftime("%Y-%m-%d"),
         "time": datetime.datetime.now().strftime("%H:%M"),
         "score": int(score),
         "note": note
     }
-    mood_logs[patient_id].append(entry)
+    with locked("mood"):
+        mood_logs.setdefault(patient_id, []).append(entry)
+    versions.bump("mood", patient_id)
     return entry
 
 def get_mood_history(patient_id):
-    return mood_logs.get(patient_id, [])
+    with locked("mood"):
+        return list(mood_logs.get(patient_id, []))
 
 # --- Stats Helper ---
 def get_weekly_stats(doctor_id):
@@ -1,14 +1,20 @@
 import boto3
 import os
+import time
 import datetime
 import pytz
 from botocore.exceptions import ClientError
+import collection_versions
+import pagination
+import parallel_scan
+import startup_profiler
 
 # --- Configuration ---
 REGION = os.environ.get('AWS_REGION', 'ap-south-1') # Default to Mumbai
 
 try:
-    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    with startup_profiler.phase('aws_clients'):
+        dynamodb = boto3.resource('dynamodb', region_name=REGION)
     # The 8 Tables matching aws_setup.py
     # We map the legacy simple names to the actual PROD tables
     admin_table = dynamodb.Table('medtrack_admin') # Not in aws_setup, maybe use logic for admin?
@@ -45,7 +51,8 @@ try:
     data_table = dynamodb.Table('Medtrack_data')
     
     # Check if they exist (simple check)
-    admin_table.load()
+    with startup_profiler.phase('table_check'):
+        admin_table.load()
     print("✅ Connected to AWS DynamoDB")
     IS_CONNECTED = True
 except Exception as e:
@@ -53,6 +60,13 @@ except Exception as e:
     print("   (Falling back to In-Memory mode is NOT supported in this adapter. Ensure keys are set.)")
     IS_CONNECTED = False
 
+# Change versions behind the ETags of polled endpoints, in Medtrack_data so every host sees them
+VERSIONS_KEY = {'PK': 'VERSIONS', 'SK': 'META'}
+if IS_CONNECTED:
+    versions = collection_versions.TableVersions(data_table, VERSIONS_KEY)
+else:
+    versions = collection_versions.SharedVersions()
+
 # --- Helper Functions ---
 
 def get_ist_time():
@@ -97,19 +111,148 @@ def get_user(email):
 
 def get_all_patients():
     try:
-        resp = patient_table.scan()
-        return resp.get('Items', [])
+        return parallel_scan.scan_all(patient_table)
     except: return []
 
 def get_all_doctors():
     try:
-        resp = doctor_table.scan()
-        return resp.get('Items', [])
+        return parallel_scan.scan_all(doctor_table)
     except: return []
 
+def get_patients_page(limit, start_key=None):
+    """One page of patients (name and email only) and the key of the next page."""
+    try:
+        items, next_key = pagination.scan_page(
+            patient_table.scan, limit, start_key, key_attrs=('username',),
+            ProjectionExpression='username, #n, email, id', ExpressionAttributeNames={'#n': 'name'})
+        for item in items:
+            item.setdefault('email', item['username'])
+        return items, next_key
+    except ClientError as e:
+        print(f"Error listing patients: {e}")
+        return [], None
+
 # --- Data Management (Table 4: MedTrack_Data) ---
 # Schema: PK=EntityID, SK=Meta/Type
 
+# --- Aggregate Metrics (single counter item in MedTrack_Data) ---
+# Every create/update applies its deltas with an atomic `ADD`, so the admin
+# dashboard reads one item instead of scanning the table. Each ADD also bumps
+# `revision`; only rebuild_metrics sets `initialized`, so an item first created
+# by an ADD is still backfilled. Doctors and patients are created outside this
+# adapter, so their counts are derived from the user tables (cached briefly).
+METRICS_KEY = {'PK': 'METRICS', 'SK': 'META'}
+METRIC_FIELDS = ['appointments', 'records', 'invoices', 'income', 'pending_income']
+METRICS_VERSION = 1
+REBUILD_ATTEMPTS = 5
+DEPT_LOAD_PREFIX = 'dept_load:'
+ACTIVE_APPOINTMENT_STATUSES = ['BOOKED', 'CHECKED-IN', 'CONSULTING']
+USER_COUNTS_TTL_SECONDS = 60
+_user_counts = {'expires': 0, 'counts': None}
+
+def increment_metrics(**deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    names = {'#rev': 'revision'}
+    values = {':one': 1}
+    clauses = ['#rev :one']
+    for idx, (field, delta) in enumerate(deltas.items()):
+        names[f"#m{idx}"] = field
+        values[f":d{idx}"] = delta
+        clauses.append(f"#m{idx} :d{idx}")
+    try:
+        data_table.update_item(
+            Key=METRICS_KEY,
+            UpdateExpression="ADD " + ", ".join(clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        print(f"Error updating metrics: {e}")
+
+def adjust_department_load(doctor_id, delta):
+    doc = get_doctor(doctor_id) if doctor_id else None
+    increment_metrics(**{DEPT_LOAD_PREFIX + ((doc or {}).get('department') or 'General'): delta})
+
+def _scan_metrics():
+    """Counters computed from a parallel scan of the APPT#, INV# and REC# items"""
+    department = {d['username']: d.get('department') or 'General' for d in parallel_scan.scan(
+        doctor_table, ProjectionExpression='username, department')}
+    metrics = dict.fromkeys(METRIC_FIELDS, 0)
+    # Straight parallel scans (not _data_scan) so a failed read aborts instead of counting zero
+    for appt in parallel_scan.scan(data_table, **_data_filter('APPT#', {})):
+        metrics['appointments'] += 1
+        if appt.get('status') in ACTIVE_APPOINTMENT_STATUSES:
+            field = DEPT_LOAD_PREFIX + department.get(appt.get('doctor_id'), 'General')
+            metrics[field] = metrics.get(field, 0) + 1
+    for inv in parallel_scan.scan(data_table, **_data_filter('INV#', {})):
+        metrics['invoices'] += 1
+        bucket = _income_bucket(inv.get('status'))
+        if bucket:
+            metrics[bucket] += inv.get('amount', 0)
+    metrics['records'] = parallel_scan.count(data_table, **_data_filter('REC#', {}))
+    return metrics
+
+def rebuild_metrics():
+    """Recomputes the counter item; the put is conditional on `revision`, so concurrent ADDs force a rescan"""
+    for attempt in range(REBUILD_ATTEMPTS):
+        try:
+            current = data_table.get_item(Key=METRICS_KEY, ConsistentRead=True).get('Item') or {}
+            revision = current.get('revision')
+            metrics = _scan_metrics()
+            item = dict(METRICS_KEY, initialized=METRICS_VERSION, revision=revision or 0, **metrics)
+            if revision is None:
+                condition = {'ConditionExpression': 'attribute_not_exists(#rev)'}
+            else:
+                condition = {'ConditionExpression': '#rev = :rev', 'ExpressionAttributeValues': {':rev': revision}}
+            data_table.put_item(Item=item, ExpressionAttributeNames={'#rev': 'revision'}, **condition)
+            return item
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"Error rebuilding metrics: {e}")
+                return None
+        except Exception as e:
+            print(f"Error rebuilding metrics: {e}")
+            return None
+    print("Error rebuilding metrics: counters kept changing during the scans")
+    return None
+
+def _get_user_counts():
+    """doctors / patients / departments from the user tables, refreshed every USER_COUNTS_TTL_SECONDS"""
+    now = time.time()
+    if _user_counts['counts'] is None or now >= _user_counts['expires']:
+        departments = set()
+        doctors = 0
+        for doc in parallel_scan.scan(doctor_table, ProjectionExpression='username, department'):
+            doctors += 1
+            departments.add(doc.get('department') or 'General')
+        patients = parallel_scan.count(patient_table, ProjectionExpression='username')
+        _user_counts['counts'] = {'doctors': doctors, 'patients': patients, 'departments': len(departments)}
+        _user_counts['expires'] = now + USER_COUNTS_TTL_SECONDS
+    return _user_counts['counts']
+
+def get_admin_stats():
+    try:
+        item = data_table.get_item(Key=METRICS_KEY).get('Item') or {}
+        if item.get('initialized') != METRICS_VERSION:
+            item = rebuild_metrics() or item
+    except Exception as e:
+        print(f"Error reading metrics: {e}")
+        item = {}
+    stats = {field: int(item.get(field, 0)) for field in METRIC_FIELDS}
+    try:
+        stats.update(_get_user_counts())
+    except Exception as e:
+        print(f"Error counting users: {e}")
+        stats.update(doctors=0, patients=0, departments=0)
+    stats['dept_load'] = {key[len(DEPT_LOAD_PREFIX):]: int(value) for key, value in item.items()
+                          if key.startswith(DEPT_LOAD_PREFIX) and value > 0}
+    return stats
+
+def get_department_load():
+    return get_admin_stats()['dept_load']
+
 def create_appointment(patient_id, doctor_id, time, center=None, state=None, age=None, gender=None, reason=None):
     # ID Generation
     import uuid
@@ -154,6 +297,9 @@ def create_appointment(patient_id, doctor_id, time, center=None, state=None, age
         with data_table.batch_writer() as batch:
             batch.put_item(Item=invoice_item)
             batch.put_item(Item=appt_item)
+        department = (doc or {}).get('department') or 'General'
+        increment_metrics(appointments=1, invoices=1, pending_income=invoice_item['amount'],
+                          **{DEPT_LOAD_PREFIX + department: 1})
         return appt_item
     except Exception as e:
         print(f"Error creating appointment: {e}")
@@ -162,34 +308,105 @@ def create_appointment(patient_id, doctor_id, time, center=None, state=None, age
 def get_appointments_by_patient(patient_id):
     # Scan is inefficient but fine for this scale. 
     # Better: GSI on patient_id, but staying within single table limits.
-    try:
-        resp = data_table.scan()
-        items = resp.get('Items', [])
-        return [i for i in items if i['PK'].startswith('APPT#') and i.get('patient_id') == patient_id]
-    except: return []
+    return _data_scan('APPT#', patient_id=patient_id)
 
 def get_appointments_by_doctor(doctor_id):
+    return _data_scan('APPT#', doctor_id=doctor_id)
+
+def _data_filter(prefix, conditions):
+    """Scan filter for Medtrack_data items whose PK starts with `prefix` and whose attributes equal `conditions`."""
+    expression = 'begins_with(PK, :prefix)'
+    values = {':prefix': prefix}
+    for idx, (attr, value) in enumerate(conditions.items()):
+        expression += f" AND {attr} = :v{idx}"
+        values[f":v{idx}"] = value
+    return {'FilterExpression': expression, 'ExpressionAttributeValues': values}
+
+def _data_scan(prefix, **conditions):
+    """Every matching Medtrack_data item, read with a parallel segmented scan."""
     try:
-        resp = data_table.scan()
-        items = resp.get('Items', [])
-        return [i for i in items if i['PK'].startswith('APPT#') and i.get('doctor_id') == doctor_id]
-    except: return []
+        return parallel_scan.scan_all(data_table, **_data_filter(prefix, conditions))
+    except Exception as e:
+        print(f"Error scanning {prefix} items: {e}")
+        return []
 
-def get_patient_invoices(patient_id):
+def _data_page(prefix, limit, start_key, **conditions):
+    """One page of matching Medtrack_data items and the key of the next page."""
     try:
-        resp = data_table.scan()
-        items = resp.get('Items', [])
-        return [i for i in items if i['PK'].startswith('INV#') and i.get('patient_id') == patient_id]
-    except: return []
+        # Every entity shares the table, so read wide and filter
+        return pagination.scan_page(data_table.scan, limit, start_key, key_attrs=('PK', 'SK'),
+                                    read_limit=pagination.MAX_PAGE_SIZE * 10,
+                                    **_data_filter(prefix, conditions))
+    except ClientError as e:
+        print(f"Error listing {prefix} items: {e}")
+        return [], None
 
-def update_invoice_status(inv_id, status):
+def get_appointments_page(limit, start_key=None):
+    return _data_page('APPT#', limit, start_key)
+
+def get_appointments_by_doctor_page(doctor_id, limit, start_key=None):
+    return _data_page('APPT#', limit, start_key, doctor_id=doctor_id)
+
+APPOINTMENT_STATUS_FLOW = {
+    'BOOKED': 'CHECKED-IN',
+    'CHECKED-IN': 'CONSULTING',
+    'CONSULTING': 'COMPLETED'
+}
+
+def advance_appointment_status(appt_id):
+    # Conditional write: only succeeds if nobody advanced the appointment since we read it
     try:
+        resp = data_table.get_item(Key={'PK': f"APPT#{appt_id}", 'SK': 'META'})
+        appt = resp.get('Item')
+        if not appt: return None
+        current = appt.get('status')
+        next_status = APPOINTMENT_STATUS_FLOW.get(current, current)
+        if next_status == current: return current
         data_table.update_item(
+            Key={'PK': f"APPT#{appt_id}", 'SK': 'META'},
+            UpdateExpression="set #s = :next",
+            ConditionExpression="#s = :current",
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={':next': next_status, ':current': current}
+        )
+        if current in ACTIVE_APPOINTMENT_STATUSES and next_status not in ACTIVE_APPOINTMENT_STATUSES:
+            adjust_department_load(appt.get('doctor_id'), -1)
+        return next_status
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        print(f"Error advancing appointment: {e}")
+        return None
+
+def get_patient_invoices(patient_id):
+    return _data_scan('INV#', patient_id=patient_id)
+
+def get_invoices_page(limit, start_key=None):
+    return _data_page('INV#', limit, start_key)
+
+def _income_bucket(status):
+    if status == 'Paid': return 'income'
+    if status == 'Unpaid': return 'pending_income'
+    return None
+
+def update_invoice_status(inv_id, status):
+    try:
+        resp = data_table.update_item(
             Key={'PK': f"INV#{inv_id}", 'SK': 'META'},
             UpdateExpression="set #s = :s",
             ExpressionAttributeNames={'#s': 'status'},
-            ExpressionAttributeValues={':s': status}
+            ExpressionAttributeValues={':s': status},
+            ReturnValues='ALL_OLD'
         )
+        old = resp.get('Attributes', {})
+        old_bucket = _income_bucket(old.get('status'))
+        new_bucket = _income_bucket(status)
+        if old and old_bucket != new_bucket:
+            amount = old.get('amount', 0)
+            deltas = {}
+            if old_bucket: deltas[old_bucket] = -amount
+            if new_bucket: deltas[new_bucket] = amount
+            increment_metrics(**deltas)
         return True
     except: return False
 
@@ -208,14 +425,17 @@ def add_record(patient_id, filename, ai_summary, category='Report'):
         'date': get_formatted_date_time()
     }
     data_table.put_item(Item=item)
+    increment_metrics(records=1)
     return item
 
 def get_patient_records(patient_id):
-    try:
-        resp = data_table.scan()
-        items = resp.get('Items', [])
-        return [i for i in items if i['PK'].startswith('REC#') and i.get('patient_id') == patient_id]
-    except: return []
+    return _data_scan('REC#', patient_id=patient_id)
+
+def get_patient_records_page(patient_id, limit, start_key=None):
+    return _data_page('REC#', limit, start_key, patient_id=patient_id)
+
+def get_records_page(limit, start_key=None):
+    return _data_page('REC#', limit, start_key)
 
 # --- Legacy Getters (Mocked or Simplified) ---
 def get_doctor(doctor_id):
@@ -233,6 +453,14 @@ def get_blood_stock():
         "O+": {"group": "O+", "units": 5, "status": "Low"}
     }
 
+def adjust_blood_stock(group, delta):
+    # Blood stock is mocked in this adapter (see get_blood_stock); nothing to persist.
+    return None
+
+def get_pending_donations():
+    # Donations are not stored in this adapter
+    return []
+
 def get_hospital_capacity():
     return {
         "ICU": {"name": "ICU", "total": 20, "occupied": 15, "status": "High Load"}
@@ -0,0 +1,188 @@
+"""
+Streaming CSV / JSONL exports (appointments, invoices, vault metadata).
+
+Each app declares its datasets as page functions plus the columns to write:
+
+    EXPORTS = {'invoices': (get_invoices_page, ['invoice_id', 'amount', ...])}
+
+A page function has the list-view signature, (limit, start_key) ->
+(items, next_key), so exports reuse the paginated scans and queries
+behind the admin lists. The pipeline is storage -> serializer ->
+compressor, generators all the way down. Only one page and one output
+chunk are held at a time, whatever the table size.
+
+    GET /admin/export/invoices?format=jsonl&gzip=1
+    python exporters.py invoices --format csv --gzip -o invoices.csv.gz
+    python exporters.py appointments --app app   # app.py's storage (MEDTRACK_DB)
+"""
+import io
+import os
+import csv
+import sys
+import json
+import zlib
+import logging
+import argparse
+import importlib
+from datetime import date, datetime
+from decimal import Decimal
+
+import pagination
+
+logger = logging.getLogger("MedTrack-Export")
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXPORT_PAGE_SIZE = pagination.MAX_PAGE_SIZE
+CHUNK_BYTES = 64 * 1024  # coalesce rows into chunks of about this size
+# Cells starting with these are formulas to Excel / Sheets (OWASP CSV injection); tab and CR too
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def iter_items(read_page, page_size=EXPORT_PAGE_SIZE):
+    """Every item behind a page function, one page in memory at a time."""
+    start_key = None
+    while True:
+        items, start_key = read_page(page_size, start_key)
+        yield from items
+        if not start_key:
+            return
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return value
+
+
+def _json_default(value):
+    plain = _plain(value)
+    if plain is value:
+        raise TypeError(f"{type(value).__name__} is not JSON serializable")
+    return plain
+
+
+def _cell(value):
+    """A CSV cell; text a spreadsheet would run as a formula is prefixed with a quote."""
+    value = _plain(value)
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, default=str)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def to_csv(items, fields):
+    """CSV text: a header, then one line per item (missing fields are blank)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for item in items:
+        writer.writerow([_cell(item.get(field)) for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_jsonl(items, fields=None):
+    """One JSON object per line, limited to `fields` when given."""
+    for item in items:
+        if fields:
+            item = {field: item.get(field) for field in fields}
+        yield json.dumps(item, default=_json_default, ensure_ascii=False) + '\n'
+
+
+def encode(chunks, size=CHUNK_BYTES):
+    """UTF-8 bytes, coalesced so a response or file sees few, mid-sized writes."""
+    pending, pending_size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= size:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzipped(chunks, level=6):
+    """gzip stream of byte chunks (compressobj keeps a fixed-size window, not the input)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(read_page, fields, fmt='csv', compress=False):
+    """Byte chunks of a whole dataset."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    items = iter_items(read_page)
+    chunks = encode(to_csv(items, fields) if fmt == 'csv' else to_jsonl(items, fields))
+    return gzipped(chunks) if compress else chunks
+
+
+def filename(dataset, fmt='csv', compress=False):
+    return f"medtrack_{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}" + ('.gz' if compress else '')
+
+
+# --- Flask ---
+
+def response(exports, dataset):
+    """Chunked download of `dataset` for the current request (?format=csv|jsonl, ?gzip=1)."""
+    from flask import Response, request, stream_with_context, abort
+
+    if dataset not in exports:
+        abort(404)
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in FORMATS:
+        abort(400)
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    read_page, fields = exports[dataset]
+    logger.info(f"Exporting {dataset} as {fmt}{' (gzip)' if compress else ''}")
+    headers = {'Content-Disposition': f'attachment; filename="{filename(dataset, fmt, compress)}"',
+               'X-Accel-Buffering': 'no'}  # let proxies pass chunks through
+    mimetype = 'application/gzip' if compress else FORMATS[fmt]
+    return Response(stream_with_context(export(read_page, fields, fmt, compress)),
+                    mimetype=mimetype, headers=headers)
+
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a MedTrack dataset to CSV / JSONL.")
+    parser.add_argument('dataset', help="appointments, invoices or vault")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--gzip', action='store_true', help="gzip the output")
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    parser.add_argument('--app', default='aws_setup', choices=['aws_setup', 'app'],
+                        help="whose storage to read (default: aws_setup)")
+    args = parser.parse_args(argv)
+
+    exports = importlib.import_module(args.app).EXPORTS
+    if args.dataset not in exports:
+        parser.error(f"unknown dataset {args.dataset!r} (choose from {', '.join(exports)})")
+    read_page, fields = exports[args.dataset]
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in export(read_page, fields, args.format, args.gzip):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f"Wrote {written} bytes to {os.path.abspath(args.output)}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,30 @@
 import numpy as np
 import os
 import random
-
-# Conditional imports
-try:
-    import joblib
-    from sklearn.neighbors import KNeighborsClassifier
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.decomposition import PCA
-    from sklearn.pipeline import Pipeline
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import classification_report, accuracy_score
-    from sklearn.preprocessing import StandardScaler
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-    joblib = None
-
-try:
-    import tensorflow as tf
-    from tensorflow.keras.applications import MobileNetV2
-    from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout, Input
-    from tensorflow.keras.models import Model
-    from tensorflow.keras.optimizers import Adam
-    TF_AVAILABLE = True
-except ImportError:
-    TF_AVAILABLE = False
+import lazy_loader
+
+# Heavy libraries are imported on first use (see lazy_loader.py); importing
+# this module is cheap and never fails if they are missing.
+SKLEARN_AVAILABLE = lazy_loader.is_installed('sklearn') and lazy_loader.is_installed('joblib')
+joblib = lazy_loader.LazyModule('joblib')
+KNeighborsClassifier = lazy_loader.lazy_attr('sklearn.neighbors', 'KNeighborsClassifier')
+RandomForestClassifier = lazy_loader.lazy_attr('sklearn.ensemble', 'RandomForestClassifier')
+PCA = lazy_loader.lazy_attr('sklearn.decomposition', 'PCA')
+Pipeline = lazy_loader.lazy_attr('sklearn.pipeline', 'Pipeline')
+train_test_split = lazy_loader.lazy_attr('sklearn.model_selection', 'train_test_split')
+classification_report = lazy_loader.lazy_attr('sklearn.metrics', 'classification_report')
+accuracy_score = lazy_loader.lazy_attr('sklearn.metrics', 'accuracy_score')
+StandardScaler = lazy_loader.lazy_attr('sklearn.preprocessing', 'StandardScaler')
+
+TF_AVAILABLE = lazy_loader.is_installed('tensorflow')
+tf = lazy_loader.LazyModule('tensorflow')
+MobileNetV2 = lazy_loader.lazy_attr('tensorflow.keras.applications', 'MobileNetV2')
+GlobalAveragePooling2D = lazy_loader.lazy_attr('tensorflow.keras.layers', 'GlobalAveragePooling2D')
+Dense = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Dense')
+Dropout = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Dropout')
+Input = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Input')
+Model = lazy_loader.lazy_attr('tensorflow.keras.models', 'Model')
+Adam = lazy_loader.lazy_attr('tensorflow.keras.optimizers', 'Adam')
 
 class ImageDiagnosticEngine:
     def __init__(self, model_dir='models'):
@@ -85,18 +84,18 @@ class ImageDiagnosticEngine:
         return "KNN Trained & Saved"
 
     def predict_knn(self, image_data):
+        # Ensure image_data is (1, h, w, c) or handle flattened
+        result = self.predict_knn_batch(image_data.reshape(1, -1))
+        return result[0] if result else None
+
+    def predict_knn_batch(self, images):
+        """(n, h, w, c) images (or n flattened rows) in one model call; a label per image."""
         if self.knn_model is None:
              try: self.knn_model = joblib.load(f'{self.model_dir}/knn_model.pkl')
              except: return None
         
-        # Ensure image_data is (1, h, w, c) or handle flattened
-        if image_data.ndim == 3:
-            image_data = image_data.reshape(1, -1)
-        elif image_data.ndim == 4:
-            image_data = image_data.reshape(1, -1)
-            
-        pred = self.knn_model.predict(image_data)[0]
-        return "Disease" if pred == 1 else "Healthy"
+        preds = self.knn_model.predict(np.asarray(images).reshape(len(images), -1))
+        return ["Disease" if pred == 1 else "Healthy" for pred in preds]
 
     # --- Approach 2: Intermediate (Random Forest + PCA) ---
     def train_rf_with_pca(self):
@@ -119,15 +118,16 @@ class ImageDiagnosticEngine:
         return "RF+PCA Trained & Saved"
 
     def predict_rf(self, image_data):
+        result = self.predict_rf_batch(image_data.reshape(1, -1))
+        return result[0] if result else None
+
+    def predict_rf_batch(self, images):
         if self.rf_pca_pipeline is None:
             try: self.rf_pca_pipeline = joblib.load(f'{self.model_dir}/rf_pca_model.pkl')
             except: return None
 
-        if image_data.ndim > 1:
-            image_data = image_data.reshape(1, -1)
-            
-        pred = self.rf_pca_pipeline.predict(image_data)[0]
-        return "Disease" if pred == 1 else "Healthy"
+        preds = self.rf_pca_pipeline.predict(np.asarray(images).reshape(len(images), -1))
+        return ["Disease" if pred == 1 else "Healthy" for pred in preds]
 
     # --- Approach 3: Recommended (Transfer Learning - MobileNetV2) ---
     def train_mobilenet(self):
@@ -159,16 +159,19 @@ class ImageDiagnosticEngine:
         return "MobileNetV2 Trained & Saved"
 
     def predict_mobilenet(self, image_data):
+        if image_data.ndim == 3:
+            image_data = np.expand_dims(image_data, axis=0)
+        result = self.predict_mobilenet_batch(image_data[:1])
+        return result if result is None or isinstance(result, str) else result[0]
+
+    def predict_mobilenet_batch(self, images):
         if not TF_AVAILABLE: return "TensorFlow required"
         if self.mobilenet_model is None:
             try: self.mobilenet_model = tf.keras.models.load_model(f'{self.model_dir}/mobilenet_model.h5')
             except: return None
             
-        if image_data.ndim == 3:
-            image_data = np.expand_dims(image_data, axis=0)
-            
-        prob = self.mobilenet_model.predict(image_data)[0][0]
-        return "Disease" if prob > 0.5 else "Healthy"
+        probs = self.mobilenet_model.predict(np.asarray(images), verbose=0)
+        return ["Disease" if prob[0] > 0.5 else "Healthy" for prob in probs]
 
     def compare_models(self):
         if not SKLEARN_AVAILABLE: return "Scikit-learn required for comparison"
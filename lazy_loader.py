@@ -0,0 +1,108 @@
+"""
+Lazy imports for heavy optional dependencies (scikit-learn, TensorFlow).
+
+    tf = LazyModule('tensorflow')                       # imported on first attribute access
+    SVC = lazy_attr('sklearn.svm', 'SVC')               # imported on first call
+    TF_AVAILABLE = is_installed('tensorflow')           # checks without importing
+
+`preload()` resolves every proxy up front; with MEDTRACK_ML_PRELOAD set to
+'eager' (block at boot) or 'background' (warm up in a thread) the first
+diagnostic request does not pay the import cost.
+"""
+import os
+import time
+import logging
+import importlib
+import importlib.util
+import threading
+
+logger = logging.getLogger("MedTrack-LazyLoader")
+
+_import_lock = threading.RLock()
+_proxies = []
+load_times = {}  # module name -> seconds spent importing it
+
+
+def is_installed(name):
+    """True if `name` can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _import(name):
+    with _import_lock:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if name not in load_times:
+            load_times[name] = time.perf_counter() - start
+            logger.info(f"Imported {name} in {load_times[name] * 1000:.0f} ms")
+        return module
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        _proxies.append(self)
+
+    def _load(self):
+        if self._module is None:
+            self._module = _import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+class lazy_attr:
+    """Stands in for a class or function `module.attr`; importing happens on first call."""
+
+    def __init__(self, module, attr):
+        self._module_name = module
+        self._attr = attr
+        self._target = None
+        _proxies.append(self)
+
+    def _load(self):
+        if self._target is None:
+            self._target = getattr(_import(self._module_name), self._attr)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy {self._module_name}.{self._attr}>"
+
+
+def preload(modules=()):
+    """Imports `modules` (which register proxies) and everything behind the proxies; returns {module: seconds}."""
+    for name in modules:
+        _import(name)
+    for proxy in list(_proxies):
+        try:
+            proxy._load()
+        except ImportError as e:
+            logger.info(f"Preload skipped: {e}")
+    return dict(load_times)
+
+
+def preload_from_config(modules=(), mode=None):
+    """Applies MEDTRACK_ML_PRELOAD: 'eager', 'background', or anything else for none (the default)."""
+    mode = (mode or os.environ.get('MEDTRACK_ML_PRELOAD', 'off')).lower()
+    if mode == 'eager':
+        preload(modules)
+    elif mode == 'background':
+        threading.Thread(target=preload, args=(modules,), name='ml-preload', daemon=True).start()
+    return mode
@@ -0,0 +1,169 @@
+"""
+In-process SNS stand-in for offline testing and benchmarks.
+
+Implements the subset of the boto3 SNS client the app uses (publish,
+publish_batch, subscribe, list_subscriptions_by_topic), records every
+message, and can inject per-call latency and throttling errors:
+
+    MEDTRACK_SNS=local                   use this client instead of AWS SNS
+    MEDTRACK_LOCAL_SNS_LATENCY_MS=80     added to every API call
+    MEDTRACK_LOCAL_SNS_THROTTLE_RATE=0.1 chance that a call fails with Throttling
+    MEDTRACK_LOCAL_SNS_MAX_TPS=30        calls per second before Throttling (0 = unlimited)
+"""
+import os
+import time
+import uuid
+import random
+import threading
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        """Same `response` shape as botocore's ClientError"""
+        def __init__(self, error_response, operation_name):
+            super().__init__(f"An error occurred ({error_response['Error']['Code']}) when calling the {operation_name} operation")
+            self.response = error_response
+            self.operation_name = operation_name
+
+MAX_BATCH_ENTRIES = 10
+SUBSCRIPTIONS_PAGE_SIZE = 100  # list_subscriptions_by_topic page size, as in SNS
+MAX_RECORDED_MESSAGES = 10000
+
+
+def is_enabled():
+    return os.environ.get('MEDTRACK_SNS', '').lower() == 'local'
+
+
+class LocalSNSClient:
+    def __init__(self, latency_ms=None, throttle_rate=None, max_tps=None):
+        self._lock = threading.Lock()
+        self.configure(
+            latency_ms=float(os.environ.get('MEDTRACK_LOCAL_SNS_LATENCY_MS', 0)) if latency_ms is None else latency_ms,
+            throttle_rate=float(os.environ.get('MEDTRACK_LOCAL_SNS_THROTTLE_RATE', 0)) if throttle_rate is None else throttle_rate,
+            max_tps=float(os.environ.get('MEDTRACK_LOCAL_SNS_MAX_TPS', 0)) if max_tps is None else max_tps
+        )
+        self.subscriptions = {}  # (topic_arn, endpoint) -> subscription dict
+        self.reset()
+
+    def configure(self, latency_ms=None, throttle_rate=None, max_tps=None):
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+        if throttle_rate is not None:
+            self.throttle_rate = throttle_rate
+        if max_tps is not None:
+            self.max_tps = max_tps
+            self._tokens = max_tps
+            self._refilled_at = time.monotonic()
+
+    def reset(self):
+        """Clears recorded messages and counters (subscriptions are kept)."""
+        with self._lock:
+            self.messages = []
+            self.counters = {'calls': 0, 'publish': 0, 'publish_batch': 0, 'subscribe': 0,
+                             'list_subscriptions_by_topic': 0, 'messages': 0, 'throttled': 0,
+                             'failed_entries': 0}
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    # --- Fault injection ---
+
+    def _call(self, operation):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        with self._lock:
+            self.counters['calls'] += 1
+            self.counters[operation] += 1
+            throttled = random.random() < self.throttle_rate or not self._take_token()
+            if throttled:
+                self.counters['throttled'] += 1
+        if throttled:
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}},
+                              ''.join(word.title() for word in operation.split('_')))
+
+    def _take_token(self):
+        if not self.max_tps:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.max_tps, self._tokens + (now - self._refilled_at) * self.max_tps)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _record(self, **message):
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self.counters['messages'] += 1
+            if len(self.messages) < MAX_RECORDED_MESSAGES:
+                self.messages.append(dict(message, MessageId=message_id, Timestamp=time.time()))
+        return message_id
+
+    # --- SNS API subset ---
+
+    def publish(self, Message, TopicArn=None, PhoneNumber=None, TargetArn=None, Subject=None,
+                MessageAttributes=None, **kwargs):
+        self._call('publish')
+        if not (TopicArn or PhoneNumber or TargetArn):
+            raise ClientError({'Error': {'Code': 'InvalidParameter', 'Message': 'No destination'}}, 'Publish')
+        message_id = self._record(TopicArn=TopicArn, PhoneNumber=PhoneNumber, TargetArn=TargetArn,
+                                  Subject=Subject, Message=Message, MessageAttributes=MessageAttributes or {})
+        return {'MessageId': message_id, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self._call('publish_batch')
+        if len(PublishBatchRequestEntries) > MAX_BATCH_ENTRIES:
+            raise ClientError({'Error': {'Code': 'TooManyEntriesInBatchRequest',
+                                         'Message': f'More than {MAX_BATCH_ENTRIES} entries'}}, 'PublishBatch')
+        successful, failed = [], []
+        for entry in PublishBatchRequestEntries:
+            if not entry.get('Message'):
+                failed.append({'Id': entry['Id'], 'Code': 'InvalidParameter',
+                               'Message': 'Empty message', 'SenderFault': True})
+                continue
+            message_id = self._record(TopicArn=TopicArn, Subject=entry.get('Subject'), Message=entry['Message'],
+                                      MessageAttributes=entry.get('MessageAttributes', {}))
+            successful.append({'Id': entry['Id'], 'MessageId': message_id})
+        if failed:
+            with self._lock:
+                self.counters['failed_entries'] += len(failed)
+        return {'Successful': successful, 'Failed': failed, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def subscribe(self, TopicArn, Protocol, Endpoint, **kwargs):
+        self._call('subscribe')
+        with self._lock:
+            sub = self.subscriptions.setdefault((TopicArn, Endpoint), {
+                'SubscriptionArn': 'pending confirmation',
+                'Owner': 'local',
+                'Protocol': Protocol,
+                'Endpoint': Endpoint,
+                'TopicArn': TopicArn
+            })
+        return {'SubscriptionArn': sub['SubscriptionArn'], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def list_subscriptions_by_topic(self, TopicArn, NextToken=None):
+        self._call('list_subscriptions_by_topic')
+        with self._lock:
+            subs = [sub for (topic, _), sub in sorted(self.subscriptions.items()) if topic == TopicArn]
+        start = int(NextToken or 0)
+        response = {'Subscriptions': subs[start:start + SUBSCRIPTIONS_PAGE_SIZE]}
+        if start + SUBSCRIPTIONS_PAGE_SIZE < len(subs):
+            response['NextToken'] = str(start + SUBSCRIPTIONS_PAGE_SIZE)
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide stand-in, so every caller shares the same counters."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LocalSNSClient()
+        return _client
@@ -2,16 +2,46 @@
 Local file-based storage fallback for when AWS credentials are not available.
 This ensures data persists across server restarts during local development.
 """
+import bisect
 import json
 import os
+import re
+import zlib
 from datetime import datetime
+from decimal import Decimal
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        """Same `response` shape as botocore's ClientError"""
+        def __init__(self, error_response, operation_name):
+            super().__init__(error_response['Error'].get('Message', ''))
+            self.response = error_response
+            self.operation_name = operation_name
+
+def _json_default(value):
+    """DynamoDB numbers come back as Decimal; store them as plain JSON numbers"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
 
 class LocalStorage:
     """Simple JSON file-based storage that mimics DynamoDB Table interface"""
     
+    # Range key of each GSI, so an index query without a range condition is still ordered by it
+    INDEX_RANGE_KEYS = {
+        'dept-updated_at-index': 'updated_at',
+        'doctor_email-created_at-index': 'created_at',
+        'patient_email-uploaded_at-index': 'uploaded_at'
+    }
+    
     def __init__(self, table_name):
         self.table_name = table_name
-        self.storage_dir = os.path.join(os.path.dirname(__file__), 'local_data')
+        self._revision = 0  # bumped by every write; invalidates the key order below
+        self._order = None  # (state, sorted keys, items in key order)
+        self.storage_dir = os.environ.get('MEDTRACK_LOCAL_DATA_DIR') or \
+            os.path.join(os.path.dirname(__file__), 'local_data')
         self.file_path = os.path.join(self.storage_dir, f'{table_name}.json')
         
         # Create storage directory if it doesn't exist
@@ -33,88 +63,317 @@ class LocalStorage:
     
     def _save(self):
         """Save data to JSON file"""
+        self._revision += 1
         try:
             with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
+                json.dump(self.data, f, indent=2, ensure_ascii=False, default=_json_default)
         except Exception as e:
             print(f"Error saving {self.table_name}: {e}")
     
-    def put_item(self, Item):
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **kwargs):
         """Add or update an item"""
         # Remove existing item with same key if it exists
         key_name = self._get_key_name()
         key_value = Item.get(key_name)
         
+        if ConditionExpression:
+            existing = next((item for item in self.data if item.get(key_name) == key_value), {})
+            matches = self._compile_condition(ConditionExpression, ExpressionAttributeNames,
+                                              ExpressionAttributeValues)
+            if not matches(existing):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                             'Message': 'The conditional request failed'}}, 'PutItem')
+        
         self.data = [item for item in self.data if item.get(key_name) != key_value]
         self.data.append(Item)
         self._save()
         return {'ResponseMetadata': {'HTTPStatusCode': 200}}
     
-    def get_item(self, Key):
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
         """Get a single item by key"""
         key_name = list(Key.keys())[0]
         key_value = Key[key_name]
         
         for item in self.data:
             if item.get(key_name) == key_value:
+                if ProjectionExpression:
+                    item = self._project([item], ProjectionExpression, ExpressionAttributeNames)[0]
                 return {'Item': item}
         return {}
     
-    def scan(self, FilterExpression=None, ExpressionAttributeValues=None, **kwargs):
-        """Scan all items with optional filtering"""
+    def scan(self, FilterExpression=None, ExpressionAttributeValues=None,
+             ExpressionAttributeNames=None, ProjectionExpression=None,
+             Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None, **kwargs):
+        """Scan all items with optional filtering.
+
+        With Limit / ExclusiveStartKey the items are read in key order, one
+        page at a time, and LastEvaluatedKey is set while more remain.
+        Segment / TotalSegments split the table by a hash of the key, so
+        parallel scans see every item exactly once.
+        """
         items = self.data.copy()
+        last_key = None
+        if TotalSegments:
+            key_name = self._get_key_name()
+            items = [item for item in items
+                     if zlib.crc32(str(item.get(key_name, '')).encode('utf-8')) % TotalSegments == Segment]
+        if (Limit or ExclusiveStartKey) and not TotalSegments:
+            items, last_key = self._key_page(Limit, ExclusiveStartKey)
+        elif Limit or ExclusiveStartKey:
+            key_name = self._get_key_name()
+            items.sort(key=lambda item: str(item.get(key_name, '')))
+            items, last_key = self._page(items, Limit, ExclusiveStartKey, [key_name])
         
-        # Simple filter implementation
-        if FilterExpression and ExpressionAttributeValues:
-            # Parse simple equality filters like "status = :status"
-            if '=' in FilterExpression:
-                parts = FilterExpression.split('=')
-                field = parts[0].strip()
-                value_key = parts[1].strip()
-                
-                if value_key in ExpressionAttributeValues:
-                    filter_value = ExpressionAttributeValues[value_key]
-                    items = [item for item in items if item.get(field) == filter_value]
+        if FilterExpression:
+            matches = self._compile_condition(FilterExpression, ExpressionAttributeNames,
+                                              ExpressionAttributeValues)
+            items = [item for item in items if matches(item)]
+        if ProjectionExpression:
+            items = self._project(items, ProjectionExpression, ExpressionAttributeNames)
         
-        return {'Items': items, 'Count': len(items)}
+        response = {'Items': items, 'Count': len(items)}
+        if last_key:
+            response['LastEvaluatedKey'] = last_key
+        return response
+    
+    def _key_page(self, limit, start_key):
+        """Items in key order after `start_key`: a bisect into an order sorted once per write"""
+        key_name = self._get_key_name()
+        state = (self._revision, id(self.data), len(self.data))
+        if self._order is None or self._order[0] != state:
+            ordered = sorted(self.data, key=lambda item: str(item.get(key_name, '')))
+            self._order = (state, [str(item.get(key_name, '')) for item in ordered], ordered)
+        _, keys, ordered = self._order
+        start = bisect.bisect_right(keys, str(start_key.get(key_name, ''))) if start_key else 0
+        end = start + limit if limit else len(ordered)
+        items = ordered[start:end]
+        if end < len(ordered) and items:
+            return items, {key_name: items[-1].get(key_name)}
+        return items, None
+    
+    def _page(self, items, limit, start_key, key_fields, descending=False):
+        """Slice of ordered `items` after `start_key` (limit is applied before filters, as in DynamoDB)"""
+        if start_key:
+            position = tuple(str(start_key.get(field, '')) for field in key_fields)
+            after = (lambda k: k < position) if descending else (lambda k: k > position)
+            items = [item for item in items
+                     if after(tuple(str(item.get(field, '')) for field in key_fields))]
+        if limit and len(items) > limit:
+            items = items[:limit]
+            return items, {field: items[-1].get(field) for field in key_fields}
+        return items, None
     
     def query(self, KeyConditionExpression=None, FilterExpression=None, 
-              ExpressionAttributeValues=None, **kwargs):
-        """Query items (simplified - just returns filtered scan)"""
-        return self.scan(FilterExpression=FilterExpression, 
-                        ExpressionAttributeValues=ExpressionAttributeValues)
+              ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+              ScanIndexForward=True, ProjectionExpression=None, Limit=None,
+              ExclusiveStartKey=None, **kwargs):
+        """Query items by key condition (any attribute works, so GSIs need no setup).
+
+        Results are ordered by the attribute used in the range part of the key
+        condition, mirroring DynamoDB's sort-key ordering.
+        """
+        items = self.data
+        sort_field = None
+        
+        if KeyConditionExpression:
+            matches = self._compile_condition(KeyConditionExpression, ExpressionAttributeNames,
+                                              ExpressionAttributeValues)
+            items = [item for item in items if matches(item)]
+            sort_field = self._range_field(KeyConditionExpression, ExpressionAttributeNames)
+        index_range = self.INDEX_RANGE_KEYS.get(kwargs.get('IndexName'))
+        if index_range:
+            # GSIs are sparse: items without the index's range key are not in it
+            items = [item for item in items if item.get(index_range) is not None]
+            sort_field = sort_field or index_range
+        last_key = None
+        if Limit or ExclusiveStartKey:
+            # Paged: a total order (sort key, then table key) so a cursor resumes exactly
+            key_name = self._get_key_name()
+            key_fields = [sort_field, key_name] if sort_field and sort_field != key_name else [key_name]
+            items = sorted(items, key=lambda item: tuple(str(item.get(f, '')) for f in key_fields),
+                           reverse=not ScanIndexForward)
+            items, last_key = self._page(items, Limit, ExclusiveStartKey, key_fields,
+                                         descending=not ScanIndexForward)
+        elif sort_field:
+            items = sorted(items, key=lambda item: str(item.get(sort_field, '')),
+                           reverse=not ScanIndexForward)
+        if FilterExpression:
+            matches = self._compile_condition(FilterExpression, ExpressionAttributeNames,
+                                              ExpressionAttributeValues)
+            items = [item for item in items if matches(item)]
+        if ProjectionExpression:
+            items = self._project(items, ProjectionExpression, ExpressionAttributeNames)
+        
+        response = {'Items': list(items), 'Count': len(items)}
+        if last_key:
+            response['LastEvaluatedKey'] = last_key
+        return response
+    
+    def _project(self, items, expression, names=None):
+        """Copies of `items` holding only the attributes named in a projection expression.
+
+        Top-level attributes only ("name, #s, created_at").
+        """
+        fields = []
+        for path in expression.split(','):
+            path = path.strip()
+            if not re.match(r'^#?\w+$', path):
+                raise ValueError(f"Unsupported projection in LocalStorage: {path}")
+            fields.append(self._resolve_name(path, names or {}))
+        return [{field: item[field] for field in fields if field in item} for item in items]
+    
+    # Condition expressions: AND-joined comparisons, begins_with() and
+    # attribute_exists()/attribute_not_exists(), e.g.
+    # "dept = :dept AND updated_at > :since"
+    _COMPARISON = re.compile(r'^([#\w.]+)\s*(=|<>|<=|>=|<|>)\s*(:\w+)$')
+    _FUNCTION = re.compile(r'^(begins_with|attribute_exists|attribute_not_exists)\s*\(\s*([#\w.]+)\s*(?:,\s*(:\w+)\s*)?\)$',
+                           re.IGNORECASE)
+    _OPERATORS = {
+        '=': lambda a, b: a == b,
+        '<>': lambda a, b: a != b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b
+    }
+    
+    def _compile_condition(self, expression, names=None, values=None):
+        """Compile a condition expression into a predicate over items"""
+        names = names or {}
+        values = values or {}
+        predicates = []
+        
+        for term in re.split(r'\s+AND\s+', expression.strip(), flags=re.IGNORECASE):
+            term = term.strip()
+            comparison = self._COMPARISON.match(term)
+            function = self._FUNCTION.match(term)
+            if comparison:
+                field = self._resolve_name(comparison.group(1), names)
+                op = self._OPERATORS[comparison.group(2)]
+                value = values.get(comparison.group(3))
+                predicates.append(lambda item, f=field, op=op, v=value: op(item.get(f), v))
+            elif function:
+                func = function.group(1).lower()
+                field = self._resolve_name(function.group(2), names)
+                if func == 'begins_with':
+                    prefix = values.get(function.group(3), '')
+                    predicates.append(lambda item, f=field, p=prefix: str(item.get(f, '')).startswith(p))
+                elif func == 'attribute_exists':
+                    predicates.append(lambda item, f=field: f in item)
+                else:
+                    predicates.append(lambda item, f=field: f not in item)
+            else:
+                raise ValueError(f"Unsupported condition in LocalStorage: {term}")
+        
+        return lambda item: all(predicate(item) for predicate in predicates)
+    
+    def _range_field(self, key_condition, names=None):
+        """The attribute compared with a non-equality operator (the sort key)"""
+        for term in re.split(r'\s+AND\s+', key_condition.strip(), flags=re.IGNORECASE):
+            comparison = self._COMPARISON.match(term.strip())
+            if comparison and comparison.group(2) != '=':
+                return self._resolve_name(comparison.group(1), names or {})
+            function = self._FUNCTION.match(term.strip())
+            if function and function.group(1).lower() == 'begins_with':
+                return self._resolve_name(function.group(2), names or {})
+        return None
     
     def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, 
-                    ExpressionAttributeNames=None, **kwargs):
-        """Update an existing item"""
+                    ExpressionAttributeNames=None, ReturnValues=None, ConditionExpression=None, **kwargs):
+        """Update an existing item (created if missing, like DynamoDB).
+
+        Supports SET (incl. if_not_exists / list_append), ADD and REMOVE clauses.
+        """
         key_name = list(Key.keys())[0]
         key_value = Key[key_name]
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
         
-        for item in self.data:
-            if item.get(key_name) == key_value:
-                # Parse SET expressions
-                if UpdateExpression and UpdateExpression.startswith('SET'):
-                    updates = UpdateExpression.replace('SET ', '').split(',')
-                    
-                    for update in updates:
-                        update = update.strip()
-                        if '=' in update:
-                            parts = update.split('=')
-                            field = parts[0].strip()
-                            value_ref = parts[1].strip()
-                            
-                            # Handle attribute name aliases
-                            if ExpressionAttributeNames and field in ExpressionAttributeNames:
-                                field = ExpressionAttributeNames[field]
-                            
-                            # Handle attribute value references
-                            if ExpressionAttributeValues and value_ref in ExpressionAttributeValues:
-                                item[field] = ExpressionAttributeValues[value_ref]
-                
-                self._save()
-                return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        item = next((i for i in self.data if i.get(key_name) == key_value), None)
+        old_item = dict(item) if item is not None else None
+        if ConditionExpression:
+            matches = self._compile_condition(ConditionExpression, names, values)
+            if not matches(old_item or {}):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                             'Message': 'The conditional request failed'}}, 'UpdateItem')
+        if item is None:
+            item = dict(Key)
+            self.data.append(item)
         
-        return {}
+        for action, body in self._split_clauses(UpdateExpression or ''):
+            for part in self._split_top_level(body):
+                if action == 'SET' and '=' in part:
+                    field, expr = part.split('=', 1)
+                    field = self._resolve_name(field.strip(), names)
+                    item[field] = self._eval_operand(expr.strip(), item, values, names)
+                elif action == 'ADD':
+                    field, value_ref = part.split()
+                    field = self._resolve_name(field, names)
+                    delta = values.get(value_ref)
+                    if isinstance(delta, (set, frozenset)):
+                        item[field] = set(item.get(field, set())) | set(delta)
+                    else:
+                        item[field] = item.get(field, 0) + delta
+                elif action == 'REMOVE':
+                    item.pop(self._resolve_name(part, names), None)
+        
+        self._save()
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if ReturnValues == 'ALL_OLD' and old_item is not None:
+            response['Attributes'] = old_item
+        elif ReturnValues == 'ALL_NEW':
+            response['Attributes'] = dict(item)
+        return response
+    
+    @staticmethod
+    def _split_clauses(expression):
+        """Split an update expression into (ACTION, body) pairs"""
+        tokens = re.split(r'\b(SET|ADD|REMOVE|DELETE)\b', expression, flags=re.IGNORECASE)
+        clauses = []
+        for idx in range(1, len(tokens) - 1, 2):
+            clauses.append((tokens[idx].upper(), tokens[idx + 1].strip()))
+        return clauses
+    
+    @staticmethod
+    def _split_top_level(body):
+        """Split on commas that are not inside function-call parentheses"""
+        parts, depth, current = [], 0, ''
+        for ch in body:
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            if ch == ',' and depth == 0:
+                parts.append(current.strip())
+                current = ''
+            else:
+                current += ch
+        if current.strip():
+            parts.append(current.strip())
+        return parts
+    
+    @staticmethod
+    def _resolve_name(field, names):
+        return names.get(field, field)
+    
+    def _eval_operand(self, expr, item, values, names):
+        """Evaluate the right-hand side of a SET assignment"""
+        match = re.match(r'^(if_not_exists|list_append)\s*\((.*)\)$', expr, flags=re.IGNORECASE)
+        if match:
+            func = match.group(1).lower()
+            args = self._split_top_level(match.group(2))
+            if func == 'if_not_exists':
+                field = self._resolve_name(args[0], names)
+                if field in item:
+                    return item[field]
+                return self._eval_operand(args[1], item, values, names)
+            first = self._eval_operand(args[0], item, values, names) or []
+            second = self._eval_operand(args[1], item, values, names) or []
+            return list(first) + list(second)
+        if expr in values:
+            return values[expr]
+        return item.get(self._resolve_name(expr, names))
     
     def delete_item(self, Key):
         """Delete an item"""
@@ -125,6 +384,23 @@ class LocalStorage:
         self._save()
         return {'ResponseMetadata': {'HTTPStatusCode': 200}}
     
+    def batch_writer(self, overwrite_by_pkeys=None):
+        """Buffers puts and deletes like boto3's BatchWriter; the file is written once on exit"""
+        return _LocalBatchWriter(self)
+    
+    def batch_write(self, puts, deletes=()):
+        """Apply many puts/deletes with one pass over the data and one save"""
+        key_name = self._get_key_name()
+        by_key = {item.get(key_name): item for item in self.data}
+        for key_value in deletes:
+            by_key.pop(key_value, None)
+        for item in puts:
+            by_key.pop(item.get(key_name), None)  # re-insert at the end, as put_item does
+            by_key[item.get(key_name)] = item
+        self.data = list(by_key.values())
+        self._save()
+        return {'UnprocessedItems': {}}
+    
     def _get_key_name(self):
         """Get the primary key name for this table"""
         # Map table names to their keys
@@ -137,6 +413,36 @@ class LocalStorage:
             'medtrack_invoices': 'invoice_id',
             'medtrack_chat_messages': 'message_id',
             'medtrack_mood_logs': 'mood_id',
-            'medtrack_appointment_requests': 'request_id'
+            'medtrack_appointment_requests': 'request_id',
+            'medtrack_metrics': 'metric_id',
+            'medtrack_sns_subscriptions': 'email'
         }
         return key_map.get(self.table_name, 'id')
+
+
+class _LocalBatchWriter:
+    """Context manager returned by LocalStorage.batch_writer"""
+    
+    def __init__(self, table):
+        self.table = table
+        self.puts = {}
+        self.deletes = set()
+    
+    def put_item(self, Item):
+        key_value = Item.get(self.table._get_key_name())
+        self.deletes.discard(key_value)
+        self.puts.pop(key_value, None)
+        self.puts[key_value] = Item
+    
+    def delete_item(self, Key):
+        key_value = list(Key.values())[0]
+        self.puts.pop(key_value, None)
+        self.deletes.add(key_value)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.puts or self.deletes:
+            self.table.batch_write(list(self.puts.values()), self.deletes)
+        return False
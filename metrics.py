@@ -0,0 +1,424 @@
+"""
+Prometheus metrics (text exposition format) for app.py and aws_setup.py.
+
+Hot paths only touch per-thread dicts: every thread owns its counters and
+histograms, so `inc()` / `observe()` take no lock. A scrape of /metrics
+adds the threads up. Each worker process writes that snapshot to
+MEDTRACK_METRICS_DIR (one file per process, refreshed every
+MEDTRACK_METRICS_FLUSH_SECONDS), and whichever worker serves the scrape
+merges every file. Counters and histograms of exited workers are folded
+into one archive file and their own files deleted, so totals never go
+backwards and the directory does not grow; their gauges are dropped.
+
+    medtrack_http_requests_total{endpoint,method,status}
+    medtrack_http_request_duration_seconds{endpoint}           histogram
+    medtrack_http_requests_in_flight
+    medtrack_backend_call_duration_seconds{service,operation,table}   histogram
+    medtrack_notification_queue_depth{channel}
+    medtrack_model_inference_seconds{model}                    histogram
+    medtrack_cache_requests_total{cache,result}  and  medtrack_cache_hit_ratio{cache}
+
+Set MEDTRACK_METRICS_TOKEN to require `Authorization: Bearer <token>` on /metrics.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single waitress process, so no worker files to fold
+    fcntl = None
+
+logger = logging.getLogger("MedTrack-Metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_SECONDS = float(os.environ.get('MEDTRACK_METRICS_FLUSH_SECONDS', 5))
+METRICS_DIR = os.environ.get('MEDTRACK_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'medtrack_metrics'))
+
+ARCHIVE_FILE = 'archive.json'  # counters and histograms of exited workers
+IN_FLIGHT = '_in_flight'  # per-thread +1/-1 counter behind medtrack_http_requests_in_flight
+
+_definitions = {}  # name -> (type, help, buckets)
+_gauges = []       # (name, fn, mode); fn() -> number or {labels tuple: number}
+_threads = []      # (thread, _ThreadMetrics) of every live thread that recorded something
+_threads_lock = threading.Lock()
+_local = threading.local()
+_flusher = None
+_flusher_lock = threading.Lock()
+_instance = None   # (pid, random id) naming this process' file, so a reused pid gets a new one
+
+
+def counter(name, help_text):
+    _definitions[name] = ('counter', help_text, None)
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    _definitions[name] = ('histogram', help_text, tuple(buckets))
+
+
+def gauge(name, help_text, fn, mode='sum'):
+    """`fn` is evaluated at scrape time; mode 'sum' adds workers up, 'max' is for
+    values every worker sees the same way (e.g. the shared outbox spool)."""
+    _definitions[name] = ('gauge', help_text, None)
+    _gauges.append((name, fn, mode))
+
+
+class _ThreadMetrics:
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> float
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+_retired = _ThreadMetrics()  # totals of threads that have exited (e.g. scan pool workers)
+
+
+def _add_into(target, metrics):
+    for key, value in dict(metrics.counters).items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, series in dict(metrics.histograms).items():
+        total = target.histograms.setdefault(key, [0] * len(series))
+        for i, value in enumerate(list(series)):
+            total[i] += value
+
+
+def _retire_dead_threads():
+    """Folds exited threads into _retired, so _threads only holds live ones. Needs _threads_lock."""
+    live = []
+    for thread, metrics in _threads:
+        if thread.is_alive():
+            live.append((thread, metrics))
+        else:
+            _add_into(_retired, metrics)
+    _threads[:] = live
+
+
+def _mine():
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        metrics = _local.metrics = _ThreadMetrics()
+        with _threads_lock:
+            _retire_dead_threads()
+            _threads.append((threading.current_thread(), metrics))
+    return metrics
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    counters = _mine().counters
+    key = (name, _labels(labels))
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    histograms = _mine().histograms
+    key = (name, _labels(labels))
+    buckets = _definitions[name][2]
+    series = histograms.get(key)
+    if series is None:
+        series = histograms[key] = [0] * (len(buckets) + 2)
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            series[i] += 1
+            break
+    else:
+        series[len(buckets)] += 1
+    series[-1] += value
+
+
+def timed(name, **labels):
+    """Decorator observing the wrapped call's duration in histogram `name`."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+def cache_result(cache, hit):
+    inc('medtrack_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+# --- Standard metrics ---
+
+counter('medtrack_http_requests_total', 'HTTP requests by endpoint, method and status')
+histogram('medtrack_http_request_duration_seconds', 'HTTP request latency by endpoint')
+histogram('medtrack_backend_call_duration_seconds', 'DynamoDB / SNS / Bedrock / LocalStorage call latency')
+histogram('medtrack_model_inference_seconds', 'Model inference latency by model')
+counter('medtrack_cache_requests_total', 'Cache lookups by cache and result')
+
+
+# --- Snapshots and merging ---
+
+def _snapshot():
+    total = _ThreadMetrics()
+    with _threads_lock:
+        _retire_dead_threads()
+        _add_into(total, _retired)
+        threads = [metrics for _, metrics in _threads]
+    for metrics in threads:
+        # dict() copies in one step under the GIL, so the owning thread can keep writing
+        _add_into(total, metrics)
+    counters, histograms = total.counters, total.histograms
+    # In-flight requests are a per-process gauge, so an exited worker never leaves any behind
+    in_flight = sum(v for (name, _), v in counters.items() if name == IN_FLIGHT)
+    gauges = [['medtrack_http_requests_in_flight', [], in_flight, 'sum']]
+    for name, fn, mode in _gauges:
+        try:
+            value = fn()
+        except Exception as e:
+            logger.warning(f"Gauge {name} failed: {e}")
+            continue
+        for labels, v in (value.items() if isinstance(value, dict) else [((), value)]):
+            gauges.append([name, list(labels), v, mode])
+    return {
+        'pid': os.getpid(),
+        'written_at': time.time(),
+        'counters': [[name, list(labels), v] for (name, labels), v in counters.items() if name != IN_FLIGHT],
+        'histograms': [[name, list(labels), s] for (name, labels), s in histograms.items()],
+        'gauges': gauges
+    }
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{uuid.uuid4().hex}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _snapshot_path():
+    global _instance
+    if _instance is None or _instance[0] != os.getpid():  # first call, or a forked worker
+        _instance = (os.getpid(), uuid.uuid4().hex[:8])
+    return os.path.join(METRICS_DIR, f"worker-{_instance[0]}-{_instance[1]}.json")
+
+
+def write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path()
+    _write_json(path, _snapshot())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+                _flusher.start()
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add_totals(counters, histograms, snap):
+    for name, labels, value in snap['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, series in snap['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, [0] * len(series))
+        for i, value in enumerate(series):
+            total[i] += value
+
+
+@contextmanager
+def _folding_lock():
+    """Serialises folding between workers; yields False where files cannot be locked."""
+    if fcntl is None:
+        yield False
+        return
+    with open(os.path.join(METRICS_DIR, 'archive.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _fold(archive, filenames, dead):
+    """Adds the `dead` {filename: snapshot} totals to the archive, then deletes their files."""
+    counters, histograms = {}, {}
+    _add_totals(counters, histograms, archive)
+    for snap in dead.values():
+        _add_totals(counters, histograms, snap)
+    archive['counters'] = [[name, list(labels), v] for (name, labels), v in counters.items()]
+    archive['histograms'] = [[name, list(labels), s] for (name, labels), s in histograms.items()]
+    # Names of folded files that are still on disk, so a failed delete is never counted twice
+    archive['folded'] = sorted((set(archive['folded']) & filenames) | set(dead))
+    _write_json(os.path.join(METRICS_DIR, ARCHIVE_FILE), archive)
+    for filename in dead:
+        try:
+            os.remove(os.path.join(METRICS_DIR, filename))
+        except OSError as e:
+            logger.warning(f"Could not delete metrics file {filename}: {e}")
+
+
+def collect():
+    """Merged view of every worker: (counters, histograms, gauges) keyed by (name, labels)."""
+    write_snapshot()
+    counters, histograms, gauges = {}, {}, {}
+    with _folding_lock() as can_fold:
+        archive = _read_json(os.path.join(METRICS_DIR, ARCHIVE_FILE)) or {}
+        archive = {'counters': archive.get('counters', []), 'histograms': archive.get('histograms', []),
+                   'folded': archive.get('folded', [])}
+        filenames = {f for f in os.listdir(METRICS_DIR) if f.startswith('worker-') and f.endswith('.json')}
+        live, dead = [], {}
+        for filename in sorted(filenames - set(archive['folded'])):
+            snap = _read_json(os.path.join(METRICS_DIR, filename))
+            if snap is None:
+                continue
+            if snap['pid'] == os.getpid() or _pid_alive(snap['pid']):
+                live.append(snap)
+            else:
+                dead[filename] = snap
+        if can_fold and dead:
+            _fold(archive, filenames, dead)
+        else:
+            live.extend(dead.values())
+
+    _add_totals(counters, histograms, archive)
+    for snap in live:
+        _add_totals(counters, histograms, snap)
+    for snap in live:
+        if snap['pid'] == os.getpid() or _pid_alive(snap['pid']):
+            for name, labels, value, mode in snap['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = max(gauges.get(key, value), value) if mode == 'max' else gauges.get(key, 0) + value
+    return counters, histograms, gauges
+
+
+# --- Exposition ---
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _series(name, labels, value):
+    label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{label_text}}} {_number(value)}" if label_text else f"{name} {_number(value)}"
+
+
+def render():
+    counters, histograms, gauges = collect()
+
+    # Derived series: cache hit ratios
+    cache_totals = {}
+    for (name, labels), value in counters.items():
+        if name == 'medtrack_cache_requests_total':
+            label_map = dict(labels)
+            hits_total = cache_totals.setdefault(label_map['cache'], [0, 0])
+            hits_total[0 if label_map['result'] == 'hit' else 1] += value
+    for cache, (hits, misses) in cache_totals.items():
+        gauges[('medtrack_cache_hit_ratio', (('cache', cache),))] = hits / (hits + misses) if hits + misses else 0
+    descriptions = dict(_definitions)
+    descriptions['medtrack_http_requests_in_flight'] = ('gauge', 'Requests being handled right now', None)
+    descriptions['medtrack_cache_hit_ratio'] = ('gauge', 'Cache hits / lookups since start', None)
+
+    lines = []
+    by_name = {}
+    for kind, series in (('counter', counters), ('histogram', histograms), ('gauge', gauges)):
+        for (name, labels), value in series.items():
+            by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        kind, help_text, buckets = descriptions.get(name, ('gauge', name, None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(_series(name, labels, value))
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(_series(f"{name}_bucket", labels + (('le', f"{bound:g}" if bound != '+Inf' else bound),),
+                                     cumulative))
+            lines.append(_series(f"{name}_sum", labels, value[-1]))
+            lines.append(_series(f"{name}_count", labels, cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+# --- Flask ---
+
+def _observe_backend(service, operation, target, seconds):
+    observe('medtrack_backend_call_duration_seconds', seconds, service=service, operation=operation,
+            table=target or '')
+
+
+def init_app(app):
+    """Per-endpoint request metrics, backend call latency and the /metrics route."""
+    from flask import request, g, Response
+    import request_accounting
+
+    if _observe_backend not in request_accounting.listeners:
+        request_accounting.listeners.append(_observe_backend)
+
+    @app.before_request
+    def _start_metrics():
+        _ensure_flusher()
+        g.metrics_started = time.perf_counter()
+        inc(IN_FLIGHT)
+
+    @app.after_request
+    def _record_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            inc('medtrack_http_requests_total', endpoint=endpoint, method=request.method,
+                status=response.status_code)
+            observe('medtrack_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def _finish_metrics(exc=None):
+        if g.pop('metrics_started', None) is not None:
+            inc(IN_FLIGHT, -1)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        token = os.environ.get('MEDTRACK_METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
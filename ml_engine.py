@@ -1,4 +1,15 @@
 import random
+import lazy_loader
+import metrics
+import tracing
+
+# Modules whose scikit-learn/TensorFlow imports are deferred until first use
+DIAGNOSTIC_MODULES = ('image_diagnostic', 'signal_diagnostic')
+
+
+def preload_from_config():
+    """Warms the diagnostic engines' imports according to MEDTRACK_ML_PRELOAD (off by default)."""
+    return lazy_loader.preload_from_config(DIAGNOSTIC_MODULES)
 
 class MultimodalPredictor:
     def __init__(self):
@@ -21,6 +32,8 @@ class MultimodalPredictor:
             "Tuberculosis": ["cough", "fever", "sweat", "weight", "blood"]
         }
 
+    @metrics.timed('medtrack_model_inference_seconds', model='symptoms')
+    @tracing.traced('model.predict', model='symptoms')
     def predict(self, text_data, image_filename):
         """
         Simulates a multimodal analysis blending text features and image features.
@@ -76,6 +89,8 @@ class MultimodalPredictor:
         return result
 
     # --- Phase 22: Advanced Multimodal Prediction ---
+    @metrics.timed('medtrack_model_inference_seconds', model='image')
+    @tracing.traced('model.predict', model='image')
     def predict_image(self, image_data=None, filename=""):
         """Simulates CNN analysis on X-Ray/MRI images."""
         
@@ -128,6 +143,8 @@ class MultimodalPredictor:
             "analysis": details
         }
 
+    @metrics.timed('medtrack_model_inference_seconds', model='signal')
+    @tracing.traced('model.predict', model='signal')
     def predict_signal(self, signal_data_text=""):
         """Simulates Signal Processing on ECG/EEG data."""
         # Try to use the Advanced Engine if available
@@ -165,6 +182,8 @@ class MultimodalPredictor:
             "analysis": details
         }
 
+    @metrics.timed('medtrack_model_inference_seconds', model='genomics')
+    @tracing.traced('model.predict', model='genomics')
     def predict_genomics(self, sequence_data=""):
         """Simulates Genomic Sequence Analysis."""
         confidence = random.randint(90, 99)
@@ -187,6 +206,8 @@ class MultimodalPredictor:
             "analysis": details
         }
 
+    @metrics.timed('medtrack_model_inference_seconds', model='fracture')
+    @tracing.traced('model.predict', model='fracture')
     def predict_fracture(self, filename=""):
         """Simulates Bone Fracture Detection using SVM concepts."""
         confidence = random.randint(88, 98)
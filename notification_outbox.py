@@ -0,0 +1,401 @@
+"""
+Durable outbox for SNS notifications.
+
+Request handlers enqueue notifications (one SQLite insert) and return; a
+background worker delivers them. Topic notifications go out through
+`publish_batch` (up to 10 entries per call), SMS through single `publish`
+calls. Failed deliveries are retried with exponential backoff and jitter.
+The spool survives restarts and can be shared by several workers: rows are
+claimed with a lease, so each notification is sent by a single worker.
+
+Notifications can carry a `coalesce_key` (recipient + entity): they are held
+for a short window, and later notifications with the same key replace the
+pending one, so only the latest state is sent. An `idempotency_key` makes a
+repeated enqueue of the same logical notification a no-op. Keys live in their
+own table: every key merged into a coalesced row stays recognised, so a late
+retry of an earlier state cannot overwrite a newer one.
+"""
+import os
+import json
+import hashlib
+import time
+import atexit
+import random
+import sqlite3
+import logging
+import threading
+import tracing
+
+logger = logging.getLogger("MedTrack-Outbox")
+
+# Next to LocalStorage's files (MEDTRACK_LOCAL_DATA_DIR, else local_data/, which git ignores)
+DEFAULT_SPOOL_PATH = os.environ.get('MEDTRACK_OUTBOX_PATH') or os.path.join(
+    os.environ.get('MEDTRACK_LOCAL_DATA_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_data'),
+    'notification_outbox.sqlite3')
+
+BATCH_SIZE = 10  # SNS PublishBatch limit
+CLAIM_LIMIT = 100  # Rows claimed per worker pass
+LEASE_SECONDS = 60  # A crashed worker's claims become available again after this
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 300.0
+IDLE_WAIT_SECONDS = 5.0
+LINGER_SECONDS = 0.05  # After a wakeup, wait briefly so concurrent enqueues share a batch
+# How long a coalescable notification waits for newer state before it is sent
+COALESCE_WINDOW_SECONDS = float(os.environ.get('MEDTRACK_NOTIFY_COALESCE_SECONDS', 5))
+IDEMPOTENCY_RETENTION_SECONDS = 24 * 3600  # Keys (and dead rows) are kept this long
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    params TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    coalesce_key TEXT,
+    idempotency_key TEXT,
+    sent_at REAL
+);
+CREATE TABLE IF NOT EXISTS outbox_keys (
+    channel TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    outbox_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (channel, idempotency_key)
+);
+"""
+# Columns added after the first release; older spools are upgraded in place
+MIGRATIONS = [('coalesce_key', 'TEXT'), ('idempotency_key', 'TEXT'), ('sent_at', 'REAL')]
+INDEXES = """
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (channel, status, next_attempt);
+CREATE INDEX IF NOT EXISTS outbox_coalesce ON outbox (channel, coalesce_key, status);
+CREATE INDEX IF NOT EXISTS outbox_keys_age ON outbox_keys (created_at);
+"""
+# Spools from before outbox_keys kept keys on the rows themselves (and sent rows for dedup)
+LEGACY_KEYS = """
+INSERT OR IGNORE INTO outbox_keys (channel, idempotency_key, outbox_id, created_at)
+    SELECT channel, idempotency_key, id, COALESCE(sent_at, created_at) FROM outbox
+    WHERE idempotency_key IS NOT NULL;
+UPDATE outbox SET idempotency_key = NULL WHERE idempotency_key IS NOT NULL;
+DELETE FROM outbox WHERE status = 'sent';
+DROP INDEX IF EXISTS outbox_idempotency;
+"""
+
+
+def backoff_delay(attempts, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Exponential backoff with jitter (half to full delay) after `attempts` failures."""
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class NotificationOutbox:
+    """
+    `client_factory()` returns an SNS client, or None to run in simulation
+    mode (notifications are logged instead of sent). `before_send(params)`
+    runs once per notification right before its first delivery attempt.
+    """
+
+    def __init__(self, client_factory, channel='default', path=DEFAULT_SPOOL_PATH, before_send=None):
+        self.client_factory = client_factory
+        self.channel = channel
+        self.path = path
+        self.before_send = before_send
+        self.stats = {'enqueued': 0, 'coalesced': 0, 'duplicates': 0, 'sent': 0, 'retried': 0,
+                      'dead': 0, 'api_calls': 0}
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = False
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+            for name, sql_type in MIGRATIONS:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE outbox ADD COLUMN {name} {sql_type}")
+            conn.executescript(INDEXES)
+            conn.executescript(LEGACY_KEYS)
+        finally:
+            conn.close()
+        atexit.register(self.stop)
+        # Deliver whatever an earlier run left in the spool
+        if self.pending_count():
+            self._ensure_worker()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    # --- Producer side ---
+
+    @tracing.traced('notification.enqueue')
+    def enqueue(self, coalesce_key=None, idempotency_key=None, coalesce_window=None, **params):
+        """
+        Spools one SNS publish (same keyword arguments as `sns.publish`); returns its outbox id.
+
+        With `coalesce_key`, the notification is held for `coalesce_window`
+        seconds (default COALESCE_WINDOW_SECONDS); an enqueue with the same key
+        in that time replaces its content instead of adding a message. With
+        `idempotency_key`, enqueueing a key seen in the last
+        IDEMPOTENCY_RETENTION_SECONDS (pending, sent, coalesced into another
+        row or dead) returns that id and sends nothing.
+        """
+        if not params.get('TopicArn') and not params.get('PhoneNumber'):
+            logger.warning("No destination provided for notification")
+            return None
+        if idempotency_key and str(params.get('TopicArn', '')).endswith('.fifo'):
+            # FIFO topics deduplicate on their side too
+            params['MessageDeduplicationId'] = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        window = COALESCE_WINDOW_SECONDS if coalesce_window is None else coalesce_window
+        now = time.time()
+        outcome = 'enqueued'
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = None
+            if idempotency_key:
+                existing = conn.execute(
+                    "SELECT outbox_id FROM outbox_keys WHERE channel = ? AND idempotency_key = ?",
+                    (self.channel, idempotency_key)).fetchone()
+                if existing:
+                    outcome = 'duplicates'
+            if not existing and coalesce_key:
+                # Only rows that no worker has picked up yet can still be rewritten
+                existing = conn.execute(
+                    "SELECT id FROM outbox WHERE channel = ? AND coalesce_key = ? AND status = 'pending' "
+                    "AND attempts = 0 AND claimed_until <= ? ORDER BY id DESC LIMIT 1",
+                    (self.channel, coalesce_key, now)).fetchone()
+                if existing:
+                    outcome = 'coalesced'
+                    conn.execute("UPDATE outbox SET params = ? WHERE id = ?", (json.dumps(params), existing[0]))
+            if existing:
+                outbox_id = existing[0]
+            else:
+                cursor = conn.execute(
+                    "INSERT INTO outbox (channel, params, next_attempt, created_at, coalesce_key) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.channel, json.dumps(params), now + window if coalesce_key else 0, now, coalesce_key))
+                outbox_id = cursor.lastrowid
+            if idempotency_key and outcome != 'duplicates':
+                # Added, never replaced: the row answers to every key merged into it
+                conn.execute("INSERT INTO outbox_keys (channel, idempotency_key, outbox_id, created_at) "
+                             "VALUES (?, ?, ?, ?)", (self.channel, idempotency_key, outbox_id, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self._count(**{outcome: 1})
+        if outcome == 'enqueued':
+            self._ensure_worker()
+            self._wakeup.set()
+        return outbox_id
+
+    def pending_count(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT COUNT(*) FROM outbox WHERE channel = ? AND status = 'pending'",
+                               (self.channel,)).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def flush(self, timeout=10.0):
+        """Blocks until every pending notification is delivered or dropped (or `timeout` passes)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.pending_count():
+                return True
+            self._wakeup.set()
+            time.sleep(0.05)
+        return False
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    # --- Worker side ---
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=f"outbox-{self.channel}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        time.sleep(LINGER_SECONDS)
+        while not self._stopping:
+            try:
+                rows = self._claim()
+                if rows:
+                    with tracing.trace('outbox.deliver', channel=self.channel, messages=len(rows)):
+                        self._deliver(rows)
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+            if self._wakeup.wait(self._idle_wait()):
+                time.sleep(LINGER_SECONDS)
+            self._wakeup.clear()
+
+    def _idle_wait(self):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MIN(MAX(next_attempt, claimed_until)) FROM outbox WHERE channel = ? AND status = 'pending'",
+                (self.channel,)).fetchone()
+        finally:
+            conn.close()
+        if row[0] is None:
+            return IDLE_WAIT_SECONDS
+        return min(IDLE_WAIT_SECONDS, max(0.0, row[0] - time.time()))
+
+    def _claim(self):
+        """Leases due rows to this worker so other processes skip them."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, params, attempts FROM outbox "
+                "WHERE channel = ? AND status = 'pending' AND next_attempt <= ? AND claimed_until <= ? "
+                "ORDER BY id LIMIT ?",
+                (self.channel, now, now, CLAIM_LIMIT)).fetchall()
+            if rows:
+                conn.executemany("UPDATE outbox SET claimed_until = ? WHERE id = ?",
+                                 [(now + LEASE_SECONDS, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [(row_id, json.loads(params), attempts) for row_id, params, attempts in rows]
+
+    def _deliver(self, rows):
+        client = self.client_factory()
+        sent, failed = [], []  # failed: (row, error, retryable)
+
+        topics = {}
+        for row in rows:
+            row_id, params, attempts = row
+            if self.before_send and attempts == 0:
+                try:
+                    self.before_send(params)
+                except Exception as e:
+                    logger.error(f"Outbox pre-send hook failed for {row_id}: {e}")
+            if params.get('TopicArn'):
+                topics.setdefault(params['TopicArn'], []).append(row)
+            else:
+                self._publish_single(client, row, sent, failed)
+
+        for topic_arn, topic_rows in topics.items():
+            for start in range(0, len(topic_rows), BATCH_SIZE):
+                self._publish_batch(client, topic_arn, topic_rows[start:start + BATCH_SIZE], sent, failed)
+
+        self._record(sent, failed)
+
+    def _publish_single(self, client, row, sent, failed):
+        row_id, params, _ = row
+        if client is None:
+            self._simulate(params)
+            sent.append(row)
+            return
+        try:
+            self._count(api_calls=1)
+            with tracing.span('sns.publish', outbox_id=row_id):
+                client.publish(**params)
+            sent.append(row)
+        except Exception as e:
+            failed.append((row, str(e), True))
+
+    def _publish_batch(self, client, topic_arn, rows, sent, failed):
+        if client is None:
+            for row in rows:
+                self._simulate(row[1])
+            sent.extend(rows)
+            return
+        by_entry_id = {}
+        entries = []
+        for row in rows:
+            entry_id = f"n{row[0]}"
+            by_entry_id[entry_id] = row
+            entry = {'Id': entry_id}
+            entry.update({k: v for k, v in row[1].items() if k != 'TopicArn'})
+            entries.append(entry)
+        try:
+            self._count(api_calls=1)
+            with tracing.span('sns.publish_batch', entries=len(entries)):
+                response = client.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+        except Exception as e:
+            # Throttling, network errors...: the whole batch is retried
+            failed.extend((row, str(e), True) for row in rows)
+            return
+        for result in response.get('Successful', []):
+            sent.append(by_entry_id[result['Id']])
+        for result in response.get('Failed', []):
+            error = f"{result.get('Code')}: {result.get('Message', '')}"
+            # SenderFault means the entry itself is invalid; resending will not help
+            failed.append((by_entry_id[result['Id']], error, not result.get('SenderFault')))
+
+    def _simulate(self, params):
+        print(f"\n[SIMULATED SNS] Subject: {params.get('Subject', '')}")
+        print(f"[SIMULATED SNS] To: {params.get('PhoneNumber') or params.get('TopicArn')}")
+        print(f"[SIMULATED SNS] Message: {params.get('Message')}\n")
+
+    def _record(self, sent, failed):
+        now = time.time()
+        retry, dead = [], []
+        delays = {}  # One delay per attempt count, so a failed batch is retried as a batch
+        for (row_id, _, attempts), error, retryable in failed:
+            attempts += 1
+            if retryable and attempts < MAX_ATTEMPTS:
+                delay = delays.setdefault(attempts, backoff_delay(attempts))
+                retry.append((attempts, now + delay, error, row_id))
+            else:
+                logger.error(f"Notification {row_id} dropped after {attempts} attempt(s): {error}")
+                dead.append((attempts, error, row_id))
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Keys are remembered in outbox_keys, so delivered rows can go straight away
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row in sent])
+            # Retention: old keys stop blocking repeats, old dead rows are dropped
+            conn.execute("DELETE FROM outbox_keys WHERE channel = ? AND created_at < ?",
+                         (self.channel, now - IDEMPOTENCY_RETENTION_SECONDS))
+            conn.execute("DELETE FROM outbox WHERE channel = ? AND status = 'dead' AND created_at < ?",
+                         (self.channel, now - IDEMPOTENCY_RETENTION_SECONDS))
+            conn.executemany(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ?, claimed_until = 0 WHERE id = ?",
+                retry)
+            conn.executemany(
+                "UPDATE outbox SET attempts = ?, last_error = ?, status = 'dead' WHERE id = ?", dead)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._count(sent=len(sent), retried=len(retry), dead=len(dead))
+        if sent:
+            logger.info(f"Outbox delivered {len(sent)} notification(s)")
@@ -0,0 +1,111 @@
+"""
+Cursor pagination for list views.
+
+Storage functions return one page and the key to resume from:
+
+    items, next_key = database.get_appointments_page(limit, start_key)
+
+next_key is DynamoDB's LastEvaluatedKey (or the same shape from LocalStorage
+and the in-memory store), None on the last page. Routes read ?limit= and
+?cursor= through request_page() and hand next_cursor / page_size to
+templates/pagination.html. A cursor is the key as URL-safe base64 JSON.
+
+Page size: MEDTRACK_PAGE_SIZE (default 25), never more than MAX_PAGE_SIZE.
+"""
+import os
+import json
+import base64
+import bisect
+import logging
+from decimal import Decimal
+
+logger = logging.getLogger("MedTrack-Pagination")
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('MEDTRACK_PAGE_SIZE', 25))
+MAX_PAGE_SIZE = 100
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_cursor(key):
+    if not key:
+        return None
+    raw = json.dumps(key, separators=(',', ':'), sort_keys=True, default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """The key behind a cursor; None (first page) for a missing or malformed one."""
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        logger.warning(f"Ignoring malformed cursor {token[:40]!r}")
+        return None
+    return key if isinstance(key, dict) else None
+
+
+def page_size(value=None):
+    try:
+        size = int(value) if value else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def request_page():
+    """(limit, start_key) from the current request's ?limit= and ?cursor=."""
+    from flask import request
+    return page_size(request.args.get('limit')), decode_cursor(request.args.get('cursor'))
+
+
+def template_args(next_key, limit):
+    return {'next_cursor': encode_cursor(next_key), 'page_size': limit}
+
+
+def paginate(keys, limit, start_key=None, key='id', lookup=None):
+    """One page of an in-memory collection whose keys are listed, sorted, in `keys`.
+
+    The page starts at the first key greater than the cursor's (a bisect), so
+    any page costs O(log N + limit) and a deleted cursor item is no problem.
+    Items are `lookup(k)`, or the keys themselves without a lookup.
+    """
+    start = 0
+    if start_key and start_key.get(key) is not None:
+        start = bisect.bisect_right(keys, str(start_key[key]))
+    page_keys = keys[start:start + limit]
+    next_key = {key: page_keys[-1]} if start + limit < len(keys) else None
+    return [lookup(k) for k in page_keys] if lookup else list(page_keys), next_key
+
+
+def scan_page(read, limit, start_key=None, key_attrs=('id',), read_limit=None, **params):
+    """One page from table.scan or table.query, following LastEvaluatedKey until it is full.
+
+    A FilterExpression can leave a DynamoDB page short (or empty), so reads
+    continue until `limit` items are found; `read_limit` (items evaluated per
+    read, default `limit`) can be raised for sparse filters. When a read
+    returns more than the page needs, the next key is built from the last
+    item kept; `key_attrs` must therefore be the table's key (plus the index
+    key for index queries).
+    """
+    items = []
+    while True:
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        response = read(Limit=read_limit or limit, **params)
+        batch = response.get('Items', [])
+        start_key = response.get('LastEvaluatedKey')
+        needed = limit - len(items)
+        if len(batch) > needed:
+            items.extend(batch[:needed])
+            return items, {attr: items[-1][attr] for attr in key_attrs}
+        items.extend(batch)
+        if not start_key:
+            return items, None
+        if len(items) == limit:
+            return items, start_key
@@ -0,0 +1,91 @@
+"""
+Parallel segmented scans for full-table work (admin reports, exports, repairs).
+
+    for item in parallel_scan.scan(appointments_table, FilterExpression='...', ExpressionAttributeValues={...}):
+        ...
+
+The table is split into TotalSegments (MEDTRACK_SCAN_SEGMENTS, default 4)
+and a thread pool scans every Segment at once. Each worker follows
+LastEvaluatedKey to the end of its segment, so a result is never cut off
+at DynamoDB's 1 MB page. Pages reach the caller through a bounded queue:
+items stream out as they arrive, and a slow consumer holds the workers back
+instead of buffering the table. Items come in no particular order.
+
+LocalStorage emulates Segment/TotalSegments, so the same code runs offline.
+"""
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("MedTrack-Scan")
+
+DEFAULT_SEGMENTS = int(os.environ.get('MEDTRACK_SCAN_SEGMENTS', 4))
+MAX_SEGMENTS = 64
+QUEUED_PAGES = 8  # pages buffered ahead of the consumer
+_DONE = object()
+
+
+def _offer(pages, value, stop):
+    """Blocking put that gives up once the consumer has gone away."""
+    while not stop.is_set():
+        try:
+            pages.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _scan_segment(table, segment, total, params, pages, stop):
+    start_key = None
+    try:
+        while not stop.is_set():
+            kwargs = dict(params, Segment=segment, TotalSegments=total)
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            response = table.scan(**kwargs)
+            if not _offer(pages, response.get('Items', []), stop):
+                return
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key:
+                break
+    except Exception as e:
+        logger.error(f"Scan segment {segment}/{total} failed: {e}")
+        _offer(pages, e, stop)
+    finally:
+        _offer(pages, _DONE, stop)
+
+
+def scan(table, segments=None, **params):
+    """Yields every item of `table` (scan kwargs such as FilterExpression pass through)."""
+    total = max(1, min(segments or DEFAULT_SEGMENTS, MAX_SEGMENTS))
+    pages = queue.Queue(maxsize=QUEUED_PAGES)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=total, thread_name_prefix='medtrack-scan')
+    try:
+        for segment in range(total):
+            executor.submit(_scan_segment, table, segment, total, params, pages, stop)
+        finished = 0
+        while finished < total:
+            page = pages.get()
+            if page is _DONE:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        # Also reached when the caller stops early: workers notice and exit
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def scan_all(table, segments=None, **params):
+    return list(scan(table, segments, **params))
+
+
+def count(table, segments=None, **params):
+    """Number of items, without keeping any of them."""
+    return sum(1 for _ in scan(table, segments, **params))
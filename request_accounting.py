@@ -0,0 +1,213 @@
+"""
+Per-request accounting of backend calls (DynamoDB, SNS, Bedrock, LocalStorage).
+
+Every botocore call made while a Flask request is being handled is counted
+with its latency and DynamoDB consumed capacity; so are LocalStorage calls.
+When one operation on one table repeats more than MEDTRACK_N_PLUS_ONE_THRESHOLD
+times (default 10) in a single request, a warning names the endpoint - the
+usual sign of a per-row lookup inside a loop.
+
+    MEDTRACK_REQUEST_ACCOUNTING=headers,log   X-Backend-* / Server-Timing headers and a log line per request
+    MEDTRACK_REQUEST_ACCOUNTING=off           no hooks at all
+
+With the default (unset) only the N+1 warnings are emitted. Calls made
+outside a request (background workers, boot) are not counted.
+"""
+import os
+import time
+import logging
+import threading
+from functools import wraps
+
+logger = logging.getLogger("MedTrack-Accounting")
+
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('MEDTRACK_N_PLUS_ONE_THRESHOLD', 10))
+
+# DynamoDB operations that accept ReturnConsumedCapacity
+CAPACITY_OPERATIONS = {'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+                       'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'}
+LOCAL_STORAGE_METHODS = {'get_item': 'GetItem', 'put_item': 'PutItem', 'update_item': 'UpdateItem',
+                         'delete_item': 'DeleteItem', 'query': 'Query', 'scan': 'Scan',
+                         'batch_write': 'BatchWriteItem'}
+
+_local = threading.local()
+listeners = []  # fn(service, operation, target, seconds), called for every call, in a request or not
+
+
+def modes():
+    return {m.strip().lower() for m in os.environ.get('MEDTRACK_REQUEST_ACCOUNTING', '').split(',') if m.strip()}
+
+
+def is_enabled():
+    return 'off' not in modes()
+
+
+class RequestStats:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.calls = 0
+        self.seconds = 0.0
+        self.capacity = 0.0
+        self.by_service = {}    # service -> [calls, seconds]
+        self.by_operation = {}  # (service, operation, target) -> calls
+        self.flagged = set()
+
+    def record(self, service, operation, target, seconds, capacity=0.0):
+        self.calls += 1
+        self.seconds += seconds
+        self.capacity += capacity
+        totals = self.by_service.setdefault(service, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        key = (service, operation, target)
+        count = self.by_operation[key] = self.by_operation.get(key, 0) + 1
+        if count > N_PLUS_ONE_THRESHOLD and key not in self.flagged:
+            self.flagged.add(key)
+            logger.warning(f"Possible N+1 in {self.endpoint}: {service} {operation}"
+                           f"{' on ' + target if target else ''} called more than {N_PLUS_ONE_THRESHOLD} times")
+
+    def headers(self):
+        timings = [f'{service};dur={seconds * 1000:.1f};desc="{calls} calls"'
+                   for service, (calls, seconds) in sorted(self.by_service.items())]
+        return {
+            'X-Backend-Calls': str(self.calls),
+            'X-Backend-Time-Ms': f"{self.seconds * 1000:.1f}",
+            'X-Backend-Capacity': f"{self.capacity:g}",
+            'Server-Timing': ', '.join(timings + [f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}"])
+        }
+
+    def summary(self):
+        top = sorted(self.by_operation.items(), key=lambda kv: -kv[1])[:5]
+        ops = ', '.join(f"{op}{'(' + target + ')' if target else ''} x{n}" for (_, op, target), n in top)
+        return (f"{self.endpoint}: {self.calls} backend calls, {self.seconds * 1000:.1f} ms, "
+                f"{self.capacity:g} capacity units [{ops}]")
+
+
+def current():
+    """Stats of the request being handled on this thread, or None."""
+    return getattr(_local, 'stats', None)
+
+
+def _tracking():
+    return current() is not None or bool(listeners)
+
+
+def record(service, operation, target, seconds, capacity=0.0):
+    stats = current()
+    if stats is not None:
+        stats.record(service, operation, target, seconds, capacity)
+    for listener in listeners:
+        listener(service, operation, target, seconds)
+
+
+# --- botocore hooks ---
+
+def _consumed_capacity(parsed):
+    consumed = (parsed or {}).get('ConsumedCapacity')
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(float(c.get('CapacityUnits', 0)) for c in consumed or [])
+
+
+def _before_parameter_build(params, model, context, **kwargs):
+    if not _tracking():
+        return
+    context['medtrack_target'] = params.get('TableName') or params.get('TopicArn') or params.get('modelId')
+    if current() is not None and model.service_model.service_name == 'dynamodb' \
+            and model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(context, **kwargs):
+    if _tracking():
+        context['medtrack_started'] = time.perf_counter()
+
+
+def _after_call(event_name, context, parsed=None, **kwargs):
+    # after-call and after-call-error (no model there): "after-call.<service>.<Operation>"
+    started = context.pop('medtrack_started', None)
+    if started is not None:
+        _, service, operation = event_name.split('.', 2)
+        record(service, operation, context.pop('medtrack_target', None),
+               time.perf_counter() - started, _consumed_capacity(parsed))
+
+
+def _register(events):
+    events.register('before-parameter-build', _before_parameter_build, unique_id='medtrack-accounting-params')
+    events.register('before-call', _before_call, unique_id='medtrack-accounting-before')
+    events.register('after-call', _after_call, unique_id='medtrack-accounting-after')
+    events.register('after-call-error', _after_call, unique_id='medtrack-accounting-error')
+
+
+def install(*clients):
+    """Hooks existing boto3 clients/resources and every client created later from the default session."""
+    if not is_enabled():
+        return
+    try:
+        import boto3
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        _register(boto3.DEFAULT_SESSION.events)
+    except ImportError:
+        pass
+    for client in clients:
+        client = getattr(getattr(client, 'meta', None), 'client', client)  # resources -> their client
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is not None:
+            _register(events)
+
+
+# --- LocalStorage ---
+
+def _timed_method(method, operation):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _tracking():
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            record('local', operation, self.table_name, time.perf_counter() - started)
+    wrapper.medtrack_accounted = True
+    return wrapper
+
+
+def instrument_local_storage(cls):
+    """Counts calls to the DynamoDB-style methods of LocalStorage (or a compatible class)."""
+    if not is_enabled():
+        return cls
+    for name, operation in LOCAL_STORAGE_METHODS.items():
+        method = getattr(cls, name, None)
+        if method is not None and not getattr(method, 'medtrack_accounted', False):
+            setattr(cls, name, _timed_method(method, operation))
+    return cls
+
+
+# --- Flask ---
+
+def init_app(app):
+    """Opens an accounting scope around every request of `app`."""
+    if not is_enabled():
+        return
+    from flask import request
+
+    @app.before_request
+    def _start_accounting():
+        _local.stats = RequestStats(request.endpoint or request.path)
+
+    @app.after_request
+    def _report_accounting(response):
+        stats = current()
+        if stats is not None:
+            enabled = modes()
+            if 'headers' in enabled:
+                response.headers.update(stats.headers())
+            if 'log' in enabled:
+                logger.info(stats.summary())
+        return response
+
+    @app.teardown_request
+    def _end_accounting(exc=None):
+        _local.stats = None
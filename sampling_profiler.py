@@ -0,0 +1,307 @@
+"""
+Opt-in sampling profiler for live requests.
+
+An admin enables it for a route pattern and a sample rate:
+
+    POST /admin/profiler            pattern=/patient_dashboard rate=0.2 duration=300 [interval_ms=10]
+    GET  /admin/profiler            rules and collected profiles (JSON)
+    GET  /admin/profiler/profile?route=/patient_dashboard   collapsed stacks (flamegraph.pl / speedscope)
+    POST /admin/profiler/stop       [clear=1 also deletes the collected stacks]
+
+A single request can also be profiled by an admin with the header
+`X-MedTrack-Profile: 1`.
+
+While a matching request runs, a background thread reads its stack through
+sys._current_frames() every interval. The stacks are aggregated per route
+and written, per worker, to MEDTRACK_PROFILE_DIR. Rules live in a file in
+that same directory, so every worker on the host follows them. When no rule
+is active, a request costs a cached lookup (the rules file is re-checked
+at most once a second), and no sampler thread runs.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import fnmatch
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger("MedTrack-Profiler")
+
+PROFILE_DIR = os.environ.get('MEDTRACK_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'medtrack_profiles'))
+CONFIG_POLL_SECONDS = 1.0
+FLUSH_SECONDS = 2.0
+DEFAULT_INTERVAL_MS = 10
+MAX_DURATION_SECONDS = 3600
+MAX_STACK_DEPTH = 200
+FORCE_HEADER = 'X-MedTrack-Profile'
+
+_config = {'rules': [], 'interval_ms': DEFAULT_INTERVAL_MS}
+_config_mtime = None
+_config_checked = 0.0
+
+_active = {}   # thread id -> route being profiled on that thread
+_samples = {}  # route -> {collapsed stack: count}
+_samples_lock = threading.Lock()
+_dirty = False
+_wakeup = threading.Event()
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _config_path():
+    return os.path.join(PROFILE_DIR, 'rules.json')
+
+
+def _slug(route):
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+def _write_json(path, data):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def current_config():
+    """Rules shared by every worker; re-read when the file changes (checked once a second)."""
+    global _config, _config_mtime, _config_checked
+    now = time.monotonic()
+    if now - _config_checked < CONFIG_POLL_SECONDS:
+        return _config
+    _config_checked = now
+    try:
+        mtime = os.stat(_config_path()).st_mtime
+    except OSError:
+        _config, _config_mtime = {'rules': [], 'interval_ms': DEFAULT_INTERVAL_MS}, None
+        return _config
+    if mtime != _config_mtime:
+        try:
+            with open(_config_path()) as f:
+                _config, _config_mtime = json.load(f), mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read profiler rules: {e}")
+    return _config
+
+
+def enable(pattern, rate=1.0, duration=300, interval_ms=DEFAULT_INTERVAL_MS):
+    """Adds (or replaces) the rule for `pattern`: profile `rate` of matching requests for `duration` seconds."""
+    config = dict(current_config())
+    rules = [r for r in config.get('rules', []) if r['pattern'] != pattern and r['until'] > time.time()]
+    rules.append({'pattern': pattern, 'rate': max(0.0, min(float(rate), 1.0)),
+                  'until': time.time() + min(float(duration), MAX_DURATION_SECONDS)})
+    config.update(rules=rules, interval_ms=max(1, int(interval_ms)))
+    _write_json(_config_path(), config)
+    _reload()
+    logger.info(f"Profiling {pattern} at rate {rate} for {duration}s")
+    return config
+
+
+def disable(clear=False):
+    _write_json(_config_path(), {'rules': [], 'interval_ms': DEFAULT_INTERVAL_MS})
+    _reload()
+    if clear:
+        with _samples_lock:
+            _samples.clear()
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith('.folded'):
+                os.remove(os.path.join(PROFILE_DIR, name))
+
+
+def _reload():
+    global _config_checked
+    _config_checked = 0.0
+    current_config()
+
+
+def match(route, path):
+    """True if this request should be sampled under the current rules."""
+    rules = current_config().get('rules')
+    if not rules:
+        return False
+    now = time.time()
+    for rule in rules:
+        if rule['until'] > now and (fnmatch.fnmatchcase(route, rule['pattern'])
+                                    or fnmatch.fnmatchcase(path, rule['pattern'])):
+            return random.random() < rule['rate']
+    return False
+
+
+# --- Sampling ---
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                     .replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample_loop():
+    global _dirty
+    last_flush = time.monotonic()
+    while True:
+        if not _active:
+            if _dirty:
+                flush()
+            _wakeup.wait()
+            _wakeup.clear()
+            continue
+        time.sleep(current_config().get('interval_ms', DEFAULT_INTERVAL_MS) / 1000.0)
+        frames = sys._current_frames()
+        with _samples_lock:
+            for thread_id, route in list(_active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stacks = _samples.setdefault(route, {})
+                stack = _collapse(frame)
+                stacks[stack] = stacks.get(stack, 0) + 1
+                _dirty = True
+        del frames
+        if time.monotonic() - last_flush >= FLUSH_SECONDS:
+            flush()
+            last_flush = time.monotonic()
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample_loop, name='sampling-profiler', daemon=True)
+                _sampler.start()
+
+
+def start(route):
+    """Samples the calling thread under `route` until stop()."""
+    _ensure_sampler()
+    _active[threading.get_ident()] = route
+    _wakeup.set()
+
+
+def stop():
+    _active.pop(threading.get_ident(), None)
+
+
+def flush():
+    """Writes this worker's stacks to PROFILE_DIR (<route>.<pid>.folded)."""
+    global _dirty
+    with _samples_lock:
+        snapshot = {route: dict(stacks) for route, stacks in _samples.items()}
+        _dirty = False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for route, stacks in snapshot.items():
+        path = os.path.join(PROFILE_DIR, f"{_slug(route)}.{os.getpid()}.folded")
+        tmp = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp, 'w') as f:
+            f.write(f"# route {route}\n")
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+        os.replace(tmp, path)
+
+
+def _profile_files():
+    """{route: [paths]} for every worker's collapsed-stack files."""
+    files = {}
+    if not os.path.isdir(PROFILE_DIR):
+        return files
+    for name in sorted(os.listdir(PROFILE_DIR)):
+        if not name.endswith('.folded'):
+            continue
+        path = os.path.join(PROFILE_DIR, name)
+        with open(path) as f:
+            header = f.readline()
+        if header.startswith('# route '):
+            files.setdefault(header[len('# route '):].rstrip('\n'), []).append(path)
+    return files
+
+
+def collapsed(route):
+    """Merged collapsed stacks of every worker for `route`, hottest first."""
+    flush()
+    totals = {}
+    for path in _profile_files().get(route, []):
+        with open(path) as f:
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    continue
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                totals[stack] = totals.get(stack, 0) + int(count)
+    return ''.join(f"{stack} {count}\n" for stack, count in sorted(totals.items(), key=lambda kv: -kv[1]))
+
+
+# --- Flask ---
+
+def init_app(app, is_admin):
+    """Request hooks plus the /admin/profiler endpoints; `is_admin()` guards them."""
+    from flask import request, g, jsonify, Response
+
+    @app.before_request
+    def _maybe_profile():
+        route = request.url_rule.rule if request.url_rule else request.path
+        forced = FORCE_HEADER in request.headers and is_admin()
+        if forced or match(route, request.path):
+            g.profiling = True
+            start(route)
+
+    @app.teardown_request
+    def _stop_profile(exc=None):
+        if g.pop('profiling', False):
+            stop()
+
+    def _admin_only():
+        if not is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        return None
+
+    @app.route('/admin/profiler', methods=['GET', 'POST'])
+    def profiler_status():
+        denied = _admin_only()
+        if denied:
+            return denied
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or request.form
+            pattern = data.get('pattern')
+            if not pattern:
+                return jsonify({'error': 'pattern is required'}), 400
+            try:
+                enable(pattern, data.get('rate', 1.0), data.get('duration', 300),
+                       data.get('interval_ms', DEFAULT_INTERVAL_MS))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'rate, duration and interval_ms must be numbers'}), 400
+        flush()
+        now = time.time()
+        return jsonify({
+            'rules': [dict(rule, remaining_seconds=round(rule['until'] - now))
+                      for rule in current_config().get('rules', []) if rule['until'] > now],
+            'interval_ms': current_config().get('interval_ms', DEFAULT_INTERVAL_MS),
+            'profiles': sorted(_profile_files())
+        })
+
+    @app.route('/admin/profiler/stop', methods=['POST'])
+    def profiler_stop():
+        denied = _admin_only()
+        if denied:
+            return denied
+        disable(clear=request.values.get('clear') in ('1', 'true'))
+        return jsonify({'status': 'stopped'})
+
+    @app.route('/admin/profiler/profile')
+    def profiler_download():
+        denied = _admin_only()
+        if denied:
+            return denied
+        route = request.args.get('route', '')
+        flush()
+        if route not in _profile_files():
+            return jsonify({'error': f'No samples for {route!r}'}), 404
+        return Response(collapsed(route), mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename="{_slug(route)}.folded"'})
@@ -7,4 +7,7 @@ if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8080))
     print(f"Starting production server...")
     print(f"👉 Open in browser: http://localhost:{port}")
-    serve(app, host='0.0.0.0', port=port)
+    # Each open chat stream (/api/chat/stream) holds a thread, so run more than waitress' default 4.
+    # Streams are capped at MEDTRACK_SSE_MAX_STREAMS (16) so the rest keep serving requests.
+    threads = int(os.environ.get('WAITRESS_THREADS', 32))
+    serve(app, host='0.0.0.0', port=port, threads=threads)
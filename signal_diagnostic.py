@@ -1,26 +1,25 @@
 import numpy as np
 import os
+import lazy_loader
 
-# Conditional imports to prevent crashes if libs are missing
-try:
-    import joblib
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.svm import SVC
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import classification_report
-    from sklearn.preprocessing import StandardScaler
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-    joblib = None  # Placeholder
-
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential
-    from tensorflow.keras.layers import Conv1D, MaxPooling1D, Flatten, Dense, Dropout
-    TF_AVAILABLE = True
-except ImportError:
-    TF_AVAILABLE = False
+# Heavy libraries are imported on first use (see lazy_loader.py); importing
+# this module is cheap and never fails if they are missing.
+SKLEARN_AVAILABLE = lazy_loader.is_installed('sklearn') and lazy_loader.is_installed('joblib')
+joblib = lazy_loader.LazyModule('joblib')
+RandomForestClassifier = lazy_loader.lazy_attr('sklearn.ensemble', 'RandomForestClassifier')
+SVC = lazy_loader.lazy_attr('sklearn.svm', 'SVC')
+train_test_split = lazy_loader.lazy_attr('sklearn.model_selection', 'train_test_split')
+classification_report = lazy_loader.lazy_attr('sklearn.metrics', 'classification_report')
+StandardScaler = lazy_loader.lazy_attr('sklearn.preprocessing', 'StandardScaler')
+
+TF_AVAILABLE = lazy_loader.is_installed('tensorflow')
+tf = lazy_loader.LazyModule('tensorflow')
+Sequential = lazy_loader.lazy_attr('tensorflow.keras.models', 'Sequential')
+Conv1D = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Conv1D')
+MaxPooling1D = lazy_loader.lazy_attr('tensorflow.keras.layers', 'MaxPooling1D')
+Flatten = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Flatten')
+Dense = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Dense')
+Dropout = lazy_loader.lazy_attr('tensorflow.keras.layers', 'Dropout')
 
 class SignalDiagnosticEngine:
     def __init__(self, model_dir='models'):
@@ -70,6 +69,13 @@ class SignalDiagnosticEngine:
         - Variance
         - Zero-Crossing Rate
         """
+        batch = self._as_batch(signals)
+        if batch is not None:
+            # Equal-length signals: one vectorised pass over the whole batch
+            zcr = ((batch[:, :-1] * batch[:, 1:]) < 0).sum(axis=1)
+            return np.column_stack([np.sqrt(np.mean(batch**2, axis=1)), np.mean(batch, axis=1),
+                                    np.var(batch, axis=1), zcr])
+
         features = []
         for sig in signals:
             rms = np.sqrt(np.mean(sig**2))
@@ -81,9 +87,23 @@ class SignalDiagnosticEngine:
             features.append([rms, mean_val, var_val, zcr])
         return np.array(features)
 
+    @staticmethod
+    def _as_batch(signals):
+        """2D float array if all signals have the same length, else None."""
+        if isinstance(signals, np.ndarray) and signals.ndim == 2:
+            return signals
+        lengths = {len(sig) for sig in signals}
+        if len(lengths) != 1:
+            return None
+        return np.asarray(signals, dtype=float)
+
     # --- FFT Preprocessing (Task 2) ---
     def apply_fft(self, signals):
         """Applies Fast Fourier Transform to shift to frequency domain."""
+        batch = self._as_batch(signals)
+        if batch is not None:
+            return np.abs(np.fft.rfft(batch, axis=1))
+
         fft_features = []
         for sig in signals:
             # Absolute value of real-valued FFT
@@ -107,14 +127,18 @@ class SignalDiagnosticEngine:
         return "Random Forest Trained & Saved"
 
     def predict_simple(self, signal):
+        result = self.predict_simple_batch([signal])
+        return result if isinstance(result, str) else result[0]
+
+    def predict_simple_batch(self, signals):
+        """One model call for many signals; returns a label per signal."""
         if self.rf_model is None:
              # Try load
              try: self.rf_model = joblib.load(f'{self.model_dir}/rf_model.pkl')
              except: return "Model not trained"
              
-        features = self.extract_features([signal])
-        prediction = self.rf_model.predict(features)[0]
-        return "Disease" if prediction == 1 else "Healthy"
+        features = self.extract_features(signals)
+        return ["Disease" if prediction == 1 else "Healthy" for prediction in self.rf_model.predict(features)]
 
     # --- Task 2: Intermediate (SVM + FFT) ---
     def train_intermediate_model(self):
@@ -136,16 +160,19 @@ class SignalDiagnosticEngine:
         return "SVM Trained & Saved"
 
     def predict_intermediate(self, signal):
+        result = self.predict_intermediate_batch([signal])
+        return result if isinstance(result, str) else result[0]
+
+    def predict_intermediate_batch(self, signals):
         if self.svm_model is None:
             try: 
                 self.svm_model = joblib.load(f'{self.model_dir}/svm_model.pkl')
                 self.scaler = joblib.load(f'{self.model_dir}/scaler.pkl')
             except: return "Model not trained"
             
-        fft_feat = self.apply_fft([signal])
+        fft_feat = self.apply_fft(signals)
         fft_scaled = self.scaler.transform(fft_feat)
-        prediction = self.svm_model.predict(fft_scaled)[0]
-        return "Disease" if prediction == 1 else "Healthy"
+        return ["Disease" if prediction == 1 else "Healthy" for prediction in self.svm_model.predict(fft_scaled)]
 
     # --- Task 3: Advanced (1D-CNN) ---
     def train_advanced_model(self):
@@ -176,15 +203,19 @@ class SignalDiagnosticEngine:
         return "CNN Trained & Saved"
 
     def predict_advanced(self, signal):
+        result = self.predict_advanced_batch(np.asarray(signal).reshape(1, -1))
+        return result if isinstance(result, str) else result[0]
+
+    def predict_advanced_batch(self, signals):
         if not TF_AVAILABLE: return "TensorFlow required"
         if self.cnn_model is None:
             try: self.cnn_model = tf.keras.models.load_model(f'{self.model_dir}/cnn_model.h5')
             except: return "Model not trained"
             
-        # Normalize and Reshape
-        sig_cnn = signal.reshape((1, len(signal), 1))
-        prob = self.cnn_model.predict(sig_cnn)[0][0]
-        return "Disease" if prob > 0.5 else "Healthy"
+        # Reshape to (samples, timesteps, 1)
+        batch = np.asarray(signals, dtype=float)
+        probs = self.cnn_model.predict(batch.reshape((batch.shape[0], batch.shape[1], 1)), verbose=0)
+        return ["Disease" if prob[0] > 0.5 else "Healthy" for prob in probs]
 
     # --- Report Generation ---
     def compare_models(self):
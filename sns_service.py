@@ -1,5 +1,7 @@
 import os
 import logging
+from notification_outbox import NotificationOutbox
+import local_sns
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +21,11 @@ class SNSService:
         self.region = os.environ.get('AWS_REGION', 'us-east-1')
         
         # Check if AWS usage is intended (env vars present)
-        if BOTO3_AVAILABLE and 'AWS_ACCESS_KEY_ID' in os.environ:
+        if local_sns.is_enabled():
+            self.client = local_sns.get_client()
+            self.enabled = True
+            logger.info("ℹ️ Using the local SNS stand-in (MEDTRACK_SNS=local)")
+        elif BOTO3_AVAILABLE and 'AWS_ACCESS_KEY_ID' in os.environ:
             try:
                 self.client = boto3.client('sns', region_name=self.region)
                 self.enabled = True
@@ -29,44 +35,32 @@ class SNSService:
         else:
             logger.info("ℹ️ AWS SNS not configured (Missing Boto3 or Keys). Running in SIMULATION mode.")
 
+        # Delivery happens on a background worker (batched, retried); callers only enqueue
+        self.outbox = NotificationOutbox(lambda: self.client if self.enabled else None, channel='sns_service')
+
     def send_notification(self, message, subject="MedTrack Alert", phone_number=None, topic_arn=None):
         """
-        Sends a notification via AWS SNS.
+        Queues a notification for delivery via AWS SNS.
         If phone_number is provided, sends SMS.
         If topic_arn is provided, publishes to topic.
-        Otherwise, logs locally.
+        In SIMULATION mode the outbox worker logs it instead.
         """
-        
-        if not self.enabled:
-            # Simulation Mode
+        params = {'Message': message, 'Subject': subject}
+        if phone_number:
+            params['PhoneNumber'] = phone_number
+        elif topic_arn:
+            params['TopicArn'] = topic_arn
+        elif not self.enabled:
+            # Simulation Mode without a destination: just log it
             print(f"\n[SIMULATED SNS] Subject: {subject}")
-            print(f"[SIMULATED SNS] To: {phone_number or topic_arn or 'Log'}")
+            print(f"[SIMULATED SNS] To: Log")
             print(f"[SIMULATED SNS] Message: {message}\n")
             return {"status": "simulated", "id": "mock-id-123"}
-            
-        try:
-            if phone_number:
-                response = self.client.publish(
-                    PhoneNumber=phone_number,
-                    Message=message,
-                    Subject=subject
-                )
-            elif topic_arn:
-                response = self.client.publish(
-                    TopicArn=topic_arn,
-                    Message=message,
-                    Subject=subject
-                )
-            else:
-                logger.warning("No destination provided for notification")
-                return None
-                
-            logger.info(f"✅ Notification Sent: {response.get('MessageId')}")
-            return response
-            
-        except (ClientError, NoCredentialsError) as e:
-            logger.error(f"❌ AWS SNS Error: {e}")
-            return {"error": str(e)}
+
+        outbox_id = self.outbox.enqueue(**params)
+        if outbox_id is None:
+            return None
+        return {"status": "queued", "id": outbox_id}
 
 # Singleton
 sns_client = SNSService()
@@ -0,0 +1,182 @@
+"""
+Startup instrumentation: wall time per boot phase, a JSON report and budgets.
+
+Modules time their boot work with
+
+    with startup_profiler.phase('aws_clients'):
+        dynamodb = boto3.resource('dynamodb', ...)
+
+or close a phase that started at the previous mark with
+`startup_profiler.mark('imports')` (no re-indenting of import blocks).
+Phases nest; the report lists each with its start offset, total and self time.
+The app calls `finish('app')` once it is fully set up.
+
+    MEDTRACK_STARTUP_PROFILE=1              write a report for every process that boots
+    MEDTRACK_STARTUP_REPORT_DIR=/tmp/x      where reports go (<app>-<pid>.json)
+    MEDTRACK_STARTUP_BUDGET_MS=3000         budget for the whole boot
+    MEDTRACK_STARTUP_PHASE_BUDGETS=table_check=300,imports=1500
+    MEDTRACK_STARTUP_STRICT=1               fail the boot (StartupBudgetExceeded) when over budget
+
+Timing is always on (a few perf_counter calls); reports and budget checks
+only run when configured.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("MedTrack-Startup")
+
+_started = time.perf_counter()
+_started_at = time.time()
+_lock = threading.Lock()
+_phases = []  # dicts: name, start, end, depth
+_depth = 0
+_checkpoint = _started
+_finished = False
+
+
+class StartupBudgetExceeded(RuntimeError):
+    pass
+
+
+def is_enabled():
+    return os.environ.get('MEDTRACK_STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as phase `name` (nested phases become its children)."""
+    global _depth
+    with _lock:
+        depth = _depth
+        _depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with _lock:
+            _depth -= 1
+            _phases.append({'name': name, 'start': start, 'end': end, 'depth': depth})
+
+
+def mark(name):
+    """Records everything since the previous mark (or process start) as phase `name`."""
+    global _checkpoint
+    end = time.perf_counter()
+    with _lock:
+        start = _checkpoint
+        # Phases that finished inside this interval become its children
+        for record in _phases:
+            if record['start'] >= start and record['depth'] >= _depth:
+                record['depth'] += 1
+        _phases.append({'name': name, 'start': start, 'end': end, 'depth': _depth})
+        _checkpoint = end
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 2)
+
+
+def _process_age():
+    """Seconds between process start and now (Linux only), to include interpreter boot."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return time.time() - (boot_time + start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def report(app_name='app'):
+    """The boot timeline so far as a JSON-serialisable dict."""
+    now = time.perf_counter()
+    with _lock:
+        records = sorted(_phases, key=lambda r: (r['start'], r['depth']))
+    phases = []
+    for i, record in enumerate(records):
+        children = [r for r in records[i + 1:] if r['depth'] == record['depth'] + 1
+                    and r['start'] >= record['start'] and r['end'] <= record['end']]
+        duration = record['end'] - record['start']
+        phases.append({
+            'name': record['name'],
+            'depth': record['depth'],
+            'start_ms': _ms(record['start'] - _started),
+            'duration_ms': _ms(duration),
+            'self_ms': _ms(duration - sum(c['end'] - c['start'] for c in children))
+        })
+    process_age = _process_age()
+    result = {
+        'app': app_name,
+        'pid': os.getpid(),
+        'started_at': _started_at,
+        'python': sys.version.split()[0],
+        'argv': sys.argv,
+        'total_ms': _ms(now - _started),
+        'interpreter_ms': _ms(process_age - (now - _started)) if process_age is not None else None,
+        'modules_loaded': len(sys.modules),
+        'phases': phases
+    }
+    lazy_loader = sys.modules.get('lazy_loader')
+    if lazy_loader is not None:
+        result['lazy_imports_ms'] = {name: _ms(s) for name, s in lazy_loader.load_times.items()}
+    return result
+
+
+def _phase_budgets():
+    budgets = {}
+    for item in os.environ.get('MEDTRACK_STARTUP_PHASE_BUDGETS', '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            budgets[name.strip()] = float(value)
+    return budgets
+
+
+def check_budgets(result):
+    """Returns a list of human-readable budget violations for a report."""
+    violations = []
+    total_budget = os.environ.get('MEDTRACK_STARTUP_BUDGET_MS')
+    if total_budget and result['total_ms'] > float(total_budget):
+        violations.append(f"startup took {result['total_ms']:.0f} ms (budget {float(total_budget):.0f} ms)")
+    for name, budget in _phase_budgets().items():
+        spent = sum(p['duration_ms'] for p in result['phases'] if p['name'] == name)
+        if spent > budget:
+            violations.append(f"phase {name} took {spent:.0f} ms (budget {budget:.0f} ms)")
+    return violations
+
+
+def finish(app_name='app'):
+    """Called once boot is done: writes the report and enforces budgets, if configured."""
+    global _finished
+    if _finished:
+        return None
+    _finished = True
+    has_budgets = bool(os.environ.get('MEDTRACK_STARTUP_BUDGET_MS') or _phase_budgets())
+    if not (is_enabled() or has_budgets):
+        return None
+
+    result = report(app_name)
+    result['budget_violations'] = violations = check_budgets(result)
+    if is_enabled():
+        directory = os.environ.get('MEDTRACK_STARTUP_REPORT_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'medtrack_startup'))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{app_name}-{os.getpid()}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        top = ', '.join(f"{p['name']}={p['duration_ms']:.0f}ms" for p in result['phases'] if p['depth'] == 0)
+        logger.info(f"Startup {result['total_ms']:.0f} ms ({top}); report: {path}")
+
+    if violations:
+        message = "Startup budget exceeded: " + '; '.join(violations)
+        if os.environ.get('MEDTRACK_STARTUP_STRICT', '').lower() in ('1', 'true', 'yes'):
+            raise StartupBudgetExceeded(message)
+        logger.warning(message)
+    return result
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Everything the apps write at import time goes to a throwaway directory
+_DATA_DIR = tempfile.mkdtemp(prefix='medtrack-tests-')
+os.environ.update({
+    'MEDTRACK_STORAGE': 'local',
+    'MEDTRACK_SNS': 'local',
+    'MEDTRACK_ML_PRELOAD': 'off',
+    'MEDTRACK_LOCAL_DATA_DIR': _DATA_DIR,
+    'MEDTRACK_OUTBOX_PATH': os.path.join(_DATA_DIR, 'outbox.sqlite3'),
+    'MEDTRACK_VERSION_DIR': os.path.join(_DATA_DIR, 'versions'),
+    'MEDTRACK_METRICS_DIR': os.path.join(_DATA_DIR, 'metrics'),
+    'MEDTRACK_STARTUP_REPORT_DIR': os.path.join(_DATA_DIR, 'startup'),
+    'MEDTRACK_PROFILE_DIR': os.path.join(_DATA_DIR, 'profiles'),
+})
+
+
+@pytest.fixture
+def aws_setup():
+    """aws_setup on LocalStorage, with every table emptied."""
+    import aws_setup as module
+    from local_storage import LocalStorage
+    for value in vars(module).values():
+        if isinstance(value, LocalStorage):
+            value.data = []
+            value._save()
+    return module
@@ -0,0 +1,99 @@
+"""Dashboard counters in aws_setup (user-026): backfill, rebuild races, status transitions."""
+import copy
+
+
+def _add_patient(aws_setup, email):
+    aws_setup.patients_table.put_item(Item={'email': email, 'name': email, 'role': 'patient'})
+
+
+def _add_doctor(aws_setup, email, specialization='Cardiology'):
+    aws_setup.doctors_table.put_item(Item={'email': email, 'name': email, 'role': 'doctor',
+                                           'specialization': specialization})
+
+
+def _add_appointment(aws_setup, appt_id, status, doctor='doc@test'):
+    aws_setup.appointments_table.put_item(Item={
+        'appointment_id': appt_id, 'patient_email': 'pat@test', 'doctor_email': doctor,
+        'appointment_date': '2030-01-01T10:00', 'status': status, 'created_at': '2030-01-01T09:00'})
+
+
+def test_backfill_runs_when_an_increment_created_the_item(aws_setup):
+    for i in range(5):
+        _add_patient(aws_setup, f'old{i}@test')
+    _add_patient(aws_setup, 'new@test')
+    aws_setup.increment_metrics({'patients': 1})  # first write after deploy
+
+    assert aws_setup.get_admin_stats()['patients'] == 6
+    aws_setup.increment_metrics({'patients': 1})
+    assert aws_setup.get_admin_stats()['patients'] == 7  # no second rebuild
+
+
+def test_rebuild_rescans_when_an_increment_lands_during_the_scan(aws_setup, monkeypatch):
+    _add_patient(aws_setup, 'a@test')
+    scan = aws_setup._scan_metrics
+    calls = []
+
+    def racing_scan():
+        result = scan()
+        if not calls:
+            _add_patient(aws_setup, 'b@test')
+            aws_setup.increment_metrics({'patients': 1})
+        calls.append(result)
+        return result
+
+    monkeypatch.setattr(aws_setup, '_scan_metrics', racing_scan)
+    assert aws_setup.rebuild_metrics()['patients'] == 2
+    assert len(calls) == 2
+    assert aws_setup.get_admin_stats()['patients'] == 2
+
+
+def test_concurrent_advance_from_consulting_completes_once(aws_setup, monkeypatch):
+    _add_doctor(aws_setup, 'doc@test')
+    _add_appointment(aws_setup, 'A1', 'CONSULTING')
+    assert aws_setup.get_admin_stats()['dept_load'] == {'Cardiology': 1}
+
+    # Both requests read CONSULTING before either writes
+    stale = copy.deepcopy(aws_setup.appointments_table.get_item(Key={'appointment_id': 'A1'}))
+    get_item = aws_setup.appointments_table.get_item
+    monkeypatch.setattr(aws_setup.appointments_table, 'get_item',
+                        lambda Key, **kw: copy.deepcopy(stale) if Key == {'appointment_id': 'A1'}
+                        else get_item(Key=Key, **kw))
+
+    client = aws_setup.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(role='doctor', user_id='doc@test', user_name='Doc')
+    client.get('/advance_status/A1')
+    client.get('/advance_status/A1')
+
+    assert len(aws_setup.invoices_table.data) == 1
+    stats = aws_setup.get_admin_stats()
+    assert stats['dept_load'] == {}
+    assert stats['invoices'] == 1
+
+
+def test_update_appointment_status_moves_department_load(aws_setup):
+    _add_doctor(aws_setup, 'doc@test')
+    _add_appointment(aws_setup, 'A1', 'BOOKED')
+    assert aws_setup.get_admin_stats()['dept_load'] == {'Cardiology': 1}
+
+    assert aws_setup.update_appointment_status('A1', 'COMPLETED')
+    assert aws_setup.get_admin_stats()['dept_load'] == {}
+    assert aws_setup.update_appointment_status('A1', 'BOOKED')
+    assert aws_setup.get_admin_stats()['dept_load'] == {'Cardiology': 1}
+    assert not aws_setup.update_appointment_status('missing', 'COMPLETED')
+
+
+def test_repeated_transition_is_notified_but_a_resend_is_not(aws_setup):
+    _add_doctor(aws_setup, 'doc@test')
+    _add_appointment(aws_setup, 'A1', 'BOOKED')
+    stats = aws_setup.notification_outbox.stats
+    duplicates = stats['duplicates']
+
+    for status in ('COMPLETED', 'BOOKED', 'COMPLETED'):
+        assert aws_setup.update_appointment_status('A1', status)
+    assert stats['duplicates'] == duplicates
+
+    for _ in range(2):
+        aws_setup.notify_appointment_status_change('pat@test', 'CONSULTING', appointment_id='A1',
+                                                   changed_at='2030-01-01T10:30:00')
+    assert stats['duplicates'] == duplicates + 2  # topic and email copies of the resend
@@ -0,0 +1,47 @@
+"""bulk_import counter deltas (user-050): only new keys are counted."""
+import bulk_import
+
+
+def _doctors(specialization='Cardiology'):
+    return [{'email': f'doc{i}@test', 'password': 'pw', 'name': f'Dr {i}', 'specialization': specialization}
+            for i in range(2)]
+
+
+APPOINTMENT = {'appointment_id': 'APPT1', 'patient_email': 'p@test', 'doctor_email': 'doc0@test',
+               'appointment_date': '2030-01-01T10:00', 'status': 'BOOKED'}
+
+
+def test_reimporting_the_same_rows_leaves_counters_unchanged(aws_setup):
+    aws_setup.get_admin_stats()  # initialize the counters first
+    for _ in range(2):
+        bulk_import.import_rows('doctors', _doctors(), workers=1, overwrite=True)
+        bulk_import.import_rows('appointments', [dict(APPOINTMENT)])
+
+    stats = aws_setup.get_admin_stats()
+    assert (stats['doctors'], stats['appointments']) == (2, 1)
+    assert stats['dept_load'] == {'Cardiology': 1}
+    assert stats['departments'] == 1
+    assert aws_setup.rebuild_metrics()['doctors'] == 2
+
+
+def test_overwrite_moves_specialization_and_department_load(aws_setup):
+    aws_setup.get_admin_stats()
+    bulk_import.import_rows('doctors', _doctors('Cardiology'), workers=1)
+    bulk_import.import_rows('appointments', [dict(APPOINTMENT)])
+    bulk_import.import_rows('doctors', _doctors('Neurology'), workers=1, overwrite=True)
+    bulk_import.import_rows('appointments', [dict(APPOINTMENT, status='COMPLETED')])
+
+    item = aws_setup.metrics_table.get_item(Key=aws_setup.METRICS_KEY)['Item']
+    assert item.get('specialization:Cardiology') == 0
+    assert item.get('specialization:Neurology') == 2
+    assert aws_setup.get_admin_stats()['dept_load'] == {}
+
+
+def test_existing_and_repeated_rows_are_skipped_without_overwrite(aws_setup):
+    aws_setup.get_admin_stats()
+    rows = _doctors() + [_doctors()[0]]
+    counts = bulk_import.import_rows('doctors', rows, workers=1)
+    assert (counts['written'], counts['existing']) == (2, 1)
+    counts = bulk_import.import_rows('doctors', _doctors(), workers=1)
+    assert (counts['written'], counts['existing']) == (0, 2)
+    assert aws_setup.get_admin_stats()['doctors'] == 2
@@ -0,0 +1,19 @@
+"""Per-process cap on open chat streams (user-031)."""
+import chat_broker
+
+
+def test_streams_past_the_cap_get_503_until_a_slot_frees(aws_setup, monkeypatch):
+    monkeypatch.setattr(chat_broker, 'MAX_STREAMS', 1)
+    client = aws_setup.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(role='patient', user_id='pat@test', user_name='Pat')
+
+    first = client.get('/api/chat/stream?dept=Cardiology', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/api/chat/stream?dept=Cardiology', buffered=False).status_code == 503
+
+    first.close()  # a disconnect hands the slot back, even before any frame was sent
+    second = client.get('/api/chat/stream?dept=Cardiology', buffered=False)
+    assert second.status_code == 200
+    second.close()
+    assert chat_broker.broker._streams == 0
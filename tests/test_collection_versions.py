@@ -0,0 +1,49 @@
+"""ETags of polled endpoints (user-032)."""
+from flask import Flask, session
+
+import collection_versions
+from local_storage import LocalStorage
+
+
+def _table():
+    table = LocalStorage('medtrack_metrics')
+    table.data = []
+    return table
+
+
+def test_table_versions_see_bumps_from_every_host():
+    table = _table()
+    key = {'metric_id': 'versions'}
+    host_a = collection_versions.TableVersions(table, key)
+    host_b = collection_versions.TableVersions(table, key)
+    keys = [('chats', 'Cardiology')]
+
+    tag = host_b.etag(keys, 'poll')
+    assert host_a.etag(keys, 'poll') == tag
+    host_a.bump('chats', 'Cardiology')
+    assert host_b.etag(keys, 'poll') != tag
+    assert host_b.version('chats') == 1  # the collection-wide scope moves too
+
+    tag = host_b.etag(keys, 'poll')
+    host_a.bump('chats', 'Neurology')
+    assert host_b.etag(keys, 'poll') == tag
+
+
+def test_conditional_get_answers_304_until_a_bump():
+    versions = collection_versions.TableVersions(_table(), {'metric_id': 'versions'})
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    calls = []
+
+    @app.route('/poll')
+    @collection_versions.conditional_get(versions, lambda: [('mood', session.get('user_id'))])
+    def poll():
+        calls.append(1)
+        return {'items': []}
+
+    client = app.test_client()
+    etag = client.get('/poll').headers['ETag']
+    assert client.get('/poll', headers={'If-None-Match': etag}).status_code == 304
+    versions.bump('mood', None)
+    assert client.get('/poll', headers={'If-None-Match': etag}).status_code == 200
+    assert len(calls) == 2
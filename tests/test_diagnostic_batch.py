@@ -0,0 +1,48 @@
+"""Batched inference matches the per-sample path (user-044)."""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+pytest.importorskip('joblib')
+
+from image_diagnostic import ImageDiagnosticEngine
+from signal_diagnostic import SignalDiagnosticEngine
+
+
+@pytest.fixture
+def signals(tmp_path):
+    np.random.seed(7)
+    engine = SignalDiagnosticEngine(model_dir=str(tmp_path))
+    X, _ = engine.generate_synthetic_data(n_samples=20)
+    return engine, X
+
+
+def test_vectorised_features_match_the_per_signal_loop(signals):
+    engine, X = signals
+    # A shorter extra signal makes the input ragged, which takes the per-signal loop
+    ragged = list(X) + [X[0][:50]]
+
+    assert np.allclose(engine.extract_features(X), engine.extract_features(ragged)[:len(X)])
+    per_signal = [np.abs(np.fft.rfft(sig)) for sig in X]
+    assert all(np.allclose(row, per_signal[i]) for i, row in enumerate(engine.apply_fft(X)))
+    assert np.allclose(engine.extract_features(list(X)), engine.extract_features(X))
+
+
+def test_signal_batch_predictions_match_single_predictions(signals):
+    engine, X = signals
+    engine.train_simple_model()
+    engine.train_intermediate_model()
+
+    assert engine.predict_simple_batch(X) == [engine.predict_simple(sig) for sig in X]
+    assert engine.predict_intermediate_batch(X) == [engine.predict_intermediate(sig) for sig in X]
+
+
+def test_image_batch_predictions_match_single_predictions(tmp_path):
+    np.random.seed(7)
+    engine = ImageDiagnosticEngine(model_dir=str(tmp_path))
+    engine.train_knn()
+    engine.train_rf_with_pca()
+    images, _ = engine.generate_synthetic_data(n_samples=6)
+
+    assert engine.predict_knn_batch(images) == [engine.predict_knn(img) for img in images]
+    assert engine.predict_rf_batch(images) == [engine.predict_rf(img) for img in images]
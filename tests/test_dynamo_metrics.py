@@ -0,0 +1,53 @@
+"""database_dynamo dashboard counters (user-026), against moto's DynamoDB."""
+import os
+import importlib
+
+import pytest
+
+moto = pytest.importorskip('moto')
+
+
+@pytest.fixture
+def dynamo(monkeypatch):
+    for name, value in {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                        'AWS_SESSION_TOKEN': 'testing', 'AWS_REGION': 'ap-south-1',
+                        'AWS_DEFAULT_REGION': 'ap-south-1'}.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        import boto3
+        resource = boto3.resource('dynamodb', region_name='ap-south-1')
+        for name in ('AdminUser', 'DoctorUser', 'PatientUser'):
+            resource.create_table(TableName=name, BillingMode='PAY_PER_REQUEST',
+                                  KeySchema=[{'AttributeName': 'username', 'KeyType': 'HASH'}],
+                                  AttributeDefinitions=[{'AttributeName': 'username', 'AttributeType': 'S'}])
+        resource.create_table(TableName='Medtrack_data', BillingMode='PAY_PER_REQUEST',
+                              KeySchema=[{'AttributeName': 'PK', 'KeyType': 'HASH'},
+                                         {'AttributeName': 'SK', 'KeyType': 'RANGE'}],
+                              AttributeDefinitions=[{'AttributeName': 'PK', 'AttributeType': 'S'},
+                                                    {'AttributeName': 'SK', 'AttributeType': 'S'}])
+        import database_dynamo
+        module = importlib.reload(database_dynamo)
+        yield module
+
+
+def test_stats_backfill_existing_data_and_track_department_load(dynamo):
+    dynamo.doctor_table.put_item(Item={'username': 'd1', 'name': 'Dr One', 'department': 'Cardiology'})
+    dynamo.doctor_table.put_item(Item={'username': 'd2', 'name': 'Dr Two', 'department': 'Neurology'})
+    for i in range(3):
+        dynamo.patient_table.put_item(Item={'username': f'p{i}', 'name': f'P{i}'})
+    dynamo.data_table.put_item(Item={'PK': 'APPT#old', 'SK': 'META', 'id': 'old', 'patient_id': 'p0',
+                                     'doctor_id': 'd1', 'status': 'BOOKED'})
+    dynamo.data_table.put_item(Item={'PK': 'INV#old', 'SK': 'META', 'id': 'old', 'patient_id': 'p0',
+                                     'amount': 150, 'status': 'Paid'})
+    dynamo.add_record('p0', 'scan.pdf', 'ok')  # first write after deploy creates the item with ADD
+
+    stats = dynamo.get_admin_stats()
+    assert (stats['doctors'], stats['patients'], stats['departments']) == (2, 3, 2)
+    assert (stats['appointments'], stats['invoices'], stats['records'], stats['income']) == (1, 1, 1, 150)
+    assert stats['dept_load'] == {'Cardiology': 1}
+
+    appt = dynamo.create_appointment('p1', 'd2', '2030-01-01T10:00')
+    assert dynamo.get_admin_stats()['dept_load'] == {'Cardiology': 1, 'Neurology': 1}
+    for _ in range(3):
+        dynamo.advance_appointment_status(appt['id'])
+    assert dynamo.get_department_load() == {'Cardiology': 1}
@@ -0,0 +1,20 @@
+"""CSV export cells (user-049)."""
+import csv
+import io
+from decimal import Decimal
+
+import exporters
+
+
+def test_formula_cells_are_neutralised():
+    items = [{'name': '=HYPERLINK("http://x","y")', 'note': '+1', 'tag': '@cmd', 'sign': '-2+3',
+              'amount': Decimal('-12.5'), 'plain': 'ok'}]
+    fields = ['name', 'note', 'tag', 'sign', 'amount', 'plain']
+    text = ''.join(exporters.to_csv(items, fields))
+    header, row = list(csv.reader(io.StringIO(text)))
+    assert header == fields
+    assert row == ["'=HYPERLINK(\"http://x\",\"y\")", "'+1", "'@cmd", "'-2+3", '-12.5', 'ok']
+
+
+def test_jsonl_is_left_as_is():
+    assert ''.join(exporters.to_jsonl([{'name': '=1+1'}])) == '{"name": "=1+1"}\n'
@@ -0,0 +1,41 @@
+"""Paged list views in aws_setup keep their chronological order (user-047)."""
+import random
+
+
+def _walk(read_page, limit):
+    items, start_key = [], None
+    while True:
+        page, start_key = read_page(limit, start_key)
+        items.extend(page)
+        if not start_key:
+            return items
+
+
+def test_doctor_queue_and_vault_pages_are_newest_first(aws_setup):
+    days = list(range(1, 10))
+    random.Random(4).shuffle(days)  # key order and time order disagree
+    for day in days:
+        aws_setup.appointments_table.put_item(Item={
+            'appointment_id': f'A{random.Random(day).random()}', 'patient_email': 'pat@test',
+            'doctor_email': 'doc@test' if day % 3 else 'other@test', 'appointment_date': '2030-01-01T10:00',
+            'status': 'BOOKED', 'created_at': f'2030-01-{day:02d}T09:00:00'})
+        aws_setup.medical_vault_table.put_item(Item={
+            'vault_id': f'V{random.Random(day).random()}', 'patient_email': 'pat@test', 'file_name': f'{day}.pdf',
+            'file_type': 'Report', 'file_path': '', 'uploaded_at': f'2030-01-{day:02d}T09:00:00'})
+
+    queue = _walk(lambda n, k: aws_setup.get_doctor_appointments_page('doc@test', n, k, view='appointment_list'), 2)
+    assert [a['created_at'].day for a in queue] == [8, 7, 5, 4, 2, 1]
+    vault = _walk(lambda n, k: aws_setup.get_patient_vault_page('pat@test', n, k), 4)
+    assert [v['file_name'] for v in vault] == [f'{day}.pdf' for day in range(9, 0, -1)]
+
+
+def test_paged_scan_sees_writes_between_pages(aws_setup):
+    table = aws_setup.invoices_table
+    for i in (1, 3, 5):
+        table.put_item(Item={'invoice_id': f'I{i}', 'amount': i})
+    first = table.scan(Limit=2)
+    assert [item['invoice_id'] for item in first['Items']] == ['I1', 'I3']
+    table.put_item(Item={'invoice_id': 'I4', 'amount': 4})
+    rest = table.scan(Limit=2, ExclusiveStartKey=first['LastEvaluatedKey'])
+    assert [item['invoice_id'] for item in rest['Items']] == ['I4', 'I5']
+    assert 'LastEvaluatedKey' not in rest
@@ -0,0 +1,70 @@
+"""Folding exited workers' metrics files (user-040)."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _worker_file(directory, name, pid, requests):
+    (directory / name).write_text(json.dumps({
+        'pid': pid, 'written_at': 0, 'histograms': [],
+        'counters': [['medtrack_http_requests_total', [['endpoint', '/x']], requests]],
+        'gauges': [['medtrack_http_requests_in_flight', [], 3, 'sum']]}))
+
+
+def _requests(counters):
+    return counters.get(('medtrack_http_requests_total', (('endpoint', '/x'),)), 0)
+
+
+def test_exited_workers_are_folded_into_the_archive(metrics_dir):
+    pid = _exited_pid()
+    # Two processes that got the same pid, one after the other
+    _worker_file(metrics_dir, f'worker-{pid}-aaaa.json', pid, 5)
+    _worker_file(metrics_dir, f'worker-{pid}-bbbb.json', pid, 7)
+
+    counters, _, gauges = metrics.collect()
+    assert _requests(counters) == 12
+    assert gauges[('medtrack_http_requests_in_flight', ())] == 0  # only this process' own
+    own = os.path.basename(metrics._snapshot_path())
+    assert sorted(os.listdir(metrics_dir)) == sorted(['archive.json', 'archive.lock', own])
+
+    pid = _exited_pid()
+    _worker_file(metrics_dir, f'worker-{pid}-cccc.json', pid, 1)
+    assert _requests(metrics.collect()[0]) == 13  # folded totals are counted exactly once
+    assert sorted(os.listdir(metrics_dir)) == sorted(['archive.json', 'archive.lock', own])
+
+
+def test_a_file_that_could_not_be_deleted_is_not_counted_twice(metrics_dir, monkeypatch):
+    pid = _exited_pid()
+    _worker_file(metrics_dir, f'worker-{pid}-aaaa.json', pid, 5)
+    monkeypatch.setattr(os, 'remove', lambda path: (_ for _ in ()).throw(OSError('busy')))
+    assert _requests(metrics.collect()[0]) == 5
+    assert _requests(metrics.collect()[0]) == 5
+
+
+def test_exited_threads_are_folded_into_the_process_totals(metrics_dir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    before = _requests(metrics.collect()[0])
+    for _ in range(5):
+        with ThreadPoolExecutor(max_workers=4) as pool:  # a new pool per call, as parallel_scan does
+            list(pool.map(lambda _: metrics.inc('medtrack_http_requests_total', endpoint='/x'), range(8)))
+    assert _requests(metrics.collect()[0]) == before + 40
+    assert all(thread.is_alive() for thread, _ in metrics._threads)
+    assert _requests(metrics.collect()[0]) == before + 40
@@ -0,0 +1,93 @@
+"""Outbox coalescing and idempotency (user-036)."""
+import sqlite3
+
+import pytest
+
+import notification_outbox
+
+PHONE = {'PhoneNumber': '+15550000000'}
+
+
+class FailingClient:
+    def publish(self, **params):
+        raise RuntimeError('InvalidParameter')
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    made = []
+
+    def make(client_factory=lambda: None):
+        made.append(notification_outbox.NotificationOutbox(client_factory, path=str(tmp_path / 'outbox.sqlite3')))
+        return made[-1]
+
+    yield make
+    for box in made:
+        box.stop()
+
+
+def _rows(box, sql, *args):
+    conn = sqlite3.connect(box.path)
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+
+def _age(box, table, seconds=notification_outbox.IDEMPOTENCY_RETENTION_SECONDS + 1):
+    conn = sqlite3.connect(box.path)
+    try:
+        conn.execute(f"UPDATE {table} SET created_at = created_at - ?", (seconds,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_retry_of_a_coalesced_key_does_not_overwrite_newer_state(outbox):
+    box = outbox()
+    first = box.enqueue(coalesce_key='A1', idempotency_key='A1:CONFIRMED', coalesce_window=60,
+                        Message='CONFIRMED', **PHONE)
+    second = box.enqueue(coalesce_key='A1', idempotency_key='A1:CONSULTING', coalesce_window=60,
+                         Message='CONSULTING', **PHONE)
+    retry = box.enqueue(coalesce_key='A1', idempotency_key='A1:CONFIRMED', coalesce_window=60,
+                        Message='CONFIRMED', **PHONE)
+
+    assert first == second == retry
+    assert box.stats['coalesced'] == 1 and box.stats['duplicates'] == 1
+    [(params,)] = _rows(box, "SELECT params FROM outbox")
+    assert '"CONSULTING"' in params
+
+
+def test_delivered_key_blocks_repeats_until_retention(outbox):
+    box = outbox()
+    box.enqueue(idempotency_key='invoice:1', Message='paid', **PHONE)
+    assert box.flush()
+    assert _rows(box, "SELECT COUNT(*) FROM outbox") == [(0,)]  # sent rows are not kept
+
+    box.enqueue(idempotency_key='invoice:1', Message='paid', **PHONE)
+    assert box.stats['duplicates'] == 1 and not box.pending_count()
+
+    _age(box, 'outbox_keys')
+    box.enqueue(Message='unrelated', **PHONE)  # the next delivery pass applies retention
+    assert box.flush()
+    box.enqueue(idempotency_key='invoice:1', Message='paid', **PHONE)
+    assert box.stats['duplicates'] == 1
+    assert box.flush() and box.stats['sent'] == 3
+
+
+def test_dead_rows_are_purged_after_retention(outbox, monkeypatch):
+    monkeypatch.setattr(notification_outbox, 'MAX_ATTEMPTS', 1)
+    box = outbox(FailingClient)
+    box.enqueue(idempotency_key='sms:1', Message='one', **PHONE)
+    assert box.flush()
+    assert _rows(box, "SELECT status FROM outbox") == [('dead',)]
+    box.enqueue(idempotency_key='sms:1', Message='one', **PHONE)
+    assert box.stats['duplicates'] == 1
+
+    _age(box, 'outbox')
+    _age(box, 'outbox_keys')
+    box.enqueue(idempotency_key='sms:2', Message='two', **PHONE)
+    assert box.flush()
+    [(params,)] = _rows(box, "SELECT params FROM outbox WHERE status = 'dead'")
+    assert '"two"' in params
+    assert _rows(box, "SELECT idempotency_key FROM outbox_keys") == [('sms:2',)]
@@ -0,0 +1,59 @@
+"""Cursor pagination of the in-memory store (user-047)."""
+import pagination
+
+
+def _walk(read_page, limit):
+    """Every item, following encoded cursors the way the list views do."""
+    items, cursor = [], None
+    while True:
+        page, next_key = read_page(limit, pagination.decode_cursor(cursor))
+        items.extend(page)
+        cursor = pagination.encode_cursor(next_key)
+        if not cursor:
+            return items
+
+
+def test_cursor_round_trip_visits_every_key_once():
+    keys = [f"appt_{i:08d}" for i in range(1, 11)]
+    for limit in (1, 3, 5, 10, 25):
+        assert _walk(lambda n, start: pagination.paginate(keys, n, start), limit) == keys
+
+
+def test_deleted_cursor_item_resumes_at_the_next_key():
+    keys = ['appt_00000001', 'appt_00000002', 'appt_00000004', 'appt_00000005']
+    page, next_key = pagination.paginate(keys, 2, {'id': 'appt_00000003'})
+    assert page == ['appt_00000004', 'appt_00000005'] and next_key is None
+
+
+def test_database_pages_round_trip():
+    import database
+
+    created = [database.create_appointment('patient@example.com', 'd1' if i % 2 else 'd2', '2030-01-01T10:00')['id']
+               for i in range(7)]
+    for i in range(5):
+        database.add_record('patient@example.com', f'scan{i}.png', 'ok')
+
+    assert [a['id'] for a in _walk(database.get_appointments_page, 3)][-7:] == created
+    assert [a['id'] for a in _walk(lambda n, s: database.get_appointments_by_doctor_page('d1', n, s), 2)] == \
+        [a['id'] for a in database.get_appointments_by_doctor('d1')]
+    assert [i['id'] for i in _walk(database.get_invoices_page, 4)] == database.invoice_ids
+    records = _walk(database.get_records_page, 2)
+    assert [r['id'] for r in records] == database.record_ids
+    assert {r['patient_id'] for r in records} == {'patient@example.com'}
+    assert _walk(lambda n, s: database.get_patient_records_page('patient@example.com', n, s), 3) == \
+        database.get_patient_records('patient@example.com')
+    assert [p['email'] for p in _walk(database.get_patients_page, 1)] == database.patient_emails
+
+
+def test_per_patient_indexes_stay_in_id_order(monkeypatch):
+    import database
+
+    # The second booking wins the lock with the ids allocated first
+    appt1, inv1, appt2, inv2 = (database.next_prefixed_id(p) for p in ('appt', 'inv', 'appt', 'inv'))
+    ids = iter([appt2, inv2, appt1, inv1])
+    monkeypatch.setattr(database, 'next_prefixed_id', lambda prefix: next(ids))
+    for _ in range(2):
+        database.create_appointment('late@example.com', 'd1', '2030-01-01T10:00')
+
+    assert [a['id'] for a in database.get_appointments_by_patient('late@example.com')] == [appt1, appt2]
+    assert [i['id'] for i in database.get_patient_invoices('late@example.com')] == [inv1, inv2]
@@ -0,0 +1,44 @@
+"""SNS email subscriptions stay out of request handlers (user-033, user-034)."""
+import pytest
+
+
+class RecordingSNS:
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, **params):
+        self.calls.append(('subscribe', params['Endpoint']))
+        return {'SubscriptionArn': 'pending confirmation'}
+
+    def list_subscriptions_by_topic(self, **params):
+        self.calls.append(('list', None))
+        return {'Subscriptions': [{'Protocol': 'email', 'Endpoint': 'known@test'}]}
+
+
+@pytest.fixture
+def sns(aws_setup, monkeypatch):
+    client = RecordingSNS()
+    monkeypatch.setattr(aws_setup, 'sns_client', client)
+    monkeypatch.setattr(aws_setup, '_subscriptions_loaded', False)
+    monkeypatch.setattr(aws_setup, '_subscribed_emails', set())
+    return client
+
+
+def test_signup_makes_no_sns_call(aws_setup, sns):
+    aws_setup.load_subscription_registry()
+    assert aws_setup.create_patient('new@test', 'secret', 'New', '', '', '', 'O+')
+    # (Earlier tests' outbox worker may still subscribe its own recipients)
+    assert ('subscribe', 'new@test') not in sns.calls
+
+    # The outbox hook subscribes the address before its first email
+    aws_setup._before_email_send({'MessageAttributes': {'email': {'StringValue': 'new@test'}}})
+    assert sns.calls.count(('subscribe', 'new@test')) == 1
+
+
+def test_registry_is_loaded_at_boot_not_on_first_send(aws_setup, sns):
+    aws_setup.preload_subscription_registry().join(timeout=10)
+    assert sns.calls.count(('list', None)) == 1
+
+    assert aws_setup.ensure_email_subscribed('known@test')
+    assert sns.calls.count(('list', None)) == 1  # already known: no second listing
+    assert ('subscribe', 'known@test') not in sns.calls
@@ -0,0 +1,222 @@
+"""
+Lightweight tracing spans and a slow-operation log.
+
+A trace is opened per Flask request (and per outbox delivery); spans nest
+under it:
+
+    with tracing.span('template', name='patient/dashboard.html'):
+        ...
+
+    @tracing.traced('model.predict', model='image')
+    def predict_image(...): ...
+
+Table and SNS calls become spans through request_accounting's listener
+hook, templates through Flask's rendering signals. When a trace runs longer
+than MEDTRACK_SLOW_TRACE_MS (default 1000), it is written as one JSON line
+with every span's parent, start offset and duration. The line goes to
+MEDTRACK_SLOW_LOG (a file path), or to the "MedTrack-SlowLog" logger when
+that is unset. Outside a trace, span() costs one thread-local lookup.
+MEDTRACK_TRACING=off disables tracing entirely.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+logger = logging.getLogger("MedTrack-SlowLog")
+
+SLOW_TRACE_MS = float(os.environ.get('MEDTRACK_SLOW_TRACE_MS', 1000))
+SLOW_LOG_PATH = os.environ.get('MEDTRACK_SLOW_LOG')
+MAX_SPANS = 500  # per trace; an N+1 loop should not balloon memory
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def is_enabled():
+    return os.environ.get('MEDTRACK_TRACING', '').lower() != 'off'
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self.stack = [self._add(name, self.started, attrs, None)]
+
+    def _add(self, name, start, attrs, parent):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        record = {'id': len(self.spans), 'parent': parent, 'name': name, 'start': start, 'end': None}
+        if attrs:
+            record['attrs'] = attrs
+        self.spans.append(record)
+        return record
+
+    def open(self, name, attrs):
+        parent = self.stack[-1]
+        record = self._add(name, time.perf_counter(), attrs, parent['id'] if parent else None)
+        self.stack.append(record)
+        return record
+
+    def close(self, record, **attrs):
+        if record is not None:
+            record['end'] = time.perf_counter()
+            if attrs:
+                record.setdefault('attrs', {}).update(attrs)
+        if len(self.stack) > 1:
+            self.stack.pop()
+
+    def completed(self, name, seconds, attrs):
+        """Adds a span that just finished and took `seconds` (e.g. from a call hook)."""
+        parent = self.stack[-1]
+        end = time.perf_counter()
+        record = self._add(name, end - seconds, attrs, parent['id'] if parent else None)
+        if record is not None:
+            record['end'] = end
+
+    def as_dict(self):
+        root = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'name': root['name'],
+            'started_at': self.started_at,
+            'duration_ms': round((root['end'] - root['start']) * 1000, 2),
+            'attrs': root.get('attrs', {}),
+            'dropped_spans': self.dropped,
+            'spans': [dict({'id': s['id'], 'parent': s['parent'], 'name': s['name'],
+                            'start_ms': round((s['start'] - self.started) * 1000, 2),
+                            'duration_ms': round(((s['end'] or s['start']) - s['start']) * 1000, 2)},
+                           **s.get('attrs', {}))
+                      for s in self.spans[1:]]
+        }
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def start_trace(name, **attrs):
+    if not is_enabled():
+        return None
+    _local.trace = Trace(name, attrs)
+    return _local.trace
+
+
+def finish_trace(**attrs):
+    """Closes the current trace; writes it to the slow log if it went over the threshold."""
+    trace = current()
+    _local.trace = None
+    if trace is None:
+        return None
+    trace.close(trace.spans[0], **attrs)
+    if (trace.spans[0]['end'] - trace.started) * 1000 >= SLOW_TRACE_MS:
+        _emit(trace.as_dict())
+    return trace
+
+
+@contextmanager
+def trace(name, **attrs):
+    """A whole trace for work outside a request (e.g. an outbox delivery)."""
+    start_trace(name, **attrs)
+    try:
+        yield
+    finally:
+        finish_trace()
+
+
+@contextmanager
+def span(name, **attrs):
+    trace = current()
+    if trace is None:
+        yield None
+        return
+    record = trace.open(name, attrs)
+    try:
+        yield record
+    finally:
+        trace.close(record)
+
+
+def traced(name, **attrs):
+    """Decorator form of span()."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return f(*args, **kwargs)
+            with span(name, **attrs):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_call(service, operation, target, seconds):
+    """request_accounting listener: every backend call becomes a completed span."""
+    trace = current()
+    if trace is not None:
+        trace.completed(f"{service}.{operation}", seconds, {'table': target} if target else None)
+
+
+def _emit(record):
+    line = json.dumps(record, default=str)
+    if not SLOW_LOG_PATH:
+        logger.warning(line)
+        return
+    with _write_lock:
+        with open(SLOW_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+# --- Flask ---
+
+def init_app(app):
+    """Traces every request of `app` (request, template and backend spans)."""
+    if not is_enabled():
+        return
+    from flask import request
+    import request_accounting
+
+    if record_call not in request_accounting.listeners:
+        request_accounting.listeners.append(record_call)
+
+    @app.before_request
+    def _start_request_trace():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        start_trace(f"{request.method} {rule}", endpoint=request.endpoint, path=request.path)
+
+    @app.after_request
+    def _tag_request_trace(response):
+        trace = current()
+        if trace is not None:
+            trace.spans[0].setdefault('attrs', {})['status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_trace(exc=None):
+        finish_trace(**({'error': repr(exc)} if exc else {}))
+
+    try:
+        from flask import before_render_template, template_rendered
+    except ImportError:
+        return
+
+    def _template_started(sender, template, context, **extra):
+        trace = current()
+        if trace is not None:
+            trace.open('template', {'template': template.name})
+
+    def _template_finished(sender, template, context, **extra):
+        trace = current()
+        if trace is not None and len(trace.stack) > 1:
+            trace.close(trace.stack[-1])
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)